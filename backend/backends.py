@@ -0,0 +1,127 @@
+import asyncio
+import logging
+import os
+import sys
+import tempfile
+from typing import Callable, Dict, List, Optional
+
+from interpreter_pool import InterpreterPool, worker_env
+from workspace import Workspace
+
+logger = logging.getLogger(__name__)
+
+EXECUTION_BACKEND = os.getenv("EXECUTION_BACKEND", "local")
+
+
+class ExecutionBackend:
+    """Where child interpreters come from.
+
+    ``acquire`` returns an ``asyncio.subprocess.Process``-like object with
+    ``stdin``/``stdout``/``stderr`` streams, ``pid``, ``returncode``,
+    ``wait()``, ``terminate()`` and ``kill()``, already running the given
+    code. ``bytecode``, when given, is the code already compiled by this
+    server and marshalled; backends may use it to skip parsing. With a
+    ``workspace``, ``code`` is its entry point and the program runs in the
+    project folder. ``release`` is called once the run is over, whether it
+    exited or was stopped.
+    """
+
+    name = "base"
+    # Whether pid refers to the interpreter itself, so /proc sampling is meaningful
+    samples_locally = True
+    # Whether project files travel with each job rather than being read from the workspace folder
+    inline_files = False
+
+    def start(self):
+        pass
+
+    def interpreter(self) -> str:
+        # Identifies the Python that runs the code, for caching results
+        return f"{sys.executable} {sys.version}"
+
+    async def acquire(self, code: str, argv: List[str], bytecode: Optional[bytes] = None,
+                      workspace: Optional[Workspace] = None):
+        raise NotImplementedError
+
+    async def release(self, process):
+        pass
+
+    async def close(self):
+        pass
+
+    def stats(self) -> Dict:
+        return {"backend": self.name}
+
+
+class LocalBackend(ExecutionBackend):
+    """Runs code in interpreters on this host, from the pool when enabled."""
+
+    name = "local"
+
+    def __init__(self, pool: InterpreterPool, preexec_fn: Optional[Callable[[], None]] = None):
+        self.pool = pool
+        self.preexec_fn = preexec_fn
+        self._temp_files: Dict[int, str] = {}
+
+    def start(self):
+        self.pool.start()
+
+    async def acquire(self, code: str, argv: List[str], bytecode: Optional[bytes] = None,
+                      workspace: Optional[Workspace] = None):
+        if self.pool.enabled:
+            # Hand the code to a pre-warmed interpreter over its stdin
+            return await self.pool.acquire(code, argv, bytecode, workspace)
+        if workspace is not None:
+            return await self.spawn_project(workspace, argv)
+        return await self.spawn_process(code, argv)
+
+    async def spawn_project(self, workspace: Workspace, argv: List[str]):
+        # The files are already in the workspace, so no temporary file is needed
+        return await asyncio.create_subprocess_exec(
+            sys.executable, "-u", workspace.entry, *argv,
+            stdin=asyncio.subprocess.PIPE,
+            stdout=asyncio.subprocess.PIPE,
+            stderr=asyncio.subprocess.PIPE,
+            cwd=workspace.path,
+            env=worker_env(),
+            preexec_fn=self.preexec_fn
+        )
+
+    async def spawn_process(self, code: str, argv: List[str]):
+        # Create a temporary file to store the code
+        with tempfile.NamedTemporaryFile(mode='w', suffix='.py', delete=False, encoding='utf-8') as f:
+            f.write(code)
+            temp_file = f.name
+
+        # Prepare the command
+        cmd = [sys.executable, "-u", temp_file]  # Add -u for unbuffered output
+        cmd.extend(argv)
+
+        # Pipes are owned by the event loop so reads never block other sessions
+        process = await asyncio.create_subprocess_exec(
+            *cmd,
+            stdin=asyncio.subprocess.PIPE,
+            stdout=asyncio.subprocess.PIPE,
+            stderr=asyncio.subprocess.PIPE,
+            env=worker_env(),
+            preexec_fn=self.preexec_fn
+        )
+        self._temp_files[process.pid] = temp_file
+        return process
+
+    async def release(self, process):
+        # Clean up temporary file
+        temp_file = self._temp_files.pop(process.pid, None)
+        if temp_file and os.path.exists(temp_file):
+            try:
+                os.unlink(temp_file)
+            except Exception as e:
+                logger.error(f"Error removing temp file: {str(e)}")
+
+    async def close(self):
+        await self.pool.close()
+
+    def stats(self) -> Dict:
+        stats = {"backend": self.name}
+        stats.update(self.pool.stats())
+        return stats
@@ -0,0 +1,65 @@
+"""Container backend pool utilisation and spawn latency.
+
+Runs bursts of short programs through ContainerBackend. By default it talks
+to the fake docker stand-in; pass --docker docker to measure a real daemon.
+
+    python -m benchmarks.bench_container --concurrency 4 --rounds 5
+"""
+import argparse
+import asyncio
+import os
+import sys
+import time
+
+import main
+from container_backend import ContainerBackend
+from benchmarks.bench_streaming import RecordingWebSocket, percentile
+
+FAKE_DOCKER = f"{sys.executable} {os.path.join(os.path.dirname(os.path.abspath(__file__)), 'fake_docker.py')}"
+
+
+async def run_once():
+    websocket = RecordingWebSocket()
+    manager = main.ProcessManager(websocket)
+    started = time.perf_counter()
+    await manager.start_process('print("hello")\n')
+    await websocket.exited.wait()
+    await manager.cleanup()
+    return (websocket.first_byte_at - started) * 1000
+
+
+async def run(concurrency: int, rounds: int, docker: str, image: str):
+    backend = ContainerBackend(main.run_limits, size=concurrency, image=image, docker_cmd=docker)
+    main.execution_backend = backend
+    backend.start()
+    latencies = []
+    peak_utilization = 0.0
+    for _ in range(rounds):
+        while backend.stats()["idle"] < backend.size:
+            await asyncio.sleep(0.05)
+        tasks = [asyncio.ensure_future(run_once()) for _ in range(concurrency)]
+        while not all(task.done() for task in tasks):
+            peak_utilization = max(peak_utilization, backend.stats()["utilization"])
+            await asyncio.sleep(0.005)
+        latencies.extend(task.result() for task in tasks)
+    stats = backend.stats()
+    await backend.close()
+
+    print(f"container backend via {docker!r}, concurrency={concurrency} rounds={rounds}")
+    print(f"time to first output: p50 {percentile(latencies, 50):.1f} ms, p99 {percentile(latencies, 99):.1f} ms")
+    print(f"container spawn latency: avg {stats['spawn_latency']['avg'] * 1000:.1f} ms, "
+          f"p95 {stats['spawn_latency']['p95'] * 1000:.1f} ms")
+    print(f"acquire latency: avg {stats['acquire_latency']['avg'] * 1000:.1f} ms, "
+          f"p95 {stats['acquire_latency']['p95'] * 1000:.1f} ms")
+    print(f"pool hits={stats['hits']} misses={stats['misses']} failures={stats['failures']} "
+          f"peak utilization={peak_utilization:.0%}")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--concurrency", type=int, default=4)
+    parser.add_argument("--rounds", type=int, default=5)
+    parser.add_argument("--docker", default=FAKE_DOCKER)
+    parser.add_argument("--image", default="python:3.9-slim")
+    args = parser.parse_args()
+    asyncio.run(run(args.concurrency, args.rounds, args.docker, args.image))
@@ -0,0 +1,63 @@
+"""Cold spawn versus pre-warmed interpreter pool under concurrency.
+
+Run from the backend directory:
+
+    python -m benchmarks.bench_pool --concurrency 8 --rounds 5
+"""
+import argparse
+import asyncio
+import statistics
+import time
+
+import main
+from backends import LocalBackend
+from interpreter_pool import InterpreterPool
+from benchmarks.bench_streaming import RecordingWebSocket, percentile
+
+HELLO = 'print("hello")\n'
+
+
+async def run_once():
+    websocket = RecordingWebSocket()
+    manager = main.ProcessManager(websocket)
+    started = time.perf_counter()
+    await manager.start_process(HELLO)
+    await websocket.exited.wait()
+    await manager.cleanup()
+    return (websocket.first_byte_at - started) * 1000
+
+
+async def measure(pool: InterpreterPool, concurrency: int, rounds: int):
+    main.execution_backend = LocalBackend(pool, preexec_fn=main.run_limits.preexec_fn())
+    pool.start()
+    latencies = []
+    for _ in range(rounds):
+        # Give the pool a chance to refill between bursts
+        while pool.enabled and pool.stats()["idle"] < pool.size:
+            await asyncio.sleep(0.01)
+        latencies.extend(await asyncio.gather(*(run_once() for _ in range(concurrency))))
+    stats = pool.stats()
+    await pool.close()
+    return latencies, stats
+
+
+def report(label, latencies):
+    print(f"{label:>7}: p50 {percentile(latencies, 50):7.1f} ms  "
+          f"p99 {percentile(latencies, 99):7.1f} ms  mean {statistics.mean(latencies):7.1f} ms")
+
+
+async def run(concurrency: int, rounds: int):
+    cold, _ = await measure(InterpreterPool(size=0), concurrency, rounds)
+    pooled, stats = await measure(InterpreterPool(size=concurrency, refill_rate=1000), concurrency, rounds)
+    print(f"time to first output, concurrency={concurrency} rounds={rounds}")
+    report("cold", cold)
+    report("pooled", pooled)
+    print(f"pool hits={stats['hits']} misses={stats['misses']} spawned={stats['spawned']}")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--concurrency", type=int, default=8)
+    parser.add_argument("--rounds", type=int, default=5)
+    args = parser.parse_args()
+    asyncio.run(run(args.concurrency, args.rounds))
@@ -0,0 +1,90 @@
+"""Throughput and first-byte latency of ProcessManager output streaming.
+
+Run from the backend directory:
+
+    python -m benchmarks.bench_streaming --sessions 8 --lines 20000
+"""
+import argparse
+import asyncio
+import statistics
+import time
+
+import main as app
+from main import ProcessManager
+
+PRINT_HEAVY = """
+import sys
+line = "x" * {width}
+for i in range({lines}):
+    print(i, line)
+print("done", file=sys.stderr)
+"""
+
+
+class RecordingWebSocket:
+    # Minimal stand-in for a WebSocket that timestamps every frame
+
+    def __init__(self):
+        self.frames = 0
+        self.bytes = 0
+        self.first_byte_at = None
+        self.exited = asyncio.Event()
+
+    async def send_text(self, data: str):
+        if "** Process exited" in data:
+            self.exited.set()
+            return
+        if data and self.first_byte_at is None:
+            self.first_byte_at = time.perf_counter()
+        self.frames += 1
+        self.bytes += len(data.encode("utf-8"))
+
+
+async def run_session(code: str):
+    websocket = RecordingWebSocket()
+    manager = ProcessManager(websocket)
+    started = time.perf_counter()
+    await manager.start_process(code)
+    await websocket.exited.wait()
+    finished = time.perf_counter()
+    await manager.cleanup()
+    return {
+        "first_byte": websocket.first_byte_at - started if websocket.first_byte_at else float("nan"),
+        "duration": finished - started,
+        "bytes": websocket.bytes,
+        "frames": websocket.frames,
+    }
+
+
+def percentile(values, pct):
+    values = sorted(values)
+    index = min(len(values) - 1, int(round(pct / 100 * (len(values) - 1))))
+    return values[index]
+
+
+async def main(sessions: int, lines: int, width: int, rounds: int):
+    code = PRINT_HEAVY.format(lines=lines, width=width)
+    # The default workload is larger than RUN_OUTPUT_BYTES; measure whole runs
+    app.run_limits.output_bytes = 0
+    results = []
+    for _ in range(rounds):
+        results.extend(await asyncio.gather(*(run_session(code) for _ in range(sessions))))
+
+    throughput = [r["bytes"] / r["duration"] / 1e6 for r in results]
+    first_bytes = [r["first_byte"] * 1000 for r in results]
+    print(f"sessions={sessions} rounds={rounds} lines={lines} width={width}")
+    print(f"throughput per session: mean {statistics.mean(throughput):.2f} MB/s, "
+          f"min {min(throughput):.2f} MB/s")
+    print(f"first-byte latency: p50 {percentile(first_bytes, 50):.1f} ms, "
+          f"p99 {percentile(first_bytes, 99):.1f} ms")
+    print(f"frames per session: mean {statistics.mean(r['frames'] for r in results):.0f}")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--sessions", type=int, default=8)
+    parser.add_argument("--lines", type=int, default=20000)
+    parser.add_argument("--width", type=int, default=60)
+    parser.add_argument("--rounds", type=int, default=3)
+    args = parser.parse_args()
+    asyncio.run(main(args.sessions, args.lines, args.width, args.rounds))
@@ -0,0 +1,71 @@
+"""Stand-in for the docker CLI, for exercising ContainerBackend without a daemon.
+
+Containers are not isolated: ``exec`` runs the command directly on this
+host, and ``python`` maps to the current interpreter. ``kill`` ends the
+commands exec'd in a container; other lifecycle commands only print what
+the real CLI prints. Set FAKE_DOCKER_CREATE_DELAY to a number of seconds
+to mimic container creation cost.
+
+    CONTAINER_DOCKER_CMD="python benchmarks/fake_docker.py" EXECUTION_BACKEND=container uvicorn main:app
+"""
+import os
+import signal
+import sys
+import tempfile
+import time
+import uuid
+
+
+def pid_file(container_id):
+    return os.path.join(tempfile.gettempdir(), f"fake-docker-{container_id}.pid")
+
+
+def exec_pids(container_id):
+    try:
+        with open(pid_file(container_id)) as f:
+            pids = [int(line) for line in f if line.strip()]
+        os.unlink(pid_file(container_id))
+    except OSError:
+        return []
+    return pids
+
+
+def main(argv):
+    command, args = argv[0], argv[1:]
+    if command == "create":
+        time.sleep(float(os.getenv("FAKE_DOCKER_CREATE_DELAY", 0)))
+        print(uuid.uuid4().hex)
+    elif command in ("start", "pause", "unpause", "rm", "kill"):
+        for arg in args:
+            if not arg.startswith("-"):
+                if command == "kill":
+                    for pid in exec_pids(arg):
+                        try:
+                            os.kill(pid, getattr(signal, "SIGKILL", signal.SIGTERM))
+                        except OSError:
+                            pass
+                elif command == "rm":
+                    exec_pids(arg)
+                print(arg)
+    elif command == "exec":
+        env = os.environ.copy()
+        while args and args[0].startswith("-"):
+            flag = args.pop(0)
+            if flag == "-e":
+                name, _, value = args.pop(0).partition("=")
+                env[name] = value
+        container_id, cmd = args[0], args[1:]
+        # exec keeps this process id, so kill can find the command later
+        with open(pid_file(container_id), "a") as f:
+            f.write(f"{os.getpid()}\n")
+        if cmd and cmd[0] in ("python", "python3"):
+            cmd[0] = sys.executable
+        os.execvpe(cmd[0], cmd, env)
+    else:
+        print(f"fake docker: unsupported command {command!r}", file=sys.stderr)
+        return 1
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main(sys.argv[1:]))
@@ -0,0 +1,479 @@
+"""Load test for /ws/terminal with many simulated students.
+
+Starts the app under uvicorn on a free local port (or targets ``--url``) and
+drives WebSocket clients that each run one program from a weighted mix:
+
+    print   print-heavy output
+    cpu     a CPU-bound loop with a little output
+    input   the two-number prompt from temp_code.py, answered by the client
+    loop    an infinite loop, stopped by the server's wall-clock limit
+
+Run from the backend directory:
+
+    python -m benchmarks.load_test --clients 200 --mix print=4,cpu=2,input=3,loop=1
+    python -m benchmarks.load_test --clients 200 --save default
+    python -m benchmarks.load_test --clients 200 --compare default
+
+``--save`` writes the report to benchmarks/baselines/<name>.json and
+``--compare`` reports changes against one, exiting non-zero on regressions.
+"""
+import argparse
+import asyncio
+import json
+import os
+import platform
+import random
+import re
+import socket
+import statistics
+import subprocess
+import sys
+import time
+import urllib.request
+import uuid
+from typing import Dict, List, Optional
+
+import websockets
+
+BACKEND_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+BASELINE_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), "baselines")
+
+EXIT_PATTERN = re.compile(r"\*\* Process exited \(reason: (\w+)")
+QUEUE_PREFIX = "Waiting for a free runner"
+
+with open(os.path.join(BACKEND_DIR, "temp_code.py"), encoding="utf-8") as f:
+    INPUT_PROGRAM = f.read()
+
+
+class Program:
+    def __init__(self, name: str, code: str, expected_reasons=("completed",),
+                 prompts: Optional[List[str]] = None, answers: Optional[List[str]] = None,
+                 expected_output: Optional[str] = None):
+        self.name = name
+        self.code = code
+        self.expected_reasons = expected_reasons
+        self.prompts = prompts or []
+        self.answers = answers or []
+        self.expected_output = expected_output
+
+
+PROGRAMS = {
+    "print": Program("print", 'line = "x" * 60\nfor i in range(2000):\n    print(i, line)\n'),
+    "cpu": Program("cpu", "total = 0\nfor i in range(2_000_000):\n    total += i * i\nprint(total)\n"),
+    "input": Program(
+        "input", INPUT_PROGRAM,
+        prompts=["Enter first number: ", "Enter second number: "],
+        answers=["2", "3"],
+        expected_output="The sum of 2 and 3 is 5",
+    ),
+    "loop": Program(
+        "loop", 'print("spinning", flush=True)\nwhile True:\n    pass\n',
+        expected_reasons=("wall_clock_limit", "cpu_limit"),
+    ),
+}
+
+
+def parse_mix(spec: str) -> Dict[str, float]:
+    mix = {}
+    for part in spec.split(","):
+        name, _, weight = part.partition("=")
+        name = name.strip()
+        if name not in PROGRAMS:
+            raise argparse.ArgumentTypeError(f"unknown program {name!r}, choose from {', '.join(PROGRAMS)}")
+        mix[name] = float(weight or 1)
+    return mix
+
+
+def percentile(values, pct):
+    if not values:
+        return float("nan")
+    values = sorted(values)
+    index = min(len(values) - 1, int(round(pct / 100 * (len(values) - 1))))
+    return values[index]
+
+
+def free_port() -> int:
+    with socket.socket() as sock:
+        sock.bind(("127.0.0.1", 0))
+        return sock.getsockname()[1]
+
+
+def read_rss_kb(pid: int) -> int:
+    try:
+        with open(f"/proc/{pid}/status") as f:
+            for line in f:
+                if line.startswith("VmRSS:"):
+                    return int(line.split()[1])
+    except (OSError, ValueError, IndexError):
+        pass
+    return 0
+
+
+def child_pids(pid: int) -> List[int]:
+    children = []
+    try:
+        entries = os.listdir("/proc")
+    except OSError:
+        return children
+    for entry in entries:
+        if not entry.isdigit():
+            continue
+        try:
+            with open(f"/proc/{entry}/stat") as f:
+                # The command name may contain spaces; fields resume after ')'
+                fields = f.read().rsplit(")", 1)[1].split()
+            if int(fields[1]) == pid:
+                children.append(int(entry))
+        except (OSError, IndexError, ValueError):
+            continue
+    return children
+
+
+class Server:
+    """The app running under uvicorn in a child process."""
+
+    def __init__(self, env_overrides: Dict[str, str]):
+        self.port = free_port()
+        self.url = f"ws://127.0.0.1:{self.port}/ws/terminal"
+        self.http_url = f"http://127.0.0.1:{self.port}"
+        env = os.environ.copy()
+        env.update(env_overrides)
+        self.process = subprocess.Popen(
+            [sys.executable, "-m", "uvicorn", "main:app", "--host", "127.0.0.1",
+             "--port", str(self.port), "--log-level", "warning"],
+            cwd=BACKEND_DIR, env=env
+        )
+
+    def wait_ready(self, timeout: float = 30.0):
+        deadline = time.monotonic() + timeout
+        while time.monotonic() < deadline:
+            if self.process.poll() is not None:
+                raise RuntimeError(f"server exited with code {self.process.returncode}")
+            try:
+                with urllib.request.urlopen(f"{self.http_url}/metrics", timeout=1):
+                    return
+            except OSError:
+                time.sleep(0.2)
+        raise RuntimeError("server did not become ready")
+
+    def stop(self):
+        self.process.terminate()
+        try:
+            self.process.wait(timeout=15)
+        except subprocess.TimeoutExpired:
+            self.process.kill()
+            self.process.wait()
+
+
+class MemorySampler:
+    def __init__(self, pid: int, interval: float = 0.2):
+        self.pid = pid
+        self.interval = interval
+        self.baseline_kb = read_rss_kb(pid)
+        self.peak_kb = self.baseline_kb
+        self.child_samples: List[float] = []
+        self.peak_children = 0
+
+    async def run(self):
+        while True:
+            self.peak_kb = max(self.peak_kb, read_rss_kb(self.pid))
+            children = child_pids(self.pid)
+            if children:
+                self.child_samples.append(sum(read_rss_kb(child) for child in children) / len(children))
+                self.peak_children = max(self.peak_children, len(children))
+            await asyncio.sleep(self.interval)
+
+
+async def run_client(url: str, program: Program, timeout: float, active: Dict[str, int]) -> Dict:
+    result = {"program": program.name, "error": None, "reason": None, "bytes": 0,
+              "first_output": None, "duration": None, "queued": False}
+    prompts = list(zip(program.prompts, program.answers))
+    text = ""
+    started = time.perf_counter()
+    try:
+        async with websockets.connect(f"{url}?connectionId={uuid.uuid4()}", max_size=None,
+                                      open_timeout=timeout) as ws:
+            active["now"] += 1
+            active["peak"] = max(active["peak"], active["now"])
+            try:
+                sent = time.perf_counter()
+                await ws.send(json.dumps({"type": "execute", "code": program.code}))
+                while True:
+                    message = await asyncio.wait_for(ws.recv(), timeout)
+                    if isinstance(message, bytes):
+                        message = message.decode("utf-8", errors="replace")
+                    now = time.perf_counter()
+                    if message.startswith(QUEUE_PREFIX):
+                        result["queued"] = True
+                        continue
+                    exited = EXIT_PATTERN.search(message)
+                    if exited:
+                        result["reason"] = exited.group(1)
+                        result["duration"] = now - sent
+                        break
+                    if result["first_output"] is None:
+                        result["first_output"] = now - sent
+                    result["bytes"] += len(message.encode("utf-8"))
+                    if prompts or program.expected_output:
+                        text += message
+                    # Answer each prompt once it has been printed
+                    while prompts and prompts[0][0] in text:
+                        prompt, answer = prompts.pop(0)
+                        text = text.split(prompt, 1)[1]
+                        await ws.send(json.dumps({"type": "input", "input": answer}))
+            finally:
+                active["now"] -= 1
+    except asyncio.TimeoutError:
+        result["error"] = "timeout"
+    except Exception as e:
+        result["error"] = f"{type(e).__name__}: {e}"
+
+    if result["error"] is None:
+        if result["reason"] not in program.expected_reasons:
+            result["error"] = f"unexpected exit reason {result['reason']}"
+        elif program.expected_output and program.expected_output not in text:
+            result["error"] = "expected output missing"
+    result["total"] = time.perf_counter() - started
+    return result
+
+
+def fetch_server_metrics(http_url: str) -> Dict[str, float]:
+    try:
+        with urllib.request.urlopen(f"{http_url}/metrics", timeout=5) as response:
+            body = response.read().decode("utf-8")
+    except OSError:
+        return {}
+    values = {}
+    for line in body.splitlines():
+        if line.startswith("#") or " " not in line:
+            continue
+        name, value = line.rsplit(" ", 1)
+        try:
+            values[name] = float(value)
+        except ValueError:
+            continue
+
+    def mean(metric: str, labels: str = "") -> Optional[float]:
+        count = values.get(f"{metric}_count{labels}")
+        return values[f"{metric}_sum{labels}"] / count if count else None
+
+    return {
+        "loop_lag_mean_ms": (mean("editor_event_loop_lag_seconds") or 0.0) * 1000,
+        "queue_wait_mean_ms": (mean("editor_queue_wait_seconds") or 0.0) * 1000,
+        "spawn_mean_ms": (mean("editor_spawn_seconds", '{backend="local"}') or 0.0) * 1000,
+    }
+
+
+def summarize(results: List[Dict], elapsed: float) -> Dict:
+    ok = [r for r in results if r["error"] is None]
+    first_outputs = [r["first_output"] * 1000 for r in ok if r["first_output"] is not None]
+    total_bytes = sum(r["bytes"] for r in results)
+    per_program = {}
+    for name in sorted({r["program"] for r in results}):
+        group = [r for r in results if r["program"] == name]
+        group_ok = [r for r in group if r["error"] is None]
+        group_first = [r["first_output"] * 1000 for r in group_ok if r["first_output"] is not None]
+        per_program[name] = {
+            "sessions": len(group),
+            "errors": len(group) - len(group_ok),
+            "time_to_first_output_p50_ms": percentile(group_first, 50),
+            "time_to_first_output_p95_ms": percentile(group_first, 95),
+            "duration_p50_ms": percentile([r["duration"] * 1000 for r in group_ok], 50),
+        }
+    errors: Dict[str, int] = {}
+    for r in results:
+        if r["error"]:
+            errors[r["error"]] = errors.get(r["error"], 0) + 1
+    return {
+        "sessions": len(results),
+        "completed": len(ok),
+        "error_rate": (len(results) - len(ok)) / len(results) if results else 0.0,
+        "errors": errors,
+        "queued_sessions": sum(1 for r in results if r["queued"]),
+        "elapsed_s": elapsed,
+        "sessions_per_second": len(ok) / elapsed if elapsed else 0.0,
+        "time_to_first_output_ms": {
+            "p50": percentile(first_outputs, 50),
+            "p95": percentile(first_outputs, 95),
+            "p99": percentile(first_outputs, 99),
+        },
+        "throughput_mb_s": total_bytes / elapsed / 1e6 if elapsed else 0.0,
+        "per_program": per_program,
+    }
+
+
+async def run_load(args) -> Dict:
+    mix = args.mix
+    names = list(mix)
+    weights = [mix[name] for name in names]
+    rng = random.Random(args.seed)
+    plan = [PROGRAMS[name] for name in rng.choices(names, weights, k=args.clients)]
+
+    server = None
+    url, http_url = args.url, None
+    if not url:
+        env = {
+            # Every client connects from this host, so the per-address rate
+            # limit would throttle them together; per-connection limits do
+            # not matter since each simulated student runs exactly once
+            "RUN_RATE_LIMIT": "0",
+            "RUN_ADDRESS_RATE_LIMIT": "0",
+            "RUN_WALL_SECONDS": str(args.loop_seconds),
+            "REPLAY_GRACE_SECONDS": "0",
+            "LOG_LEVEL": "WARNING",
+        }
+        env.update(dict(item.split("=", 1) for item in args.env))
+        server = Server(env)
+        server.wait_ready()
+        url, http_url = server.url, server.http_url
+
+    sampler = MemorySampler(server.process.pid) if server else None
+    sampler_task = asyncio.create_task(sampler.run()) if sampler else None
+    active = {"now": 0, "peak": 0}
+    semaphore = asyncio.Semaphore(args.concurrency or args.clients)
+
+    async def client(index: int, program: Program):
+        if args.ramp:
+            await asyncio.sleep(args.ramp * index / len(plan))
+        async with semaphore:
+            return await run_client(url, program, args.timeout, active)
+
+    try:
+        started = time.perf_counter()
+        results = await asyncio.gather(*(client(index, program) for index, program in enumerate(plan)))
+        elapsed = time.perf_counter() - started
+        report = summarize(results, elapsed)
+        report["peak_concurrent_sessions"] = active["peak"]
+        if sampler:
+            sampler_task.cancel()
+            growth = max(0, sampler.peak_kb - sampler.baseline_kb)
+            report["memory"] = {
+                "server_baseline_kb": sampler.baseline_kb,
+                "server_peak_kb": sampler.peak_kb,
+                "server_kb_per_session": growth / active["peak"] if active["peak"] else 0.0,
+                "child_kb_mean": statistics.mean(sampler.child_samples) if sampler.child_samples else 0.0,
+                "peak_child_processes": sampler.peak_children,
+            }
+        if http_url:
+            report["server"] = fetch_server_metrics(http_url)
+    finally:
+        if server:
+            server.stop()
+
+    report["config"] = {
+        "clients": args.clients,
+        "concurrency": args.concurrency or args.clients,
+        "mix": mix,
+        "ramp_s": args.ramp,
+        "loop_seconds": args.loop_seconds,
+        "seed": args.seed,
+    }
+    report["environment"] = {
+        "python": platform.python_version(),
+        "platform": platform.platform(),
+        "cpus": os.cpu_count(),
+    }
+    return report
+
+
+# (path in the report, whether higher is better)
+COMPARED = [
+    (("sessions_per_second",), True),
+    (("throughput_mb_s",), True),
+    (("time_to_first_output_ms", "p50"), False),
+    (("time_to_first_output_ms", "p95"), False),
+    (("memory", "server_kb_per_session"), False),
+]
+
+
+def lookup(report: Dict, path):
+    for key in path:
+        if not isinstance(report, dict) or key not in report:
+            return None
+        report = report[key]
+    return report
+
+
+def compare(report: Dict, baseline: Dict, tolerance: float) -> List[str]:
+    regressions = []
+    print(f"\n{'metric':36} {'baseline':>12} {'current':>12} {'change':>9}")
+    for path, higher_is_better in COMPARED:
+        old, new = lookup(baseline, path), lookup(report, path)
+        if old is None or new is None:
+            continue
+        change = (new - old) / old if old else 0.0
+        worse = -change if higher_is_better else change
+        flag = "  REGRESSION" if worse > tolerance else ""
+        name = ".".join(path)
+        print(f"{name:36} {old:12.2f} {new:12.2f} {change:+8.1%}{flag}")
+        if flag:
+            regressions.append(name)
+    # Error rates are compared in absolute terms since the baseline is usually 0
+    if report["error_rate"] > baseline.get("error_rate", 0.0) + 0.01:
+        print(f"{'error_rate':36} {baseline.get('error_rate', 0.0):12.3f} {report['error_rate']:12.3f}  REGRESSION")
+        regressions.append("error_rate")
+    return regressions
+
+
+def print_report(report: Dict):
+    first = report["time_to_first_output_ms"]
+    print(f"clients={report['config']['clients']} concurrency={report['config']['concurrency']} "
+          f"mix={report['config']['mix']}")
+    print(f"sessions: {report['completed']}/{report['sessions']} ok, error rate {report['error_rate']:.1%}, "
+          f"{report['queued_sessions']} queued, peak concurrent {report['peak_concurrent_sessions']}")
+    print(f"rate: {report['sessions_per_second']:.1f} sessions/s over {report['elapsed_s']:.1f}s, "
+          f"output {report['throughput_mb_s']:.2f} MB/s")
+    print(f"time to first output: p50 {first['p50']:.1f} ms  p95 {first['p95']:.1f} ms  p99 {first['p99']:.1f} ms")
+    for name, stats in report["per_program"].items():
+        print(f"  {name:6} n={stats['sessions']:<4} errors={stats['errors']:<3} "
+              f"first output p50 {stats['time_to_first_output_p50_ms']:.1f} ms "
+              f"p95 {stats['time_to_first_output_p95_ms']:.1f} ms  duration p50 {stats['duration_p50_ms']:.0f} ms")
+    if "memory" in report:
+        memory = report["memory"]
+        print(f"memory: server {memory['server_baseline_kb'] / 1024:.1f} -> {memory['server_peak_kb'] / 1024:.1f} MB "
+              f"({memory['server_kb_per_session']:.0f} KB/session), "
+              f"child interpreters {memory['child_kb_mean'] / 1024:.1f} MB each, "
+              f"peak {memory['peak_child_processes']}")
+    if report.get("server"):
+        server = report["server"]
+        print(f"server: loop lag mean {server['loop_lag_mean_ms']:.1f} ms, queue wait mean "
+              f"{server['queue_wait_mean_ms']:.1f} ms, spawn mean {server['spawn_mean_ms']:.1f} ms")
+    for error, count in report["errors"].items():
+        print(f"  error x{count}: {error}")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--clients", type=int, default=200, help="simulated sessions in total")
+    parser.add_argument("--concurrency", type=int, default=0, help="sessions in flight at once (default: all)")
+    parser.add_argument("--mix", type=parse_mix, default=parse_mix("print=4,cpu=2,input=3,loop=1"))
+    parser.add_argument("--ramp", type=float, default=2.0, help="seconds over which clients start")
+    parser.add_argument("--loop-seconds", type=float, default=3.0, help="server wall-clock limit, ends loop runs")
+    parser.add_argument("--timeout", type=float, default=120.0, help="seconds to wait for any one message")
+    parser.add_argument("--seed", type=int, default=1)
+    parser.add_argument("--url", help="target a running server instead, e.g. ws://host:8000/ws/terminal; "
+                                      "all clients share this host's address, so start that server with "
+                                      "RUN_ADDRESS_RATE_LIMIT=0 or they are rate-limited together")
+    parser.add_argument("--env", action="append", default=[], metavar="NAME=VALUE",
+                        help="extra environment for the local server")
+    parser.add_argument("--save", metavar="NAME", help="save the report as a baseline")
+    parser.add_argument("--compare", metavar="NAME", help="compare against a saved baseline")
+    parser.add_argument("--tolerance", type=float, default=0.2, help="allowed relative regression")
+    args = parser.parse_args()
+
+    report = asyncio.run(run_load(args))
+    print_report(report)
+
+    if args.save:
+        os.makedirs(BASELINE_DIR, exist_ok=True)
+        path = os.path.join(BASELINE_DIR, f"{args.save}.json")
+        with open(path, "w", encoding="utf-8") as f:
+            json.dump(report, f, indent=2, sort_keys=True)
+            f.write("\n")
+        print(f"saved baseline to {path}")
+
+    if args.compare:
+        with open(os.path.join(BASELINE_DIR, f"{args.compare}.json"), encoding="utf-8") as f:
+            baseline = json.load(f)
+        if compare(report, baseline, args.tolerance):
+            sys.exit(1)
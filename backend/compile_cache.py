@@ -0,0 +1,104 @@
+import hashlib
+import marshal
+import os
+import traceback
+import warnings
+from collections import OrderedDict
+from typing import Dict, Optional
+
+from interpreter_pool import WORKER_FILENAME
+
+COMPILE_CACHE_SIZE = int(os.getenv("COMPILE_CACHE_SIZE", 512))
+# Larger sources are compiled by the worker instead: parsing holds the GIL,
+# so it would stall the event loop even in a thread (64 KiB takes ~60 ms)
+COMPILE_MAX_SOURCE_BYTES = int(os.getenv("COMPILE_MAX_SOURCE_BYTES", 64 * 1024))
+
+
+class CompileResult:
+    """Either the marshalled code object for a source or the error it fails with.
+
+    ``warnings`` holds compile-time warnings formatted for stderr, which the
+    worker would otherwise never print since it does not compile again.
+    Neither bytecode nor a diagnostic means the source was not compiled here.
+    """
+
+    def __init__(self, bytecode: Optional[bytes] = None, diagnostic: Optional[str] = None, warnings: str = ""):
+        self.bytecode = bytecode
+        self.diagnostic = diagnostic
+        self.warnings = warnings
+
+    @property
+    def ok(self) -> bool:
+        return self.diagnostic is None
+
+
+def compile_source(code: str, filename: str = WORKER_FILENAME) -> CompileResult:
+    with warnings.catch_warnings(record=True) as caught:
+        warnings.simplefilter("always")
+        try:
+            # dont_inherit keeps this module's __future__ flags out of user code
+            code_object = compile(code, filename, "exec", dont_inherit=True)
+        except (SyntaxError, ValueError, MemoryError, RecursionError, OverflowError) as e:
+            # Formatted the way the worker would print it; deeply nested
+            # expressions exhaust the parser with the last three
+            code_object = None
+            diagnostic = "".join(traceback.format_exception_only(type(e), e))
+    messages = "".join(
+        warnings.formatwarning(w.message, w.category, w.filename, w.lineno, w.line) for w in caught
+    )
+    if code_object is None:
+        return CompileResult(diagnostic=messages + diagnostic)
+    return CompileResult(bytecode=marshal.dumps(code_object), warnings=messages)
+
+
+class CompileCache:
+    """LRU cache of compile results keyed by a hash of the file name and source.
+
+    Runs of the same program skip parsing both here and, through the
+    marshalled bytecode, in the worker that executes it.
+    """
+
+    def __init__(self, size: int = COMPILE_CACHE_SIZE, max_source_bytes: int = COMPILE_MAX_SOURCE_BYTES):
+        self.size = size
+        self.max_source_bytes = max_source_bytes
+        self._entries: "OrderedDict[str, CompileResult]" = OrderedDict()
+        self.hits = 0
+        self.misses = 0
+        self.syntax_errors = 0
+        self.skipped = 0
+
+    def compile(self, code: str, filename: str = WORKER_FILENAME) -> CompileResult:
+        source = code.encode("utf-8", errors="surrogatepass")
+        if self.max_source_bytes and len(source) > self.max_source_bytes:
+            self.skipped += 1
+            return CompileResult()
+        # The file name is part of the code object, so it is part of the key
+        digest = hashlib.sha256(filename.encode("utf-8", errors="surrogatepass") + b"\0")
+        digest.update(source)
+        key = digest.hexdigest()
+        result = self._entries.get(key)
+        if result is not None:
+            self._entries.move_to_end(key)
+            self.hits += 1
+        else:
+            self.misses += 1
+            result = compile_source(code, filename)
+            if self.size > 0:
+                self._entries[key] = result
+                while len(self._entries) > self.size:
+                    self._entries.popitem(last=False)
+        if not result.ok:
+            self.syntax_errors += 1
+        return result
+
+    def stats(self) -> Dict:
+        lookups = self.hits + self.misses
+        return {
+            "size": self.size,
+            "entries": len(self._entries),
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_ratio": self.hits / lookups if lookups else 0.0,
+            "syntax_errors": self.syntax_errors,
+            "skipped": self.skipped,
+        }
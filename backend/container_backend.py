@@ -0,0 +1,314 @@
+import asyncio
+import logging
+import os
+import shlex
+import time
+from collections import deque
+from typing import Deque, Dict, List, Optional
+
+from backends import ExecutionBackend
+from interpreter_pool import WORKER_READY, WORKER_SCRIPT, encode_job
+from limits import RunLimits
+from workspace import Workspace
+
+logger = logging.getLogger(__name__)
+
+CONTAINER_POOL_SIZE = int(os.getenv("CONTAINER_POOL_SIZE", 4))
+CONTAINER_IMAGE = os.getenv("CONTAINER_IMAGE", "python:3.9-slim")
+CONTAINER_PYTHON = os.getenv("CONTAINER_PYTHON", "python")
+# Command used to talk to the Docker daemon; point it at a stand-in for local testing
+CONTAINER_DOCKER_CMD = os.getenv("CONTAINER_DOCKER_CMD", "docker")
+
+with open(WORKER_SCRIPT, encoding="utf-8") as f:
+    WORKER_SOURCE = f.read()
+
+
+class ContainerError(Exception):
+    pass
+
+
+class _Container:
+    def __init__(self, container_id: str, process: asyncio.subprocess.Process):
+        self.id = container_id
+        self.process = process
+
+
+class ContainerProcess:
+    """A run's ``docker exec`` client, whose signals stop its container.
+
+    Signalling the client would only end the CLI and leave the program
+    running in the container, so ``kill`` and ``terminate`` run ``docker
+    kill`` instead. The program cannot be signalled on its own, which makes
+    ``terminate`` as abrupt as ``kill``.
+    """
+
+    def __init__(self, backend: "ContainerBackend", container: _Container):
+        self._backend = backend
+        self._container = container
+        self._process = container.process
+        self._kill_task: Optional[asyncio.Task] = None
+        self.stdin = self._process.stdin
+        self.stdout = self._process.stdout
+        self.stderr = self._process.stderr
+
+    @property
+    def pid(self) -> int:
+        return self._process.pid
+
+    @property
+    def container_id(self) -> str:
+        return self._container.id
+
+    @property
+    def returncode(self) -> Optional[int]:
+        return self._process.returncode
+
+    async def wait(self) -> int:
+        return await self._process.wait()
+
+    def terminate(self):
+        self.kill()
+
+    def kill(self):
+        if self._kill_task is None and self._process.returncode is None:
+            self._kill_task = asyncio.ensure_future(self._backend._kill(self._container))
+
+
+class ContainerBackend(ExecutionBackend):
+    """Runs each program in its own throwaway Docker container.
+
+    The pool keeps ``size`` containers that are already created and started,
+    with a pool worker interpreter attached through ``docker exec`` and the
+    whole container paused. Acquiring one is an unpause plus writing the job
+    to the worker's stdin. A container is never reused: after the run it is
+    removed and the pool builds a fresh one in the background.
+    """
+
+    name = "container"
+    samples_locally = False
+    inline_files = True
+
+    def __init__(
+        self,
+        limits: RunLimits,
+        size: int = CONTAINER_POOL_SIZE,
+        image: str = CONTAINER_IMAGE,
+        docker_cmd: str = CONTAINER_DOCKER_CMD,
+        python: str = CONTAINER_PYTHON,
+    ):
+        self.limits = limits
+        self.size = size
+        self.image = image
+        self.docker_cmd = shlex.split(docker_cmd)
+        self.python = python
+        self._idle: Deque[_Container] = deque()
+        self._in_use: Dict[int, _Container] = {}
+        self._spawning = 0
+        self._wakeup: Optional[asyncio.Event] = None
+        self._refill_task: Optional[asyncio.Task] = None
+        self._spawn_latencies: Deque[float] = deque(maxlen=1000)
+        self._acquire_latencies: Deque[float] = deque(maxlen=1000)
+        self.hits = 0
+        self.misses = 0
+        self.failures = 0
+
+    async def _docker(self, *args: str) -> str:
+        process = await asyncio.create_subprocess_exec(
+            *self.docker_cmd, *args,
+            stdout=asyncio.subprocess.PIPE,
+            stderr=asyncio.subprocess.PIPE
+        )
+        stdout, stderr = await process.communicate()
+        if process.returncode != 0:
+            raise ContainerError(f"docker {args[0]} failed: {stderr.decode(errors='replace').strip()}")
+        return stdout.decode().strip()
+
+    def _create_args(self) -> List[str]:
+        args = ["--network", "none", "--init"]
+        if self.limits.memory_mb:
+            args += ["--memory", f"{self.limits.memory_mb}m"]
+        if self.limits.max_processes:
+            args += ["--pids-limit", str(self.limits.max_processes)]
+        if self.limits.max_open_files:
+            args += ["--ulimit", f"nofile={self.limits.max_open_files}:{self.limits.max_open_files}"]
+        if self.limits.max_file_mb:
+            size = self.limits.max_file_mb * 1024 * 1024
+            args += ["--ulimit", f"fsize={size}:{size}"]
+        if self.limits.cpu_seconds:
+            args += ["--ulimit", f"cpu={self.limits.cpu_seconds}:{self.limits.cpu_seconds + 1}"]
+        return args
+
+    async def _spawn(self, pause: bool) -> _Container:
+        started = time.monotonic()
+        container_id = await self._docker("create", *self._create_args(), self.image, "sleep", "infinity")
+        try:
+            await self._docker("start", container_id)
+            process = await asyncio.create_subprocess_exec(
+                *self.docker_cmd, "exec", "-i",
+                "-e", "PYTHONIOENCODING=utf-8", "-e", "PYTHONUNBUFFERED=1",
+                container_id, self.python, "-u", "-c", WORKER_SOURCE,
+                stdin=asyncio.subprocess.PIPE,
+                stdout=asyncio.subprocess.PIPE,
+                stderr=asyncio.subprocess.PIPE
+            )
+            await process.stdout.readexactly(len(WORKER_READY))
+            if pause:
+                await self._docker("pause", container_id)
+        except BaseException:
+            await self._remove(container_id)
+            raise
+        self._spawn_latencies.append(time.monotonic() - started)
+        return _Container(container_id, process)
+
+    def interpreter(self) -> str:
+        return f"{self.image} {self.python}"
+
+    def start(self):
+        if self.size <= 0 or (self._refill_task and not self._refill_task.done()):
+            return
+        self._wakeup = asyncio.Event()
+        self._refill_task = asyncio.create_task(self._refill_loop())
+
+    async def _refill_loop(self):
+        while True:
+            try:
+                deficit = self.size - len(self._idle) - self._spawning
+                if deficit > 0:
+                    self._spawning += deficit
+                    try:
+                        results = await asyncio.gather(
+                            *(self._spawn(pause=True) for _ in range(deficit)),
+                            return_exceptions=True
+                        )
+                    finally:
+                        self._spawning -= deficit
+                    for result in results:
+                        if isinstance(result, BaseException):
+                            self.failures += 1
+                            logger.error(f"Error creating pooled container: {str(result)}")
+                        else:
+                            self._idle.append(result)
+                    if any(isinstance(result, BaseException) for result in results):
+                        await asyncio.sleep(1.0)
+                    continue
+
+                self._wakeup.clear()
+                await self._wakeup.wait()
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                logger.error(f"Error refilling container pool: {str(e)}")
+                await asyncio.sleep(1.0)
+
+    async def acquire(self, code: str, argv: List[str], bytecode: Optional[bytes] = None,
+                      workspace: Optional[Workspace] = None):
+        self.start()
+        started = time.monotonic()
+        if self._wakeup:
+            # Taking a container leaves the pool short; refill in the background
+            self._wakeup.set()
+
+        container = None
+        try:
+            while self._idle:
+                container = self._idle.popleft()
+                try:
+                    await self._docker("unpause", container.id)
+                    break
+                except ContainerError as e:
+                    logger.error(f"Discarding pooled container {container.id}: {str(e)}")
+                    asyncio.ensure_future(self._discard(container))
+                    container = None
+
+            if container is not None:
+                self.hits += 1
+            else:
+                self.misses += 1
+                container = await self._spawn(pause=False)
+
+            process = ContainerProcess(self, container)
+            # Containers cannot see the workspace, so project files travel with the job
+            process.stdin.write(encode_job(code, argv, bytecode, workspace, self.inline_files))
+            await process.stdin.drain()
+        except BaseException:
+            # A run cancelled while starting would otherwise leave its
+            # container outside both the pool and the runs in use
+            if container is not None:
+                asyncio.ensure_future(self._discard(container))
+            raise
+        self._in_use[process.pid] = container
+        self._acquire_latencies.append(time.monotonic() - started)
+        return process
+
+    async def release(self, process):
+        container = self._in_use.pop(process.pid, None)
+        if container:
+            await self._discard(container)
+
+    async def _kill(self, container: _Container):
+        try:
+            await self._docker("kill", container.id)
+        except ContainerError as e:
+            logger.error(f"Error killing container {container.id}: {str(e)}")
+            # At least end the run; the program goes when the container is removed
+            try:
+                container.process.kill()
+            except ProcessLookupError:
+                pass
+
+    async def _discard(self, container: _Container):
+        if container.process.returncode is None:
+            try:
+                container.process.kill()
+            except ProcessLookupError:
+                pass
+        await self._remove(container.id)
+        await container.process.wait()
+
+    async def _remove(self, container_id: str):
+        try:
+            await self._docker("rm", "-f", container_id)
+        except ContainerError as e:
+            logger.error(f"Error removing container {container_id}: {str(e)}")
+
+    async def close(self):
+        if self._refill_task:
+            self._refill_task.cancel()
+            try:
+                await self._refill_task
+            except asyncio.CancelledError:
+                pass
+            self._refill_task = None
+        containers = list(self._idle) + list(self._in_use.values())
+        self._idle.clear()
+        self._in_use.clear()
+        await asyncio.gather(*(self._discard(container) for container in containers), return_exceptions=True)
+
+    def stats(self) -> Dict:
+        def summary(values: Deque[float]) -> Dict[str, float]:
+            ordered = sorted(values)
+            if not ordered:
+                return {"avg": 0.0, "p95": 0.0}
+            return {
+                "avg": sum(ordered) / len(ordered),
+                "p95": ordered[min(len(ordered) - 1, int(0.95 * len(ordered)))],
+            }
+
+        requests = self.hits + self.misses
+        busy = len(self._in_use)
+        capacity = busy + len(self._idle)
+        return {
+            "backend": self.name,
+            "image": self.image,
+            "size": self.size,
+            "idle": len(self._idle),
+            "in_use": busy,
+            "spawning": self._spawning,
+            "utilization": busy / capacity if capacity else 0.0,
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_ratio": self.hits / requests if requests else 0.0,
+            "failures": self.failures,
+            "spawn_latency": summary(self._spawn_latencies),
+            "acquire_latency": summary(self._acquire_latencies),
+        }
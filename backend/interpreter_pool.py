@@ -0,0 +1,210 @@
+import asyncio
+import importlib.util
+import json
+import logging
+import os
+import sys
+import tempfile
+import time
+from collections import deque
+from typing import Any, Awaitable, Callable, Deque, Dict, List, Optional, Tuple
+
+from workspace import Workspace
+
+logger = logging.getLogger(__name__)
+
+INTERPRETER_POOL_SIZE = int(os.getenv("INTERPRETER_POOL_SIZE", 2))
+INTERPRETER_POOL_TTL = float(os.getenv("INTERPRETER_POOL_TTL", 300))
+INTERPRETER_POOL_REFILL_RATE = float(os.getenv("INTERPRETER_POOL_REFILL_RATE", 20))
+
+WORKER_SCRIPT = os.path.join(os.path.dirname(os.path.abspath(__file__)), "pool_worker.py")
+# A name that cannot collide with a real file, since CPython re-reads the
+# named file when rendering some syntax errors
+WORKER_FILENAME = "<main.py>"
+WORKER_READY = b"\x06"
+
+
+def worker_env() -> Dict[str, str]:
+    env = os.environ.copy()
+    env.update({
+        'PYTHONIOENCODING': 'utf-8',
+        'PYTHONUNBUFFERED': '1'
+    })
+    return env
+
+
+async def spawn_worker(preexec_fn: Optional[Callable[[], None]] = None) -> asyncio.subprocess.Process:
+    process = await asyncio.create_subprocess_exec(
+        sys.executable, "-u", WORKER_SCRIPT,
+        stdin=asyncio.subprocess.PIPE,
+        stdout=asyncio.subprocess.PIPE,
+        stderr=asyncio.subprocess.PIPE,
+        env=worker_env(),
+        preexec_fn=preexec_fn
+    )
+    # The worker announces that startup finished; consume the marker so it
+    # never reaches the user's output
+    await process.stdout.readexactly(len(WORKER_READY))
+    return process
+
+
+def encode_job(code: str, argv: List[str], bytecode: Optional[bytes] = None,
+               workspace: Optional[Workspace] = None, inline_files: bool = False) -> bytes:
+    source = code.encode("utf-8")
+    header = {
+        "filename": WORKER_FILENAME,
+        "path": tempfile.gettempdir(),
+        "argv": argv,
+        "size": len(source),
+    }
+    files = b""
+    if workspace is not None:
+        # Run the entry point the way `python <entry>` would from the project folder
+        header["filename"] = workspace.entry
+        if inline_files:
+            # The worker cannot see this host's workspace and unpacks the files itself
+            header["files"], files = workspace.pack()
+        else:
+            header["cwd"] = workspace.path
+    if bytecode is not None:
+        # Workers running another Python version compile the source instead
+        header["bytecode"] = len(bytecode)
+        header["magic"] = importlib.util.MAGIC_NUMBER.hex()
+    return json.dumps(header).encode("utf-8") + b"\n" + source + (bytecode or b"") + files
+
+
+class InterpreterPool:
+    """Keeps idle interpreters that already paid for startup and site import.
+
+    Each worker serves exactly one run and then exits; the pool replaces it in
+    the background at no more than ``refill_rate`` spawns per second. Idle
+    workers older than ``ttl`` seconds are retired so none go stale.
+
+    ``spawn`` starts one worker; by default a pool worker on pipes. Whatever
+    it returns needs ``returncode``, ``kill()`` and ``wait()`` like a process.
+    """
+
+    def __init__(
+        self,
+        size: int = INTERPRETER_POOL_SIZE,
+        ttl: float = INTERPRETER_POOL_TTL,
+        refill_rate: float = INTERPRETER_POOL_REFILL_RATE,
+        preexec_fn: Optional[Callable[[], None]] = None,
+        spawn: Optional[Callable[[], Awaitable[Any]]] = None,
+    ):
+        self.size = size
+        self.preexec_fn = preexec_fn
+        self._spawn = spawn or (lambda: spawn_worker(self.preexec_fn))
+        self.ttl = ttl
+        self.refill_rate = refill_rate
+        self._idle: Deque[Tuple[Any, float]] = deque()
+        self._wakeup: Optional[asyncio.Event] = None
+        self._refill_task: Optional[asyncio.Task] = None
+        self.hits = 0
+        self.misses = 0
+        self.spawned = 0
+        self.expired = 0
+
+    @property
+    def enabled(self) -> bool:
+        return self.size > 0
+
+    def start(self):
+        if not self.enabled or (self._refill_task and not self._refill_task.done()):
+            return
+        self._wakeup = asyncio.Event()
+        self._refill_task = asyncio.create_task(self._refill_loop())
+
+    async def take(self) -> Any:
+        """An idle worker, or a freshly spawned one when none is left."""
+        self.start()
+        process = None
+        while self._idle:
+            candidate, _ = self._idle.popleft()
+            if candidate.returncode is None:
+                process = candidate
+                break
+            self._kill(candidate)
+
+        if process is not None:
+            self.hits += 1
+        else:
+            self.misses += 1
+            process = await self._spawn()
+            self.spawned += 1
+
+        if self._wakeup:
+            self._wakeup.set()
+        return process
+
+    async def acquire(self, code: str, argv: List[str], bytecode: Optional[bytes] = None,
+                      workspace: Optional[Workspace] = None) -> asyncio.subprocess.Process:
+        process = await self.take()
+        process.stdin.write(encode_job(code, argv, bytecode, workspace))
+        await process.stdin.drain()
+        return process
+
+    async def _refill_loop(self):
+        interval = 1.0 / self.refill_rate if self.refill_rate > 0 else 0
+        while True:
+            try:
+                self._retire_expired()
+                if len(self._idle) < self.size:
+                    process = await self._spawn()
+                    self.spawned += 1
+                    self._idle.append((process, time.monotonic()))
+                    await asyncio.sleep(interval)
+                    continue
+
+                self._wakeup.clear()
+                try:
+                    await asyncio.wait_for(self._wakeup.wait(), timeout=max(self.ttl / 2, 1.0))
+                except asyncio.TimeoutError:
+                    pass
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                logger.error(f"Error refilling interpreter pool: {str(e)}")
+                await asyncio.sleep(1.0)
+
+    def _retire_expired(self):
+        now = time.monotonic()
+        while self._idle and now - self._idle[0][1] > self.ttl:
+            process, _ = self._idle.popleft()
+            self.expired += 1
+            self._kill(process)
+
+    @staticmethod
+    def _kill(process):
+        # Also called for workers that already exited, so they release what they hold
+        try:
+            process.kill()
+        except ProcessLookupError:
+            pass
+
+    async def close(self):
+        if self._refill_task:
+            self._refill_task.cancel()
+            try:
+                await self._refill_task
+            except asyncio.CancelledError:
+                pass
+            self._refill_task = None
+        while self._idle:
+            process, _ = self._idle.popleft()
+            self._kill(process)
+            await process.wait()
+
+    def stats(self) -> Dict[str, float]:
+        requests = self.hits + self.misses
+        return {
+            "size": self.size,
+            "idle": len(self._idle),
+            "ttl": self.ttl,
+            "refill_rate": self.refill_rate,
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_ratio": self.hits / requests if requests else 0.0,
+            "spawned": self.spawned,
+            "expired": self.expired,
+        }
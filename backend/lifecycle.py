@@ -0,0 +1,55 @@
+import os
+import time
+from typing import Dict, Optional
+
+# How long in-flight runs may keep going once a drain starts
+DRAIN_TIMEOUT = float(os.getenv("DRAIN_TIMEOUT", 30))
+# Seconds between terminating a program and killing it when stopping runs
+DRAIN_KILL_GRACE = float(os.getenv("DRAIN_KILL_GRACE", 2))
+# Required as a bearer token by /admin/drain; when empty only local requests may drain
+DRAIN_TOKEN = os.getenv("DRAIN_TOKEN", "")
+# Drain on SIGTERM before the server closes connections, instead of closing them right away
+DRAIN_ON_SIGTERM = os.getenv("DRAIN_ON_SIGTERM", "true").lower() in ("1", "true", "yes")
+
+STATE_READY = "ready"
+STATE_DRAINING = "draining"
+STATE_STOPPING = "stopping"
+
+# WebSocket close codes telling clients to reconnect, possibly elsewhere
+CLOSE_SERVICE_RESTART = 1012
+CLOSE_TRY_AGAIN_LATER = 1013
+
+
+class Lifecycle:
+    """Whether this worker takes new work, for readiness checks and the drain."""
+
+    def __init__(self, timeout: float = DRAIN_TIMEOUT):
+        self.timeout = timeout
+        self.state = STATE_READY
+        self.deadline: Optional[float] = None
+
+    @property
+    def accepting(self) -> bool:
+        return self.state == STATE_READY
+
+    def begin_drain(self, timeout: Optional[float] = None) -> bool:
+        """Start draining; returns False if already draining or stopping."""
+        if self.state != STATE_READY:
+            return False
+        self.state = STATE_DRAINING
+        self.deadline = time.monotonic() + (self.timeout if timeout is None else timeout)
+        return True
+
+    def begin_stop(self):
+        self.state = STATE_STOPPING
+
+    def remaining(self) -> float:
+        if self.deadline is None:
+            return 0.0
+        return max(0.0, self.deadline - time.monotonic())
+
+    def status(self) -> Dict:
+        status = {"status": self.state}
+        if self.state == STATE_DRAINING:
+            status["deadline_seconds"] = round(self.remaining(), 1)
+        return status
@@ -0,0 +1,143 @@
+import logging
+import os
+import signal
+from typing import Callable, Dict, Optional
+
+try:
+    import resource
+except ImportError:  # Windows
+    resource = None
+
+logger = logging.getLogger(__name__)
+
+RUN_CPU_SECONDS = int(os.getenv("RUN_CPU_SECONDS", 10))
+RUN_MEMORY_MB = int(os.getenv("RUN_MEMORY_MB", 512))
+RUN_MAX_PROCESSES = int(os.getenv("RUN_MAX_PROCESSES", 0))
+RUN_MAX_OPEN_FILES = int(os.getenv("RUN_MAX_OPEN_FILES", 64))
+# Largest file a run may write; project workspaces may be on a memory-backed tmpfs
+RUN_MAX_FILE_MB = int(os.getenv("RUN_MAX_FILE_MB", 16))
+RUN_WALL_SECONDS = float(os.getenv("RUN_WALL_SECONDS", 300))
+RUN_OUTPUT_BYTES = int(os.getenv("RUN_OUTPUT_BYTES", 1024 * 1024))
+
+# Why a run ended, as reported to the client and in stats
+REASON_COMPLETED = "completed"
+REASON_ERROR = "error"
+REASON_SIGNAL = "signal"
+REASON_STOPPED = "stopped"
+REASON_CPU_LIMIT = "cpu_limit"
+REASON_WALL_LIMIT = "wall_clock_limit"
+REASON_OUTPUT_LIMIT = "output_limit"
+
+
+class RunLimits:
+    """Resource limits applied to every child interpreter.
+
+    A value of 0 leaves that limit unset. The rlimits are only available on
+    POSIX; the wall-clock and output limits are enforced by ProcessManager
+    on every platform.
+    """
+
+    def __init__(
+        self,
+        cpu_seconds: int = RUN_CPU_SECONDS,
+        memory_mb: int = RUN_MEMORY_MB,
+        max_processes: int = RUN_MAX_PROCESSES,
+        max_open_files: int = RUN_MAX_OPEN_FILES,
+        max_file_mb: int = RUN_MAX_FILE_MB,
+        wall_seconds: float = RUN_WALL_SECONDS,
+        output_bytes: int = RUN_OUTPUT_BYTES,
+    ):
+        self.cpu_seconds = cpu_seconds
+        self.memory_mb = memory_mb
+        self.max_processes = max_processes
+        self.max_open_files = max_open_files
+        self.max_file_mb = max_file_mb
+        self.wall_seconds = wall_seconds
+        self.output_bytes = output_bytes
+
+    def rlimits(self) -> Dict[int, int]:
+        if resource is None:
+            return {}
+        limits = {}
+        if self.cpu_seconds:
+            limits[resource.RLIMIT_CPU] = self.cpu_seconds
+        if self.memory_mb:
+            limits[resource.RLIMIT_AS] = self.memory_mb * 1024 * 1024
+        if self.max_processes and hasattr(resource, "RLIMIT_NPROC"):
+            limits[resource.RLIMIT_NPROC] = self.max_processes
+        if self.max_open_files:
+            limits[resource.RLIMIT_NOFILE] = self.max_open_files
+        if self.max_file_mb:
+            # Python ignores SIGXFSZ, so oversized writes fail with EFBIG
+            limits[resource.RLIMIT_FSIZE] = self.max_file_mb * 1024 * 1024
+        return limits
+
+    def preexec_fn(self) -> Optional[Callable[[], None]]:
+        limits = self.rlimits()
+        if not limits:
+            return None
+
+        def apply():
+            # Runs in the forked child before exec; keep it to setrlimit calls
+            for name, value in limits.items():
+                hard = value + 1 if name == resource.RLIMIT_CPU else value
+                resource.setrlimit(name, (value, hard))
+
+        return apply
+
+
+class ProcessSampler:
+    """Tracks peak RSS and CPU time of a child from /proc while it runs.
+
+    On platforms without /proc the figures stay ``None``.
+    """
+
+    _clock_ticks = os.sysconf("SC_CLK_TCK") if hasattr(os, "sysconf") else 100
+
+    def __init__(self, pid: int):
+        self.pid = pid
+        self.peak_rss_kb: Optional[int] = None
+        self.cpu_seconds: Optional[float] = None
+
+    def sample(self):
+        try:
+            with open(f"/proc/{self.pid}/stat", "rb") as f:
+                # Fields after the parenthesised command name; utime and stime are 14 and 15
+                fields = f.read().rsplit(b")", 1)[1].split()
+            self.cpu_seconds = (int(fields[11]) + int(fields[12])) / self._clock_ticks
+            with open(f"/proc/{self.pid}/status", "rb") as f:
+                for line in f:
+                    if line.startswith(b"VmHWM:"):
+                        self.peak_rss_kb = int(line.split()[1])
+                        break
+        except (OSError, IndexError, ValueError):
+            pass
+
+
+def termination_reason(returncode: Optional[int], limits: RunLimits, cpu_seconds: Optional[float]) -> str:
+    if returncode is None:
+        return REASON_STOPPED
+    if returncode == 0:
+        return REASON_COMPLETED
+    if returncode > 0:
+        return REASON_ERROR
+    signum = -returncode
+    if signum == getattr(signal, "SIGXCPU", None):
+        return REASON_CPU_LIMIT
+    if (signum == getattr(signal, "SIGKILL", None) and limits.cpu_seconds
+            and cpu_seconds is not None and cpu_seconds >= limits.cpu_seconds):
+        return REASON_CPU_LIMIT
+    return REASON_SIGNAL
+
+
+def describe_run(stats: Dict) -> str:
+    parts = [f"reason: {stats['reason']}"]
+    if stats.get("exit_code") is not None:
+        parts.append(f"exit code {stats['exit_code']}")
+    if stats.get("cpu_seconds") is not None:
+        parts.append(f"cpu {stats['cpu_seconds']:.2f}s")
+    if stats.get("peak_rss_kb") is not None:
+        parts.append(f"peak memory {stats['peak_rss_kb'] / 1024:.1f} MB")
+    if stats.get("cached"):
+        parts.append("cached result")
+    return ", ".join(parts)
@@ -0,0 +1,105 @@
+import atexit
+import hashlib
+import hmac
+import logging
+import logging.handlers
+import os
+import queue
+import secrets
+import time
+from typing import Dict, Optional, Tuple
+
+LOG_LEVEL = os.getenv("LOG_LEVEL", "INFO").upper()
+# Write log records from a background thread so slow handlers never block the event loop
+LOG_ASYNC = os.getenv("LOG_ASYNC", "true").lower() in ("1", "true", "yes")
+# Records allowed per call site per interval; 0 disables rate limiting
+LOG_RATE_LIMIT = int(os.getenv("LOG_RATE_LIMIT", 20))
+LOG_RATE_INTERVAL = float(os.getenv("LOG_RATE_INTERVAL", 10))
+
+LOG_FORMAT = '%(asctime)s - %(levelname)s - %(message)s'
+
+# Key for session tags; give every worker the same one to follow a session
+# across them in the logs, otherwise each process picks its own
+LOG_SESSION_KEY = os.getenv("LOG_SESSION_KEY", "").encode("utf-8") or secrets.token_bytes(32)
+
+
+def session_tag(connection_id: str, key: bytes = LOG_SESSION_KEY) -> str:
+    """Stands in for a connection id in logs and traces.
+
+    The id is all a client needs to reattach to a session, so it is never
+    written out; the tag is a keyed hash that cannot be turned back into it.
+    """
+    digest = hmac.new(key, connection_id.encode("utf-8", errors="surrogatepass"), hashlib.sha256)
+    return digest.hexdigest()[:12]
+
+
+class RateLimitFilter(logging.Filter):
+    """Lets at most ``limit`` records per call site through each ``interval`` seconds.
+
+    Call sites are told apart by file and line, since messages are usually
+    formatted before they get here. The first record let through after a
+    quiet spell says how many were dropped.
+    """
+
+    def __init__(self, limit: int = LOG_RATE_LIMIT, interval: float = LOG_RATE_INTERVAL):
+        super().__init__()
+        self.limit = limit
+        self.interval = interval
+        self._windows: Dict[Tuple[str, int], list] = {}
+
+    def filter(self, record: logging.LogRecord) -> bool:
+        if self.limit <= 0:
+            return True
+        key = (record.pathname, record.lineno)
+        now = time.monotonic()
+        window = self._windows.get(key)
+        if window is None or now - window[0] >= self.interval:
+            suppressed = window[2] if window else 0
+            self._windows[key] = [now, 1, 0]
+            if suppressed:
+                record.msg = f"{record.getMessage()} ({suppressed} similar messages suppressed)"
+                record.args = None
+            return True
+        if window[1] < self.limit:
+            window[1] += 1
+            return True
+        window[2] += 1
+        return False
+
+
+_listener: Optional[logging.handlers.QueueListener] = None
+
+
+def configure_logging(level: str = LOG_LEVEL, use_queue: bool = LOG_ASYNC, rate_limit: int = LOG_RATE_LIMIT):
+    global _listener
+    logging.basicConfig(level=getattr(logging, level, logging.INFO), format=LOG_FORMAT)
+    root = logging.getLogger()
+    if _listener is not None:
+        return
+
+    handlers = list(root.handlers)
+    if use_queue:
+        # Handler I/O happens in the listener thread, off the event loop
+        records: queue.SimpleQueue = queue.SimpleQueue()
+        for handler in handlers:
+            root.removeHandler(handler)
+        queue_handler = logging.handlers.QueueHandler(records)
+        root.addHandler(queue_handler)
+        _listener = logging.handlers.QueueListener(records, *handlers, respect_handler_level=True)
+        _listener.start()
+        # Flush what is still queued when the process exits
+        atexit.register(stop_logging)
+        handlers = [queue_handler]
+
+    if rate_limit > 0:
+        # Filtering before the queue keeps dropped records cheap
+        rate_filter = RateLimitFilter(rate_limit)
+        for handler in handlers:
+            handler.addFilter(rate_filter)
+
+
+def stop_logging():
+    global _listener
+    if _listener:
+        _listener.stop()
+        _listener = None
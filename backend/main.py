@@ -1,13 +1,9 @@
-from fastapi import FastAPI, WebSocket, WebSocketDisconnect
+from fastapi import FastAPI, Request, WebSocket, WebSocketDisconnect
 from fastapi.middleware.cors import CORSMiddleware
-from fastapi.staticfiles import StaticFiles
-from fastapi.responses import FileResponse
+from fastapi.responses import JSONResponse, PlainTextResponse, Response
 import asyncio
 import json
 import os
-import sys
-import tempfile
-import subprocess
 import threading
 from queue import Queue
 from concurrent.futures import ThreadPoolExecutor
@@ -16,23 +12,43 @@ import uuid
 import io
 import traceback
 import logging
-import platform
+import signal
+import time
 from dotenv import load_dotenv
+from streaming import OutputCoalescer, pump_stream
+from interpreter_pool import WORKER_FILENAME, InterpreterPool
+from backends import EXECUTION_BACKEND, ExecutionBackend, LocalBackend
+from pty_backend import PTY_DEFAULT_COLS, PTY_DEFAULT_ROWS, create_pty_backend
+from scheduler import ExecutionScheduler
+from session_registry import WORKER_ID, create_session_registry, new_owner_token, owner_worker
+from replay import REPLAY_GRACE_SECONDS, ReplayBuffer, sync_marker
+from result_cache import ResultCache, RunRecording, replay_recording
+from compile_cache import CompileCache
+from static_assets import INDEX_HEADERS, StaticAssets
+from logging_setup import configure_logging, session_tag
+import metrics
+from tracing import RunTracer
+from workspace import Workspace, WorkspaceError, workspace_marker
+from lifecycle import (
+    CLOSE_SERVICE_RESTART, CLOSE_TRY_AGAIN_LATER, DRAIN_KILL_GRACE, DRAIN_ON_SIGTERM, DRAIN_TOKEN,
+    Lifecycle
+)
+from protocol import (
+    PROTOCOL_V2, STREAM_EXIT, STREAM_STATUS, CreditWindow, ProtocolOptions,
+    encode_v1, encode_v2, segment_size
+)
+from limits import (
+    REASON_ERROR, REASON_OUTPUT_LIMIT, REASON_WALL_LIMIT, ProcessSampler, RunLimits,
+    describe_run, termination_reason
+)
 
 # Load environment variables
 load_dotenv()
 
 # Configure logging
-logging.basicConfig(
-    level=logging.INFO,
-    format='%(asctime)s - %(levelname)s - %(message)s'
-)
+configure_logging()
 logger = logging.getLogger(__name__)
 
-# Set the event loop policy for Windows
-if platform.system() == 'Windows':
-    asyncio.set_event_loop_policy(asyncio.WindowsSelectorEventLoopPolicy())
-
 app = FastAPI()
 
 # Configure CORS with specific origins
@@ -63,185 +79,681 @@ if os.path.exists(static_dir):
 else:
     logger.error(f"Static directory does not exist: {static_dir}")
 
-# Mount static files
-app.mount("/static", StaticFiles(directory=static_dir), name="static")
+# Frontend build, served from memory once loaded at startup
+static_assets = StaticAssets(static_dir)
+
+@app.api_route("/static/{path:path}", methods=["GET", "HEAD"])
+async def static_file(path: str, request: Request):
+    asset = static_assets.get(path)
+    if asset is None:
+        return Response("Not Found", status_code=404, media_type="text/plain")
+    return asset.response(request.headers)
 
 # Root endpoint
 @app.get("/")
-async def read_root():
-    index_path = os.path.join(static_dir, "index.html")
-    if not os.path.exists(index_path):
-        logger.error(f"index.html not found at: {index_path}")
+async def read_root(request: Request):
+    if static_assets.index is None:
         return {"error": "Static files not found"}
-    
-    # Read and modify index.html to fix static file paths
-    with open(index_path, 'r', encoding='utf-8') as f:
-        content = f.read()
-    
-    # Fix static file paths if needed
-    if '/static/' not in content:
-        content = content.replace('href="/', 'href="/static/')
-        content = content.replace('src="/', 'src="/static/')
-    
-    # Fix WebSocket connection to use secure protocol
-    content = content.replace('ws://', 'wss://')
-    
-    return FileResponse(
-        index_path,
-        media_type='text/html',
-        headers={
-            'Content-Type': 'text/html',
-            'Strict-Transport-Security': 'max-age=31536000; includeSubDomains',
-            'X-Content-Type-Options': 'nosniff',
-            'X-Frame-Options': 'DENY',
-            'X-XSS-Protection': '1; mode=block'
-        }
-    )
+    return static_assets.index.response(request.headers, INDEX_HEADERS)
 
 # Store active connections
 active_connections: Dict[str, 'ProcessManager'] = {}
 
+# Which connection, on which worker, owns each connection ID
+session_registry = create_session_registry()
+session_watch_task = None
+
+# Resource limits applied to every run
+run_limits = RunLimits()
+
+def create_backend(name: str) -> ExecutionBackend:
+    if name == "container":
+        from container_backend import ContainerBackend
+        return ContainerBackend(run_limits)
+    if name != "local":
+        logger.warning(f"Unknown execution backend {name!r}, using local")
+    # Pre-warmed interpreters shared by every connection on this worker
+    pool = InterpreterPool(preexec_fn=run_limits.preexec_fn())
+    return LocalBackend(pool, preexec_fn=run_limits.preexec_fn())
+
+execution_backend = create_backend(EXECUTION_BACKEND)
+
+# Runs that ask for a terminal; None when pseudo-terminals are unavailable
+pty_backend = create_pty_backend(preexec_fn=run_limits.preexec_fn()) if EXECUTION_BACKEND == "local" else None
+
+# Admission control for runs started by any connection on this worker
+scheduler = ExecutionScheduler()
+
+# Code is parsed here once per distinct source and shipped to workers as bytecode
+compile_cache = CompileCache()
+
+# Ready, or draining before a restart
+lifecycle = Lifecycle()
+drain_task = None
+
+# Sampled per-run traces
+tracer = RunTracer()
+loop_lag_task = None
+
+# Recorded output of deterministic runs, replayed instead of running them again
+result_cache = ResultCache()
+
+@app.get("/pool/stats")
+async def pool_stats():
+    stats = execution_backend.stats()
+    if pty_backend:
+        stats["pty"] = pty_backend.stats()
+    return stats
+
+@app.get("/scheduler/stats")
+async def scheduler_stats():
+    return scheduler.stats()
+
+@app.get("/cache/stats")
+async def cache_stats():
+    return result_cache.stats()
+
+@app.get("/compile/stats")
+async def compile_stats():
+    return compile_cache.stats()
+
+# Read from live state whenever /metrics is scraped
+metrics.registry.gauge("active_sessions", "Sessions held by this worker, attached or not",
+                       lambda: len(active_connections))
+metrics.registry.gauge("detached_sessions", "Sessions kept running without a client",
+                       lambda: sum(1 for manager in active_connections.values() if manager.websocket is None))
+metrics.registry.gauge("running_processes", "Programs currently running",
+                       lambda: sum(1 for manager in active_connections.values() if manager.is_running))
+metrics.registry.gauge("send_buffer_bytes", "Output read from programs but not yet written to a client",
+                       lambda: sum(manager.pending_output() for manager in active_connections.values()))
+metrics.registry.gauge("scheduler_queued", "Runs waiting for a free slot", lambda: scheduler.queued)
+metrics.registry.gauge("scheduler_slots_in_use", "Run slots currently held", lambda: scheduler.running)
+metrics.registry.gauge("result_cache_hit_ratio", "Share of result cache lookups that hit",
+                       lambda: result_cache.stats()["hit_ratio"])
+metrics.registry.gauge("result_cache_bytes_saved", "Output bytes served from the result cache",
+                       lambda: result_cache.bytes_saved)
+metrics.registry.gauge("compile_cache_hit_ratio", "Share of compile cache lookups that hit",
+                       lambda: compile_cache.stats()["hit_ratio"])
+
+@app.get("/metrics")
+async def metrics_endpoint():
+    return PlainTextResponse(metrics.registry.render(), media_type="text/plain; version=0.0.4")
+
+def admin_refusal(request: Request, action: str) -> Optional[JSONResponse]:
+    """The response refusing an admin request, or None if it may go ahead.
+
+    With DRAIN_TOKEN set the request must present it as a bearer token.
+    Without it only direct local requests are allowed; a forwarded one may
+    carry whatever address the client put in its headers.
+    """
+    if DRAIN_TOKEN:
+        if request.headers.get("authorization") != f"Bearer {DRAIN_TOKEN}":
+            return JSONResponse({"error": "Unauthorized"}, status_code=401)
+    elif (not request.client or request.client.host not in ("127.0.0.1", "::1")
+          or "x-forwarded-for" in request.headers):
+        return JSONResponse({"error": f"{action} is only allowed locally without DRAIN_TOKEN"}, status_code=403)
+    return None
+
+@app.get("/traces")
+async def recent_traces(request: Request):
+    refusal = admin_refusal(request, "Reading traces")
+    if refusal:
+        return refusal
+    return tracer.recent()
+
+@app.get("/health/live")
+async def liveness():
+    return {"status": "alive"}
+
+@app.get("/health/ready")
+async def readiness():
+    # Load balancers stop sending traffic once this returns 503
+    return JSONResponse(lifecycle.status(), status_code=200 if lifecycle.accepting else 503)
+
+@app.post("/admin/drain")
+async def start_drain(request: Request, timeout: Optional[float] = None):
+    global drain_task
+    refusal = admin_refusal(request, "Draining")
+    if refusal:
+        return refusal
+    if drain_task is None:
+        drain_task = asyncio.create_task(drain(timeout))
+    return JSONResponse(lifecycle.status(), status_code=202)
+
+def drain_then_exit():
+    # Uvicorn closes every WebSocket as soon as it gets SIGTERM, so drain
+    # first and hand over to its SIGINT handler once runs have finished
+    global drain_task
+    if drain_task is None:
+        drain_task = asyncio.create_task(drain())
+        drain_task.add_done_callback(lambda task: os.kill(os.getpid(), signal.SIGINT))
+
+def install_drain_signal_handler():
+    try:
+        asyncio.get_running_loop().add_signal_handler(signal.SIGTERM, drain_then_exit)
+    except (NotImplementedError, RuntimeError, ValueError):
+        # No signal handlers on Windows or outside the main thread
+        logger.debug("SIGTERM drain handler not installed")
+
 class ProcessManager:
-    def __init__(self, websocket: WebSocket):
+    def __init__(self, websocket: WebSocket, connection_id: Optional[str] = None, owner_token: Optional[str] = None):
         self.websocket = websocket
+        self.connection_id = connection_id or str(uuid.uuid4())
+        # Logged instead of the id, which is enough to take over the session
+        self.tag = session_tag(self.connection_id)
+        self.owner_token = owner_token
+        self.replay = ReplayBuffer()
+        self.send_lock = asyncio.Lock()
+        self.protocol = ProtocolOptions()
+        self.credit = None
+        self.grace_task = None
         self.process = None
         self.is_running = False
         self.stdin_buffer = asyncio.Queue()
         self.output_task = None
         self.input_task = None
-        self.temp_file = None
+        self.run_task = None
+        self.watchdog_task = None
+        self.holds_slot = False
+        self.unreleased_process = None
+        self.backend = execution_backend
+        self.run_backend = None
+        self.use_pty = False
+        self.window_size = (PTY_DEFAULT_COLS, PTY_DEFAULT_ROWS)
+        self.limits = run_limits
+        self.sampler = None
+        self.limit_reason = None
+        self.output_sent = 0
+        self.started_at = None
+        self.run_stats = None
+        self.cache_key = None
+        self.recording = None
+        self.read_input = False
+        self.trace = None
+        self.requested_at = None
+        self.awaiting_output = False
+        self.coalescer = None
+        self.sending_bytes = 0
+        self.workspace = None
+        self.run_workspace = None
+        self.compile_warnings = ""
+
+    async def execute(self, code: Optional[str], args: str = "", use_pty: bool = False,
+                      project: Optional[Dict] = None):
+        scheduler.check_rate(self.connection_id, self.client_address)
+        # A connection runs one program at a time; a new Run replaces the old one
+        await self.stop_process()
+        self.use_pty = bool(use_pty and pty_backend)
+        workspace = None
+        if project is not None:
+            # Only touch the files once no program is running from them
+            code = await self.update_workspace(project)
+            if code is None:
+                return
+            workspace = self.workspace
+        self.run_task = asyncio.create_task(self.run_when_admitted(code, args, workspace))
 
-    async def start_process(self, code: str, args: str = ""):
+    async def update_workspace(self, project: Dict) -> Optional[str]:
+        """Applies a project message and returns the entry point's source.
+
+        Returns None when the run cannot go ahead: the files were invalid,
+        or they were changes against a version this session no longer has,
+        in which case the client is asked for the whole project.
+        """
         try:
-            # Create a temporary file to store the code
-            with tempfile.NamedTemporaryFile(mode='w', suffix='.py', delete=False, encoding='utf-8') as f:
-                f.write(code)
-                self.temp_file = f.name
-
-            # Prepare the command
-            cmd = [sys.executable, "-u", self.temp_file]  # Add -u for unbuffered output
-            if args:
-                cmd.extend(args.split())
-
-            # Set up environment variables for Python process
-            env = os.environ.copy()
-            env.update({
-                'PYTHONIOENCODING': 'utf-8',
-                'PYTHONUNBUFFERED': '1'
-            })
-
-            # Start the process using subprocess.Popen for Windows compatibility
-            self.process = subprocess.Popen(
-                cmd,
-                stdin=subprocess.PIPE,
-                stdout=subprocess.PIPE,
-                stderr=subprocess.PIPE,
-                env=env,
-                bufsize=0,  # No buffering
-                text=True,
-                encoding='utf-8',
-                universal_newlines=True
+            if self.workspace is None:
+                self.workspace = Workspace(materialize=False)
+            if self.use_pty or not self.backend.inline_files:
+                # Only runs on this host need the files in a folder; backends
+                # sent them with each job never write them here
+                await asyncio.to_thread(self.workspace.materialize)
+            base = project.get("base")
+            written = await asyncio.to_thread(
+                self.workspace.apply, project.get("files", {}), project.get("deleted", []), base
             )
+            if written is None:
+                logger.debug(f"Workspace of {self.tag} is not at {base}, asking for all files")
+                metrics.workspace_syncs.inc(1, "stale")
+                await self.send_workspace_version("")
+                return None
+            metrics.workspace_syncs.inc(1, "changes" if base else "full")
+            metrics.workspace_bytes.inc(written)
+            code = self.workspace.select_entry(project.get("entry"))
+        except (WorkspaceError, OSError) as e:
+            await self.send_text(f"\nError: {str(e)}\n")
+            return None
+        await self.send_workspace_version(self.workspace.version)
+        return code
+
+    async def send_workspace_version(self, version: str):
+        # Not numbered or kept for replay: a resumed client sends all files
+        # again if it missed this, which is always safe
+        async with self.send_lock:
+            if not self.websocket:
+                return
+            if self.protocol.version >= PROTOCOL_V2:
+                text = json.dumps({"type": "workspace", "version": version})
+            else:
+                text = workspace_marker(version)
+            try:
+                await self.websocket.send_text(text)
+            except Exception as e:
+                logger.debug(f"Could not send to {self.tag}: {str(e)}")
+
+    async def run_when_admitted(self, code: str, args: str, workspace: Optional[Workspace] = None):
+        self.requested_at = time.monotonic()
+        self.awaiting_output = True
+        self.trace = tracer.start(self.connection_id)
+        if self.trace:
+            self.trace.mark("requested", code_bytes=len(code), pty=self.use_pty, project=workspace is not None)
+
+        # Syntax errors are reported without queueing or spawning anything
+        compiled = compile_cache.compile(code, workspace.entry if workspace else WORKER_FILENAME)
+        if not compiled.ok:
+            await self.report_syntax_error(compiled.diagnostic)
+            return
+        if self.trace:
+            self.trace.mark("compiled")
+
+        argv = args.split() if args else []
+        # Project runs depend on every project file, and only on those since
+        # whatever a program leaves in its workspace is removed
+        project = {"files": workspace.files(), "entry": workspace.entry} if workspace else {}
+        if self.use_pty:
+            self.cache_key = result_cache.key(code, argv, pty_backend.interpreter(), self.window_size, **project)
+        else:
+            self.cache_key = result_cache.key(code, argv, self.backend.interpreter(), **project)
+        entry = result_cache.get(self.cache_key)
+        if entry:
+            await self.replay_cached(entry)
+            return
+
+        queued_at = time.monotonic()
+        await scheduler.acquire(self.connection_id, self.send_queue_position)
+        self.holds_slot = True
+        metrics.queue_wait.observe(time.monotonic() - queued_at)
+        if self.trace:
+            self.trace.mark("admitted")
+        self.compile_warnings = compiled.warnings
+        success = await self.start_process(code, args, compiled.bytecode, workspace)
+        if not success:
+            self.release_slot()
+            await self.send_text("\nError: Failed to start process\n")
+
+    async def replay_cached(self, entry):
+        logger.info(f"Replaying cached result for connection {self.tag}")
+        self.started_at = time.monotonic()
+        self.limit_reason = None
+        self.output_sent = 0
+        self.recording = None
+        if self.trace:
+            self.trace.mark("cache_hit")
+        await replay_recording(entry, self.send_output)
+        self.run_stats = dict(entry.stats, cached=True, wall_seconds=time.monotonic() - self.started_at)
+        await self.send_frame([(STREAM_EXIT, self.run_stats)])
+        self.record_run("cache")
+
+    async def report_syntax_error(self, diagnostic: str):
+        self.started_at = time.monotonic()
+        self.limit_reason = None
+        self.output_sent = 0
+        self.recording = None
+        await self.send_output([("stderr", diagnostic)])
+        self.run_stats = {
+            "reason": REASON_ERROR,
+            "exit_code": 1,
+            "cpu_seconds": None,
+            "peak_rss_kb": None,
+            "wall_seconds": time.monotonic() - self.started_at,
+            "output_bytes": self.output_sent,
+        }
+        await self.send_frame([(STREAM_EXIT, self.run_stats)])
+        self.record_run("compile")
+
+    def pending_output(self) -> int:
+        pending = self.coalescer.pending if self.coalescer and self.is_running else 0
+        return pending + self.sending_bytes
+
+    def record_run(self, source: str):
+        stats = self.run_stats
+        metrics.runs.inc(1, stats["reason"], source)
+        if stats.get("wall_seconds") is not None:
+            metrics.run_duration.observe(stats["wall_seconds"])
+        if self.trace:
+            self.trace.mark("finished", reason=stats["reason"], source=source, output_bytes=stats.get("output_bytes"))
+            tracer.finish(self.trace)
+            self.trace = None
+
+    def set_protocol(self, protocol: ProtocolOptions):
+        self.protocol = protocol
+        if protocol.version < PROTOCOL_V2:
+            if self.credit:
+                # Output may be waiting for credit that will never come now
+                self.credit.suspend()
+            self.credit = None
+        elif self.credit:
+            # Keep the window output may be waiting on; the new client starts afresh
+            self.credit.reset(protocol.window)
+        else:
+            self.credit = CreditWindow(protocol.window)
+
+    def suspend_credit(self):
+        # The program has ended, so what it left in the pipes is sent without
+        # waiting for credit and the run can finish and free its slot
+        if self.credit:
+            self.credit.suspend()
+
+    def grant_credit(self, amount: int):
+        if self.credit and amount > 0:
+            self.credit.grant(amount)
+
+    async def write_frame(self, websocket: WebSocket, seq: int, segments):
+        if self.protocol.version >= PROTOCOL_V2:
+            await websocket.send_bytes(encode_v2(seq, segments, self.protocol.compression))
+        else:
+            await websocket.send_text(encode_v1(segments))
+
+    async def send_frame(self, segments):
+        # Every frame is numbered and kept for replay, even while no client
+        # is attached, so a reconnecting client can pick up where it left off
+        async with self.send_lock:
+            seq = self.replay.append(segments, sum(segment_size(segment) for segment in segments))
+            if self.websocket:
+                try:
+                    started = time.monotonic()
+                    await self.write_frame(self.websocket, seq, segments)
+                    metrics.frame_send.observe(time.monotonic() - started)
+                except Exception as e:
+                    logger.debug(f"Could not send to {self.tag}: {str(e)}")
+
+    async def send_text(self, text: str):
+        await self.send_frame([(STREAM_STATUS, text)])
+
+    @property
+    def client_address(self) -> Optional[str]:
+        """The client's address, for the per-address rate limit.
+
+        Behind a proxy this is only the client's own address when uvicorn
+        trusts the proxy's forwarding headers; see ``--forwarded-allow-ips``.
+        """
+        client = self.websocket.client
+        return client.host if client else None
+
+    def is_active(self) -> bool:
+        return self.is_running or bool(self.run_task and not self.run_task.done())
+
+    def detach(self):
+        # The client went away; keep the run going for a grace period
+        self.websocket = None
+        self.grace_task = asyncio.create_task(self.expire_detached())
+        logger.info(f"Session {self.tag} detached, keeping it for {REPLAY_GRACE_SECONDS:g}s")
+
+    async def expire_detached(self):
+        await asyncio.sleep(REPLAY_GRACE_SECONDS)
+        logger.info(f"Session {self.tag} was not resumed in time")
+        if active_connections.get(self.connection_id) is self:
+            del active_connections[self.connection_id]
+            await session_registry.release(self.connection_id, self.owner_token)
+        await self.cleanup()
+
+    async def resume(self, websocket: WebSocket, owner_token: str, last_seq: int, protocol: ProtocolOptions):
+        if self.grace_task and not self.grace_task.done():
+            self.grace_task.cancel()
+        self.grace_task = None
+
+        async with self.send_lock:
+            previous, self.websocket = self.websocket, websocket
+            self.owner_token = owner_token
+            self.set_protocol(protocol)
+            frames, missed = self.replay.since(last_seq)
+            logger.info(f"Resuming session {self.tag}: replaying {len(frames)} frames, {missed} lost")
+            if missed:
+                notice = f"\n** {missed} earlier output frames were dropped **\n"
+                await self.write_frame(websocket, 0, [(STREAM_STATUS, notice)])
+            for seq, segments in frames:
+                await self.write_frame(websocket, seq, segments)
+            if protocol.version < PROTOCOL_V2:
+                await websocket.send_text(sync_marker(self.replay.last_seq))
+
+        # A half-open socket from before the reconnect no longer owns the session
+        if previous and previous is not websocket:
+            try:
+                await previous.close(code=4000)
+            except Exception:
+                pass
+
+    async def send_queue_position(self, position: int):
+        await self.send_text(f"Waiting for a free runner (position {position} in queue)...\n")
+
+    def release_slot(self):
+        if self.holds_slot:
+            self.holds_slot = False
+            scheduler.release()
+
+    async def start_process(self, code: str, args: str = "", bytecode: Optional[bytes] = None,
+                            workspace: Optional[Workspace] = None):
+        try:
+            argv = args.split() if args else []
+            spawn_started = time.monotonic()
+            if self.use_pty:
+                cols, rows = self.window_size
+                self.run_backend = pty_backend
+                self.process = await pty_backend.acquire(code, argv, bytecode, workspace, cols, rows)
+            else:
+                self.run_backend = self.backend
+                self.process = await self.backend.acquire(code, argv, bytecode, workspace)
+            self.unreleased_process = self.process
+            self.run_workspace = workspace
+            metrics.spawn_latency.observe(time.monotonic() - spawn_started, self.run_backend.name)
+            if self.trace:
+                self.trace.mark("spawned", pid=self.process.pid, backend=self.run_backend.name)
 
             self.is_running = True
-            logger.info(f"Started process with PID: {self.process.pid}")
+            if self.credit:
+                self.credit.enforce()
+            self.started_at = time.monotonic()
+            self.sampler = ProcessSampler(self.process.pid) if self.run_backend.samples_locally else None
+            self.limit_reason = None
+            self.output_sent = 0
+            self.run_stats = None
+            self.recording = RunRecording() if self.cache_key else None
+            self.read_input = False
+            logger.debug(f"Started process with PID: {self.process.pid}")
+            if self.compile_warnings:
+                # Python prints these before running a program it compiles itself
+                await self.send_output([("stderr", self.compile_warnings)])
 
             # Start input and output handlers
             self.output_task = asyncio.create_task(self.handle_output())
             self.input_task = asyncio.create_task(self.handle_input())
+            self.watchdog_task = asyncio.create_task(self.watch_process())
 
             return True
         except Exception as e:
             logger.error(f"Error starting process: {str(e)}")
             logger.error(traceback.format_exc())
-            if self.websocket:
-                try:
-                    await self.websocket.send_text(f"\nError starting process: {str(e)}\n")
-                except:
-                    pass
+            try:
+                await self.send_text(f"\nError starting process: {str(e)}\n")
+            except:
+                pass
             return False
 
+    async def send_output(self, segments):
+        if self.limit_reason == REASON_OUTPUT_LIMIT:
+            return
+
+        encoded = [(stream, text.encode('utf-8')) for stream, text in segments]
+        size = sum(len(data) for _, data in encoded)
+        budget = self.limits.output_bytes
+        if budget and self.output_sent + size > budget:
+            # Send what still fits, then stop the run
+            remaining = budget - self.output_sent
+            kept = []
+            for stream, data in encoded:
+                data = data[:remaining]
+                remaining -= len(data)
+                if data:
+                    kept.append((stream, data.decode('utf-8', errors='ignore')))
+            self.output_sent = budget
+            if kept:
+                await self.send_frame(kept)
+            await self.send_text(f"\n** Output limit of {budget} bytes exceeded, output truncated **\n")
+            self.kill_for_limit(REASON_OUTPUT_LIMIT)
+            return
+
+        if self.awaiting_output:
+            self.awaiting_output = False
+            metrics.first_output.observe(time.monotonic() - self.requested_at)
+            if self.trace:
+                self.trace.mark("first_output")
+        for stream, data in encoded:
+            metrics.output_bytes.inc(len(data), stream)
+
+        # Waiting for credit holds up the pipe readers, which pauses the program
+        self.sending_bytes += size
+        try:
+            if self.credit:
+                await self.credit.consume(size)
+            self.output_sent += size
+            await self.send_frame(segments)
+        finally:
+            self.sending_bytes -= size
+        if self.recording:
+            self.recording.add(segments)
+
+    def kill_for_limit(self, reason: str):
+        if self.process and self.process.returncode is None:
+            self.limit_reason = reason
+            logger.info(f"Killing process {self.process.pid}: {reason}")
+            try:
+                self.process.kill()
+            except ProcessLookupError:
+                pass
+            self.suspend_credit()
+
+    async def watch_process(self):
+        # Samples resource usage and enforces the wall-clock limit
+        try:
+            while self.process and self.process.returncode is None:
+                if self.sampler:
+                    self.sampler.sample()
+                elapsed = time.monotonic() - self.started_at
+                if self.limits.wall_seconds and elapsed > self.limits.wall_seconds:
+                    await self.send_text(
+                        f"\n** Time limit of {self.limits.wall_seconds:g}s exceeded **\n"
+                    )
+                    self.kill_for_limit(REASON_WALL_LIMIT)
+                    break
+                await asyncio.sleep(0.25)
+            if self.process and self.process.returncode is not None:
+                self.suspend_credit()
+        except asyncio.CancelledError:
+            raise
+        except Exception as e:
+            logger.error(f"Error in process watchdog: {str(e)}")
+
+    def finish_run(self):
+        returncode = self.process.returncode if self.process else None
+        cpu_seconds = self.sampler.cpu_seconds if self.sampler else None
+        self.run_stats = {
+            "reason": self.limit_reason or termination_reason(returncode, self.limits, cpu_seconds),
+            "exit_code": returncode,
+            "cpu_seconds": cpu_seconds,
+            "peak_rss_kb": self.sampler.peak_rss_kb if self.sampler else None,
+            "wall_seconds": time.monotonic() - self.started_at if self.started_at else None,
+            "output_bytes": self.output_sent,
+        }
+        logger.debug(f"Run finished for connection {self.tag}: {describe_run(self.run_stats)}")
+        self.record_run("process")
+        return self.run_stats
+
     async def handle_output(self):
         if not self.process:
             return
 
+        coalescer = self.coalescer = OutputCoalescer(self.send_output)
         try:
-            while self.is_running and self.process.poll() is None:
-                # Read stdout
-                if self.process.stdout:
-                    try:
-                        # Read all available output
-                        output = self.process.stdout.read(1)
-                        if output:
-                            # Send the output immediately
-                            await self.websocket.send_text(output)
-                            # Force flush the output
-                            await self.websocket.send_text("")
-                    except Exception as e:
-                        logger.error(f"Error reading stdout: {str(e)}")
-                        await self.websocket.send_text(f"\nError reading output: {str(e)}\n")
-
-                # Read stderr
-                if self.process.stderr:
-                    try:
-                        # Read all available error output
-                        error = self.process.stderr.read(1)
-                        if error:
-                            # Send the error immediately
-                            await self.websocket.send_text(error)
-                            # Force flush the error output
-                            await self.websocket.send_text("")
-                    except Exception as e:
-                        logger.error(f"Error reading stderr: {str(e)}")
-                        await self.websocket.send_text(f"\nError reading error output: {str(e)}\n")
-
-                # Small delay to prevent CPU spinning
-                await asyncio.sleep(0.01)
+            # stdout and stderr are drained independently in large chunks;
+            # a terminal merges both into stdout
+            streams = [(self.process.stdout, "stdout"), (self.process.stderr, "stderr")]
+            await asyncio.gather(*(
+                pump_stream(reader, stream, coalescer) for reader, stream in streams if reader
+            ))
+            await self.process.wait()
+            await coalescer.close()
 
         except asyncio.CancelledError:
-            logger.info("Output handler cancelled")
+            logger.debug("Output handler cancelled")
             raise
         except Exception as e:
             logger.error(f"Error in handle_output: {str(e)}")
-            if self.websocket:
-                await self.websocket.send_text(f"\nError in output handler: {str(e)}\n")
+            await self.send_text(f"\nError in output handler: {str(e)}\n")
         finally:
-            if self.websocket:
-                await self.websocket.send_text("\n** Process exited **\n")
+            if self.watchdog_task:
+                self.watchdog_task.cancel()
+            stats = self.finish_run()
+            if self.recording:
+                result_cache.put(self.cache_key, self.recording, stats, self.read_input)
+                self.recording = None
+            try:
+                await self.send_frame([(STREAM_EXIT, stats)])
+            except Exception:
+                pass
             self.is_running = False
+            self.release_slot()
+            await self.release_process()
+            if self.run_workspace:
+                # Files the program wrote would otherwise hold memory until the next run
+                workspace, self.run_workspace = self.run_workspace, None
+                try:
+                    await asyncio.to_thread(workspace.clean)
+                except Exception as e:
+                    logger.warning(f"Error cleaning workspace: {str(e)}")
+            if self.input_task:
+                self.input_task.cancel()
 
     async def handle_input(self):
         if not self.process or not self.process.stdin:
             return
 
         try:
-            while self.is_running and self.process.poll() is None:
+            while self.is_running and self.process.returncode is None:
                 try:
                     # Get input from the queue
                     input_data = await self.stdin_buffer.get()
                     
-                    # Write to stdin
-                    if not input_data.endswith("\n"):
+                    # Write to stdin; a terminal gets keystrokes as typed and
+                    # does its own echo and line editing
+                    if not self.use_pty and not input_data.endswith("\n"):
                         input_data += "\n"
                     
-                    self.process.stdin.write(input_data)
-                    self.process.stdin.flush()
+                    self.process.stdin.write(input_data.encode('utf-8'))
+                    await self.process.stdin.drain()
+                    self.read_input = True
                 
                 except asyncio.CancelledError:
                     raise
                 except Exception as e:
                     logger.error(f"Error writing to stdin: {str(e)}")
-                    if self.websocket:
-                        await self.websocket.send_text(f"\nError writing input: {str(e)}\n")
+                    await self.send_text(f"\nError writing input: {str(e)}\n")
                     break
 
         except asyncio.CancelledError:
-            logger.info("Input handler cancelled")
+            logger.debug("Input handler cancelled")
             raise
         except Exception as e:
             logger.error(f"Error in handle_input: {str(e)}")
-            if self.websocket:
-                await self.websocket.send_text(f"\nError in input handler: {str(e)}\n")
+            await self.send_text(f"\nError in input handler: {str(e)}\n")
+
+    def resize(self, cols: int, rows: int):
+        if cols <= 0 or rows <= 0:
+            return
+        self.window_size = (cols, rows)
+        if self.use_pty and self.is_running and self.process:
+            try:
+                self.process.resize(cols, rows)
+            except OSError as e:
+                logger.debug(f"Could not resize terminal: {str(e)}")
 
     async def send_input(self, input_data: str):
         if self.is_running and self.process and self.process.stdin:
@@ -249,10 +761,17 @@ class ProcessManager:
                 await self.stdin_buffer.put(input_data)
             except Exception as e:
                 logger.error(f"Error queueing input: {str(e)}")
-                if self.websocket:
-                    await self.websocket.send_text(f"\nError sending input: {str(e)}\n")
+                await self.send_text(f"\nError sending input: {str(e)}\n")
+
+    async def stop_process(self, grace: float = 2.0):
+        if self.run_task and not self.run_task.done():
+            # Still waiting in the scheduler queue or spawning
+            self.run_task.cancel()
+            try:
+                await self.run_task
+            except (asyncio.CancelledError, Exception):
+                pass
 
-    async def stop_process(self):
         if self.process:
             try:
                 # Cancel input/output tasks
@@ -260,63 +779,119 @@ class ProcessManager:
                     self.output_task.cancel()
                 if self.input_task:
                     self.input_task.cancel()
+                if self.watchdog_task:
+                    self.watchdog_task.cancel()
 
-                # Terminate the process
-                self.process.terminate()
-                try:
-                    self.process.wait(timeout=2.0)
-                except subprocess.TimeoutExpired:
-                    self.process.kill()
-                    self.process.wait()
+                # Terminate the process without blocking the event loop
+                if self.process.returncode is None:
+                    self.process.terminate()
+                    try:
+                        await asyncio.wait_for(self.process.wait(), timeout=grace)
+                    except asyncio.TimeoutError:
+                        self.process.kill()
+                        await self.process.wait()
+
+                # Let the handlers unwind before a new run reuses this manager
+                handlers = [task for task in (self.output_task, self.input_task, self.watchdog_task) if task]
+                await asyncio.gather(*handlers, return_exceptions=True)
 
                 self.is_running = False
-                logger.info("Process stopped")
+                logger.debug("Process stopped")
+            except ProcessLookupError:
+                self.is_running = False
             except Exception as e:
                 logger.error(f"Error stopping process: {str(e)}")
-                if self.websocket:
-                    try:
-                        await self.websocket.send_text(f"\nError stopping process: {str(e)}\n")
-                    except:
-                        pass
+                try:
+                    await self.send_text(f"\nError stopping process: {str(e)}\n")
+                except:
+                    pass
 
-    async def cleanup(self):
-        await self.stop_process()
+        self.release_slot()
+        await self.release_process()
+
+    async def release_process(self):
+        # Hand the finished process back so the backend can clean up after it
+        process, self.unreleased_process = self.unreleased_process, None
+        if process:
+            try:
+                await self.run_backend.release(process)
+            except Exception as e:
+                logger.error(f"Error releasing process: {str(e)}")
+
+    async def close_for_restart(self, notice: str = "\n** This server is restarting, reconnecting... **\n"):
+        # The client reconnects, and the load balancer sends it to another server
+        websocket = self.websocket
+        if websocket is None:
+            return
+        await self.send_text(notice)
+        self.websocket = None
+        try:
+            await websocket.close(code=CLOSE_SERVICE_RESTART)
+        except Exception:
+            pass
+
+    async def cleanup(self, grace: float = 2.0):
+        if self.grace_task and self.grace_task is not asyncio.current_task():
+            self.grace_task.cancel()
+        await self.stop_process(grace)
         if self.process:
             try:
-                if self.process.stdout:
-                    self.process.stdout.close()
-                if self.process.stderr:
-                    self.process.stderr.close()
                 if self.process.stdin:
                     self.process.stdin.close()
             except Exception as e:
                 logger.error(f"Error during cleanup: {str(e)}")
-        
-        # Clean up temporary file
-        if self.temp_file and os.path.exists(self.temp_file):
-            try:
-                os.unlink(self.temp_file)
-                self.temp_file = None
-            except Exception as e:
-                logger.error(f"Error removing temp file: {str(e)}")
+        if self.workspace:
+            workspace, self.workspace = self.workspace, None
+            await asyncio.to_thread(workspace.remove)
+
+# Message types clients may send; metrics label any other as "unknown"
+CLIENT_MESSAGE_TYPES = ("execute", "project", "input", "credit", "resize")
 
 @app.websocket("/ws/terminal")
 async def websocket_endpoint(websocket: WebSocket):
     connection_id = websocket.query_params.get("connectionId", str(uuid.uuid4()))
+    tag = session_tag(connection_id)
+    # Sent by clients that reconnect and want to resume their session
+    last_seq = websocket.query_params.get("lastSeq")
+    # Clients that send no protocol parameters keep speaking version 1
+    protocol = ProtocolOptions.negotiate(websocket.query_params)
     
     try:
         await websocket.accept()
-        logger.info(f"WebSocket connection accepted: {connection_id}")
-        
-        # Clean up old connection if it exists
-        if connection_id in active_connections:
-            old_manager = active_connections[connection_id]
-            await old_manager.stop_process()
-            del active_connections[connection_id]
+        if not lifecycle.accepting and not (last_seq and connection_id in active_connections):
+            # Only sessions already running here may reattach while draining
+            await websocket.close(code=CLOSE_TRY_AGAIN_LATER)
+            return
+        logger.info(f"WebSocket connection accepted: {tag}")
+        metrics.websocket_connections.inc()
+        if protocol.version >= PROTOCOL_V2:
+            await websocket.send_text(protocol.welcome())
+
+        # Claim the session; if another worker still runs it, that worker
+        # stops it when its registry watch sees the new owner
+        owner_token = new_owner_token()
+        previous_owner = await session_registry.claim(connection_id, owner_token)
+        if previous_owner and owner_worker(previous_owner) != WORKER_ID:
+            logger.info(f"Session {tag} moved here from {owner_worker(previous_owner)}")
         
-        # Create new process manager
-        manager = ProcessManager(websocket)
-        active_connections[connection_id] = manager
+        old_manager = active_connections.get(connection_id)
+        if old_manager and last_seq is not None and last_seq.isdigit():
+            # Reattach to the session, replaying what the client missed
+            manager = old_manager
+            await manager.resume(websocket, owner_token, int(last_seq), protocol)
+        else:
+            # Clean up old connection if it exists
+            if old_manager:
+                del active_connections[connection_id]
+                await old_manager.cleanup()
+            
+            # Create new process manager
+            manager = ProcessManager(websocket, connection_id, owner_token)
+            manager.set_protocol(protocol)
+            active_connections[connection_id] = manager
+            if last_seq is not None and protocol.version < PROTOCOL_V2:
+                # Nothing left to resume; restart the client's frame count
+                await websocket.send_text(sync_marker(0))
         
         try:
             while True:
@@ -324,21 +899,35 @@ async def websocket_endpoint(websocket: WebSocket):
                     data = await websocket.receive_text()
                     message = json.loads(data)
                     
-                    if message["type"] == "execute":
-                        logger.info(f"Received execute request for connection {connection_id}")
-                        success = await manager.start_process(message["code"], message.get("args", ""))
-                        if not success:
-                            await websocket.send_text("\nError: Failed to start process\n")
+                    message_type = message.get("type") if isinstance(message, dict) else None
+                    # Clients choose the type, so anything else shares one label
+                    metrics.websocket_messages.inc(
+                        1, message_type if message_type in CLIENT_MESSAGE_TYPES else "unknown"
+                    )
+                    if message["type"] in ("execute", "project") and not lifecycle.accepting:
+                        await manager.close_for_restart(
+                            "\n** This server is restarting; run your code again once reconnected **\n"
+                        )
+                    elif message["type"] == "execute":
+                        logger.debug(f"Received execute request for connection {tag}")
+                        await manager.execute(message["code"], message.get("args", ""), message.get("pty", False))
+                    elif message["type"] == "project":
+                        logger.debug(f"Received project run request for connection {tag}")
+                        await manager.execute(None, message.get("args", ""), message.get("pty", False), message)
                     elif message["type"] == "input":
-                        logger.info(f"Received input for connection {connection_id}")
+                        logger.debug(f"Received input for connection {tag}")
                         await manager.send_input(message["input"])
+                    elif message["type"] == "credit":
+                        manager.grant_credit(int(message["bytes"]))
+                    elif message["type"] == "resize":
+                        manager.resize(int(message["cols"]), int(message["rows"]))
                     else:
                         logger.warning(f"Unknown message type received: {message.get('type')}")
-                        await websocket.send_text("\nError: Unknown message type\n")
+                        await manager.send_text("\nError: Unknown message type\n")
                 except json.JSONDecodeError as e:
                     logger.error(f"JSON decode error: {str(e)}")
                     try:
-                        await websocket.send_text(f"\nError: Invalid message format - {str(e)}\n")
+                        await manager.send_text(f"\nError: Invalid message format - {str(e)}\n")
                     except:
                         pass
                 except WebSocketDisconnect:
@@ -347,33 +936,102 @@ async def websocket_endpoint(websocket: WebSocket):
                     logger.error(f"Error processing message: {str(e)}")
                     logger.error(traceback.format_exc())
                     try:
-                        await websocket.send_text(f"\nError: {str(e)}\n")
+                        await manager.send_text(f"\nError: {str(e)}\n")
                     except:
                         pass
                 
         except WebSocketDisconnect:
-            logger.info(f"WebSocket disconnected: {connection_id}")
+            logger.info(f"WebSocket disconnected: {tag}")
         except Exception as e:
             logger.error(f"Error in websocket connection: {str(e)}")
             logger.error(traceback.format_exc())
         finally:
-            if connection_id in active_connections:
-                manager = active_connections[connection_id]
+            if manager.owner_token != owner_token:
+                # A reconnect resumed this session and owns it now
+                pass
+            elif active_connections.get(connection_id) is manager and manager.is_active() and REPLAY_GRACE_SECONDS > 0:
+                manager.detach()
+            else:
+                # A reconnect may already have replaced this manager
+                if active_connections.get(connection_id) is manager:
+                    del active_connections[connection_id]
+                    await session_registry.release(connection_id, owner_token)
                 await manager.cleanup()
-                del active_connections[connection_id]
     except Exception as e:
         logger.error(f"Error in websocket endpoint: {str(e)}")
         logger.error(traceback.format_exc())
 
-@app.on_event("shutdown")
-async def shutdown_event():
-    # Clean up all active connections
-    for connection_id, manager in list(active_connections.items()):
+def local_sessions() -> Dict[str, str]:
+    return {connection_id: manager.owner_token for connection_id, manager in active_connections.items()}
+
+async def session_lost(connection_id: str, owner_token: str):
+    manager = active_connections.get(connection_id)
+    if not manager or manager.owner_token != owner_token:
+        return
+    del active_connections[connection_id]
+    await manager.cleanup()
+    await manager.send_text("\n** Session resumed on another connection, this run was stopped **\n")
+
+@app.on_event("startup")
+async def startup_event():
+    global session_watch_task, loop_lag_task
+    loop_lag_task = asyncio.create_task(metrics.monitor_loop_lag())
+    static_assets.load()
+    execution_backend.start()
+    if pty_backend:
+        pty_backend.start()
+    session_watch_task = asyncio.create_task(session_registry.watch(local_sessions, session_lost))
+    if DRAIN_ON_SIGTERM:
+        install_drain_signal_handler()
+
+async def drain(timeout: Optional[float] = None):
+    # Stop taking runs, send idle clients elsewhere and give running
+    # programs until the deadline before stopping them
+    if lifecycle.begin_drain(timeout):
+        logger.info(f"Draining {len(active_connections)} sessions, deadline {lifecycle.remaining():g}s")
+    while lifecycle.remaining() > 0:
+        managers = list(active_connections.values())
+        for manager in managers:
+            if not manager.is_active():
+                await manager.close_for_restart()
+        if not any(manager.is_active() for manager in managers):
+            break
+        await asyncio.sleep(0.2)
+    await stop_all_sessions()
+
+async def stop_all_sessions():
+    lifecycle.begin_stop()
+    sessions = list(active_connections.items())
+    active_connections.clear()
+    if sessions:
+        logger.info(f"Stopping {len(sessions)} sessions")
+
+    async def stop(connection_id: str, manager: ProcessManager):
         try:
-            await manager.cleanup()
+            await manager.cleanup(DRAIN_KILL_GRACE)
+            await manager.close_for_restart()
+            await session_registry.release(connection_id, manager.owner_token)
         except Exception as e:
-            logger.error(f"Error cleaning up connection {connection_id}: {str(e)}")
-    active_connections.clear()
+            logger.error(f"Error cleaning up connection {session_tag(connection_id)}: {str(e)}")
+
+    # Concurrently, so shutdown takes one kill grace period rather than one per session
+    await asyncio.gather(*(stop(connection_id, manager) for connection_id, manager in sessions))
+
+@app.on_event("shutdown")
+async def shutdown_event():
+    if drain_task:
+        await drain_task
+    else:
+        # Not drained first (e.g. Ctrl-C): stop runs right away
+        await stop_all_sessions()
+    if session_watch_task:
+        session_watch_task.cancel()
+    if loop_lag_task:
+        loop_lag_task.cancel()
+    await session_registry.close()
+    await execution_backend.close()
+    if pty_backend:
+        await pty_backend.close()
 
 if __name__ == "__main__":
     import uvicorn
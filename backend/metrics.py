@@ -0,0 +1,200 @@
+"""In-process metrics in the Prometheus text exposition format.
+
+Instruments are plain objects updated on the hot path with a dict lookup and
+an addition; rendering happens only when ``/metrics`` is scraped. Values are
+per server worker, so scrape every worker (or label them by instance).
+"""
+import asyncio
+import bisect
+import logging
+import math
+import os
+import time
+from typing import Callable, Dict, Iterable, List, Optional, Sequence, Tuple
+
+logger = logging.getLogger(__name__)
+
+METRICS_PREFIX = os.getenv("METRICS_PREFIX", "editor")
+LOOP_LAG_INTERVAL = float(os.getenv("LOOP_LAG_INTERVAL", 0.5))
+
+LATENCY_BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+DURATION_BUCKETS = (0.01, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0, 300.0)
+
+LabelValues = Tuple[str, ...]
+
+
+def _format_value(value: float) -> str:
+    if value == math.inf:
+        return "+Inf"
+    if float(value).is_integer():
+        return str(int(value))
+    return repr(float(value))
+
+
+def _escape(value: str) -> str:
+    return value.replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
+
+
+def _format_labels(names: Sequence[str], values: Sequence[str], extra: str = "") -> str:
+    pairs = [f'{name}="{_escape(str(value))}"' for name, value in zip(names, values)]
+    if extra:
+        pairs.append(extra)
+    return "{" + ",".join(pairs) + "}" if pairs else ""
+
+
+class _Metric:
+    kind = "untyped"
+
+    def __init__(self, name: str, documentation: str, labels: Sequence[str] = ()):
+        self.name = f"{METRICS_PREFIX}_{name}"
+        self.documentation = documentation
+        self.label_names = tuple(labels)
+
+    def header(self) -> List[str]:
+        return [f"# HELP {self.name} {self.documentation}", f"# TYPE {self.name} {self.kind}"]
+
+    def render(self) -> List[str]:
+        raise NotImplementedError
+
+
+class Counter(_Metric):
+    kind = "counter"
+
+    def __init__(self, name: str, documentation: str, labels: Sequence[str] = ()):
+        super().__init__(name, documentation, labels)
+        self._values: Dict[LabelValues, float] = {}
+
+    def inc(self, amount: float = 1.0, *labels: str):
+        self._values[labels] = self._values.get(labels, 0.0) + amount
+
+    def value(self, *labels: str) -> float:
+        return self._values.get(labels, 0.0)
+
+    def render(self) -> List[str]:
+        lines = self.header()
+        for labels, value in sorted(self._values.items()):
+            lines.append(f"{self.name}{_format_labels(self.label_names, labels)} {_format_value(value)}")
+        return lines
+
+
+class Gauge(_Metric):
+    """A value that is set directly or read from ``callback`` at scrape time."""
+
+    kind = "gauge"
+
+    def __init__(self, name: str, documentation: str, callback: Optional[Callable[[], float]] = None):
+        super().__init__(name, documentation)
+        self.callback = callback
+        self._value = 0.0
+
+    def set(self, value: float):
+        self._value = value
+
+    def value(self) -> float:
+        if self.callback:
+            try:
+                return float(self.callback())
+            except Exception as e:
+                logger.error(f"Error reading gauge {self.name}: {str(e)}")
+                return math.nan
+        return self._value
+
+    def render(self) -> List[str]:
+        return self.header() + [f"{self.name} {_format_value(self.value())}"]
+
+
+class Histogram(_Metric):
+    kind = "histogram"
+
+    def __init__(self, name: str, documentation: str, buckets: Sequence[float] = LATENCY_BUCKETS,
+                 labels: Sequence[str] = ()):
+        super().__init__(name, documentation, labels)
+        self.buckets = tuple(sorted(buckets))
+        self._counts: Dict[LabelValues, List[int]] = {}
+        self._sums: Dict[LabelValues, float] = {}
+
+    def observe(self, value: float, *labels: str):
+        counts = self._counts.get(labels)
+        if counts is None:
+            counts = self._counts[labels] = [0] * (len(self.buckets) + 1)
+            self._sums[labels] = 0.0
+        # Counts are stored per bucket and made cumulative when rendered
+        counts[bisect.bisect_left(self.buckets, value)] += 1
+        self._sums[labels] += value
+
+    def count(self, *labels: str) -> int:
+        return sum(self._counts.get(labels, ()))
+
+    def render(self) -> List[str]:
+        lines = self.header()
+        for labels, counts in sorted(self._counts.items()):
+            cumulative = 0
+            for bound, count in zip(self.buckets + (math.inf,), counts):
+                cumulative += count
+                bucket_labels = _format_labels(self.label_names, labels, f'le="{_format_value(bound)}"')
+                lines.append(f"{self.name}_bucket{bucket_labels} {cumulative}")
+            plain = _format_labels(self.label_names, labels)
+            lines.append(f"{self.name}_sum{plain} {_format_value(self._sums[labels])}")
+            lines.append(f"{self.name}_count{plain} {cumulative}")
+        return lines
+
+
+class MetricsRegistry:
+    def __init__(self):
+        self._metrics: List[_Metric] = []
+
+    def register(self, metric: _Metric) -> _Metric:
+        self._metrics.append(metric)
+        return metric
+
+    def counter(self, name: str, documentation: str, labels: Sequence[str] = ()) -> Counter:
+        return self.register(Counter(name, documentation, labels))
+
+    def gauge(self, name: str, documentation: str, callback: Optional[Callable[[], float]] = None) -> Gauge:
+        return self.register(Gauge(name, documentation, callback))
+
+    def histogram(self, name: str, documentation: str, buckets: Sequence[float] = LATENCY_BUCKETS,
+                  labels: Sequence[str] = ()) -> Histogram:
+        return self.register(Histogram(name, documentation, buckets, labels))
+
+    def render(self, metrics: Optional[Iterable[_Metric]] = None) -> str:
+        lines = []
+        for metric in metrics or self._metrics:
+            lines.extend(metric.render())
+        return "\n".join(lines) + "\n"
+
+
+registry = MetricsRegistry()
+
+websocket_connections = registry.counter("websocket_connections_total", "WebSocket connections accepted")
+websocket_messages = registry.counter("websocket_messages_total", "Client messages received, by type", ["type"])
+runs = registry.counter(
+    "runs_total", "Finished runs by how they ended and what served them", ["reason", "source"]
+)
+run_duration = registry.histogram("run_duration_seconds", "Wall-clock time of runs", DURATION_BUCKETS)
+queue_wait = registry.histogram("queue_wait_seconds", "Time runs waited for a free slot", DURATION_BUCKETS)
+spawn_latency = registry.histogram(
+    "spawn_seconds", "Time to get a running interpreter from the backend", LATENCY_BUCKETS, ["backend"]
+)
+first_output = registry.histogram(
+    "time_to_first_output_seconds", "Time from a run being requested, before any queueing, to its first output frame", DURATION_BUCKETS
+)
+output_bytes = registry.counter("output_bytes_total", "Program output sent to clients, in UTF-8 bytes", ["stream"])
+frame_send = registry.histogram("frame_send_seconds", "Time spent writing one frame to a WebSocket")
+workspace_syncs = registry.counter(
+    "workspace_syncs_total", "Project uploads: whole projects, changes only, or changes against a stale version",
+    ["kind"]
+)
+workspace_bytes = registry.counter("workspace_bytes_written_total", "Project file bytes written to workspaces")
+loop_lag = registry.histogram("event_loop_lag_seconds", "How late the event loop ran a timer")
+loop_lag_last = registry.gauge("event_loop_lag_last_seconds", "Most recent event loop lag measurement")
+
+
+async def monitor_loop_lag(interval: float = LOOP_LAG_INTERVAL):
+    # A timer firing late means callbacks ahead of it hogged the loop
+    while True:
+        expected = time.monotonic() + interval
+        await asyncio.sleep(interval)
+        lag = max(0.0, time.monotonic() - expected)
+        loop_lag.observe(lag)
+        loop_lag_last.set(lag)
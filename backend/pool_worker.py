@@ -0,0 +1,104 @@
+"""Bootstrap for pre-warmed interpreter pool workers.
+
+The worker finishes interpreter and site initialisation, writes a single
+READY byte to stdout, then blocks on stdin for one job: a JSON header line
+followed by ``size`` bytes of source and, optionally, ``bytecode`` bytes of
+the marshalled code object compiled by the server. The bytecode is used when
+its ``magic`` matches this interpreter's, so the source is not parsed again;
+the source is still needed for tracebacks. The job runs as ``__main__`` in a fresh
+module and the process exits afterwards, so nothing survives into the next
+run. Whatever is left on stdin after the source belongs to the user program.
+
+Project runs name the entry file relative to a ``cwd`` holding the project,
+which the worker changes into. When the project is not on the worker's
+filesystem the header lists ``files`` instead, as ``[name, size]`` pairs whose
+contents follow the job, and the worker unpacks them into a fresh folder.
+
+With ``--job-fd N`` the job is read from file descriptor N instead and no
+READY byte is written; this is how programs attached to a pseudo-terminal
+are started, since the terminal would mangle a job written to it.
+"""
+import importlib.util
+import json
+import linecache
+import marshal
+import os
+import sys
+import tempfile
+import traceback
+import types
+
+READY = b"\x06"
+
+
+def read_job(stream):
+    header = stream.readline()
+    if not header:
+        sys.exit(0)
+    job = json.loads(header)
+    source = stream.read(job["size"]).decode("utf-8")
+    bytecode = stream.read(job["bytecode"]) if job.get("bytecode") else None
+    if job.get("files"):
+        job["cwd"] = unpack_files(stream, job["files"])
+    return job, source, bytecode
+
+
+def unpack_files(stream, files):
+    root = tempfile.mkdtemp(prefix="project-")
+    for name, size in files:
+        path = os.path.join(root, *name.split("/"))
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        with open(path, "wb") as f:
+            f.write(stream.read(size))
+    return root
+
+
+def load_code(job, source, bytecode):
+    if bytecode is not None and job.get("magic") == importlib.util.MAGIC_NUMBER.hex():
+        return marshal.loads(bytecode)
+    return compile(source, job["filename"], "exec")
+
+
+def run(job, source, bytecode=None):
+    filename = job["filename"]
+    sys.argv = [filename] + job.get("argv", [])
+    if job.get("cwd"):
+        os.chdir(job["cwd"])
+        sys.path[0] = os.path.dirname(os.path.join(job["cwd"], filename))
+    else:
+        sys.path[0] = job.get("path", "")
+
+    # Register the source so tracebacks can show the offending lines
+    linecache.cache[filename] = (len(source), None, source.splitlines(True), filename)
+
+    module = types.ModuleType("__main__")
+    module.__file__ = filename
+    module.__builtins__ = __builtins__
+    sys.modules["__main__"] = module
+
+    try:
+        code = load_code(job, source, bytecode)
+    except (SyntaxError, ValueError, MemoryError, RecursionError, OverflowError) as e:
+        # Reported without a traceback, as for `python <file>`
+        sys.stderr.write("".join(traceback.format_exception_only(type(e), e)))
+        sys.exit(1)
+
+    try:
+        exec(code, module.__dict__)
+    except SystemExit:
+        raise
+    except BaseException as e:
+        # Drop this bootstrap frame so the traceback matches a plain run
+        traceback.print_exception(type(e), e, e.__traceback__.tb_next)
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    if len(sys.argv) == 3 and sys.argv[1] == "--job-fd":
+        with os.fdopen(int(sys.argv[2]), "rb") as job_stream:
+            job = read_job(job_stream)
+        run(*job)
+    else:
+        sys.stdout.buffer.write(READY)
+        sys.stdout.buffer.flush()
+        run(*read_job(sys.stdin.buffer))
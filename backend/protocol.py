@@ -0,0 +1,181 @@
+"""Wire protocol between the terminal client and ProcessManager.
+
+Version 1 is what the original frontend speaks: JSON text messages from the
+client and plain text frames back, written straight to the terminal.
+
+Version 2 is negotiated with query parameters on connect, e.g.
+``/ws/terminal?protocol=2&compression=deflate&window=262144``, and is
+confirmed by a JSON ``welcome`` text frame. Client messages stay JSON; the
+server sends output as binary batch frames::
+
+    frame  := flags:u8 seq:u32 body          (body raw-deflated if flags & 1)
+    body   := record*
+    record := stream:u8 length:u32 payload   (payload is UTF-8)
+
+``seq`` numbers frames for resuming a session (0 means unsequenced). The
+exit record's payload is a JSON object describing the run. The client
+grants output credit with ``{"type": "credit", "bytes": n}`` as it
+consumes frames; without credit the server stops reading the program's
+output pipes until more arrives. After applying a project message the
+server reports the workspace version in a ``{"type": "workspace"}`` text
+frame.
+"""
+import asyncio
+import json
+import os
+import struct
+import zlib
+from typing import Dict, List, Mapping, Tuple, Union
+
+from limits import describe_run
+
+PROTOCOL_V1 = 1
+PROTOCOL_V2 = 2
+SUPPORTED_PROTOCOLS = (PROTOCOL_V1, PROTOCOL_V2)
+
+PROTOCOL_DEFAULT_WINDOW = int(os.getenv("PROTOCOL_DEFAULT_WINDOW", 256 * 1024))
+PROTOCOL_MAX_WINDOW = int(os.getenv("PROTOCOL_MAX_WINDOW", 4 * 1024 * 1024))
+# Bodies smaller than this are not worth compressing
+PROTOCOL_COMPRESS_MIN = int(os.getenv("PROTOCOL_COMPRESS_MIN", 512))
+
+STREAM_STDOUT = "stdout"
+STREAM_STDERR = "stderr"
+STREAM_EXIT = "exit"
+STREAM_STATUS = "status"
+STREAM_IDS = {STREAM_STDOUT: 1, STREAM_STDERR: 2, STREAM_EXIT: 3, STREAM_STATUS: 4}
+STREAM_NAMES = {value: name for name, value in STREAM_IDS.items()}
+
+FLAG_DEFLATE = 0x01
+FRAME_HEADER = struct.Struct(">BI")
+RECORD_HEADER = struct.Struct(">BI")
+
+Segment = Tuple[str, Union[str, Dict]]
+
+
+class ProtocolOptions:
+    def __init__(self, version: int = PROTOCOL_V1, compression: bool = False, window: int = 0):
+        self.version = version
+        self.compression = compression
+        self.window = window
+
+    @classmethod
+    def negotiate(cls, params: Mapping[str, str]) -> "ProtocolOptions":
+        try:
+            version = int(params.get("protocol", PROTOCOL_V1))
+        except ValueError:
+            version = PROTOCOL_V1
+        if version not in SUPPORTED_PROTOCOLS or version == PROTOCOL_V1:
+            return cls()
+
+        compression = "deflate" in params.get("compression", "").split(",")
+        try:
+            window = int(params.get("window", PROTOCOL_DEFAULT_WINDOW))
+        except ValueError:
+            window = PROTOCOL_DEFAULT_WINDOW
+        window = max(1, min(window, PROTOCOL_MAX_WINDOW))
+        return cls(version, compression, window)
+
+    def welcome(self) -> str:
+        return json.dumps({
+            "type": "welcome",
+            "protocol": self.version,
+            "compression": "deflate" if self.compression else None,
+            "window": self.window,
+        })
+
+
+def segment_size(segment: Segment) -> int:
+    _, payload = segment
+    return len(payload) if isinstance(payload, str) else 64
+
+
+def encode_v1(segments: List[Segment]) -> str:
+    parts = []
+    for stream, payload in segments:
+        if stream == STREAM_EXIT:
+            parts.append(f"\n** Process exited ({describe_run(payload)}) **\n")
+        else:
+            parts.append(payload)
+    return "".join(parts)
+
+
+def encode_v2(seq: int, segments: List[Segment], compression: bool = False) -> bytes:
+    records = []
+    for stream, payload in segments:
+        data = json.dumps(payload) if stream == STREAM_EXIT else payload
+        data = data.encode("utf-8")
+        records.append(RECORD_HEADER.pack(STREAM_IDS[stream], len(data)))
+        records.append(data)
+    body = b"".join(records)
+
+    flags = 0
+    if compression and len(body) >= PROTOCOL_COMPRESS_MIN:
+        compressor = zlib.compressobj(6, zlib.DEFLATED, -zlib.MAX_WBITS)
+        compressed = compressor.compress(body) + compressor.flush()
+        if len(compressed) < len(body):
+            body = compressed
+            flags |= FLAG_DEFLATE
+    return FRAME_HEADER.pack(flags, seq) + body
+
+
+def decode_v2(frame: bytes) -> Tuple[int, List[Segment]]:
+    flags, seq = FRAME_HEADER.unpack_from(frame)
+    body = frame[FRAME_HEADER.size:]
+    if flags & FLAG_DEFLATE:
+        body = zlib.decompress(body, -zlib.MAX_WBITS)
+
+    segments = []
+    offset = 0
+    while offset < len(body):
+        stream_id, length = RECORD_HEADER.unpack_from(body, offset)
+        offset += RECORD_HEADER.size
+        payload = body[offset:offset + length].decode("utf-8")
+        offset += length
+        stream = STREAM_NAMES[stream_id]
+        segments.append((stream, json.loads(payload) if stream == STREAM_EXIT else payload))
+    return seq, segments
+
+
+class CreditWindow:
+    """Output credit granted by a version 2 client, in bytes.
+
+    ``consume`` waits while no credit is left. A frame may overdraw the
+    window once so frames never have to be split. While ``suspend``-ed,
+    consuming never waits, so output left over from a program that has
+    already ended is not held back by a client that stopped granting.
+    """
+
+    def __init__(self, credits: int):
+        self.credits = credits
+        self.suspended = False
+        self._available = asyncio.Event()
+        if credits > 0:
+            self._available.set()
+
+    async def consume(self, amount: int):
+        while self.credits <= 0 and not self.suspended:
+            await self._available.wait()
+        self.credits -= amount
+        if self.credits <= 0 and not self.suspended:
+            self._available.clear()
+
+    def grant(self, amount: int):
+        self.credits += amount
+        if self.credits > 0:
+            self._available.set()
+
+    def reset(self, credits: int):
+        self.credits = 0
+        self._available.clear()
+        self.grant(credits)
+        if self.suspended:
+            self._available.set()
+
+    def suspend(self):
+        self.suspended = True
+        self._available.set()
+
+    def enforce(self):
+        self.suspended = False
+        if self.credits <= 0:
+            self._available.clear()
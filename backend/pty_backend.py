@@ -0,0 +1,223 @@
+import asyncio
+import logging
+import os
+import struct
+import sys
+from typing import Callable, Dict, List, Optional
+
+from backends import ExecutionBackend
+from interpreter_pool import (
+    INTERPRETER_POOL_REFILL_RATE, INTERPRETER_POOL_TTL, WORKER_SCRIPT, InterpreterPool, encode_job, worker_env
+)
+from workspace import Workspace
+
+logger = logging.getLogger(__name__)
+
+# Runs asking for a terminal get one when the host supports it; otherwise they use pipes
+PTY_ENABLED = os.getenv("PTY_ENABLED", "true").lower() in ("1", "true", "yes")
+PTY_TERM = os.getenv("PTY_TERM", "xterm-256color")
+# Interpreters kept started on a terminal, waiting for a job; 0 starts one per run
+PTY_POOL_SIZE = int(os.getenv("PTY_POOL_SIZE", 2))
+PTY_DEFAULT_COLS = 80
+PTY_DEFAULT_ROWS = 24
+
+try:
+    import fcntl
+    import pty
+    import termios
+    PTY_SUPPORTED = True
+except ImportError:
+    PTY_SUPPORTED = False
+
+
+def set_window_size(fd: int, cols: int, rows: int):
+    # The kernel sends SIGWINCH to the terminal's foreground process group
+    fcntl.ioctl(fd, termios.TIOCSWINSZ, struct.pack("HHHH", rows, cols, 0, 0))
+
+
+class PtyProcess:
+    """A child interpreter attached to a pseudo-terminal.
+
+    Looks like an ``asyncio.subprocess.Process`` to ProcessManager: ``stdout``
+    reads raw bytes from the terminal master, ``stdin`` writes keystrokes to
+    it and ``stderr`` is None because the terminal merges both streams.
+    """
+
+    def __init__(self, process: asyncio.subprocess.Process, read_transport,
+                 stdin: asyncio.StreamWriter, stdout: asyncio.StreamReader):
+        self._process = process
+        self._read_transport = read_transport
+        self.stdin = stdin
+        self.stdout = stdout
+        self.stderr = None
+
+    @property
+    def pid(self) -> int:
+        return self._process.pid
+
+    @property
+    def returncode(self) -> Optional[int]:
+        return self._process.returncode
+
+    async def wait(self) -> int:
+        return await self._process.wait()
+
+    def terminate(self):
+        self._process.terminate()
+
+    def kill(self):
+        self._process.kill()
+
+    def resize(self, cols: int, rows: int):
+        # The writer's descriptor stays open after the reader hits EIO
+        set_window_size(self.stdin.transport.get_extra_info("pipe").fileno(), cols, rows)
+
+    def close(self):
+        self.stdin.close()
+        self._read_transport.close()
+
+
+class _IdleTerminal:
+    """A pool worker started on a pseudo-terminal, blocked reading its job pipe."""
+
+    def __init__(self, process: asyncio.subprocess.Process, master_fd: int, job_fd: int):
+        self.process = process
+        self.master_fd: Optional[int] = master_fd
+        self.job_fd: Optional[int] = job_fd
+
+    @property
+    def returncode(self) -> Optional[int]:
+        return self.process.returncode
+
+    async def wait(self) -> int:
+        return await self.process.wait()
+
+    def kill(self):
+        try:
+            self.process.kill()
+        except ProcessLookupError:
+            pass
+        self.close()
+
+    def close(self):
+        for fd in (self.master_fd, self.job_fd):
+            if fd is not None:
+                os.close(fd)
+        self.master_fd = self.job_fd = None
+
+
+class PtyBackend(ExecutionBackend):
+    """Runs code on this host with a pseudo-terminal as its stdin/stdout/stderr.
+
+    The terminal's line discipline provides echo, line editing, Ctrl-C and a
+    window size, so keystrokes are forwarded as typed. Interpreters are
+    started ahead of time, each on its own terminal, and kept in a pool like
+    the pipe backend's; the job reaches the pool worker bootstrap through a
+    separate pipe since anything written to the terminal is input.
+    """
+
+    name = "pty"
+
+    def __init__(self, preexec_fn: Optional[Callable[[], None]] = None, size: int = PTY_POOL_SIZE):
+        self.preexec_fn = preexec_fn
+        self.pool = InterpreterPool(
+            size, INTERPRETER_POOL_TTL, INTERPRETER_POOL_REFILL_RATE, preexec_fn, spawn=self._spawn
+        )
+        self.runs = 0
+
+    def start(self):
+        self.pool.start()
+
+    def _child_setup(self):
+        # start_new_session made the child a session leader; adopt the
+        # terminal as its controlling tty so Ctrl-C and SIGWINCH reach it
+        fcntl.ioctl(0, termios.TIOCSCTTY, 0)
+        if self.preexec_fn:
+            self.preexec_fn()
+
+    async def _spawn(self) -> _IdleTerminal:
+        master_fd, slave_fd = pty.openpty()
+        job_read, job_write = os.pipe()
+        try:
+            set_window_size(master_fd, PTY_DEFAULT_COLS, PTY_DEFAULT_ROWS)
+            env = worker_env()
+            env["TERM"] = PTY_TERM
+            process = await asyncio.create_subprocess_exec(
+                sys.executable, "-u", WORKER_SCRIPT, "--job-fd", str(job_read),
+                stdin=slave_fd,
+                stdout=slave_fd,
+                stderr=slave_fd,
+                pass_fds=(job_read,),
+                env=env,
+                start_new_session=True,
+                preexec_fn=self._child_setup
+            )
+        except BaseException:
+            os.close(master_fd)
+            os.close(job_write)
+            raise
+        finally:
+            # Only the child keeps the terminal's slave side, so the master
+            # reports EIO once the program exits
+            os.close(slave_fd)
+            os.close(job_read)
+        return _IdleTerminal(process, master_fd, job_write)
+
+    async def acquire(self, code: str, argv: List[str], bytecode: Optional[bytes] = None,
+                      workspace: Optional[Workspace] = None,
+                      cols: int = PTY_DEFAULT_COLS, rows: int = PTY_DEFAULT_ROWS):
+        loop = asyncio.get_running_loop()
+        terminal = await self.pool.take()
+        read_transport = None
+        try:
+            set_window_size(terminal.master_fd, cols, rows)
+            # Jobs can be larger than the pipe buffer and the worker may still
+            # be starting, so write without blocking the loop
+            job_transport, job_protocol = await loop.connect_write_pipe(
+                lambda: asyncio.streams.FlowControlMixin(),
+                os.fdopen(terminal.job_fd, "wb", buffering=0)
+            )
+            terminal.job_fd = None
+            job = asyncio.StreamWriter(job_transport, job_protocol, None, loop)
+            job.write(encode_job(code, argv, bytecode, workspace))
+            await job.drain()
+            # Closing waits for the rest of the job to be written
+            job.close()
+
+            # Separate descriptors so closing the writer leaves the reader intact
+            reader = asyncio.StreamReader()
+            read_transport, _ = await loop.connect_read_pipe(
+                lambda: asyncio.StreamReaderProtocol(reader),
+                os.fdopen(os.dup(terminal.master_fd), "rb", buffering=0)
+            )
+            transport, protocol = await loop.connect_write_pipe(
+                lambda: asyncio.streams.FlowControlMixin(),
+                os.fdopen(os.dup(terminal.master_fd), "wb", buffering=0)
+            )
+        except BaseException:
+            if read_transport:
+                read_transport.close()
+            terminal.kill()
+            raise
+        terminal.close()
+        writer = asyncio.StreamWriter(transport, protocol, None, loop)
+        self.runs += 1
+        return PtyProcess(terminal.process, read_transport, writer, reader)
+
+    async def release(self, process):
+        try:
+            process.close()
+        except Exception as e:
+            logger.error(f"Error closing terminal: {str(e)}")
+
+    async def close(self):
+        await self.pool.close()
+
+    def stats(self) -> Dict:
+        return {"backend": self.name, "supported": PTY_SUPPORTED, "runs": self.runs, "pool": self.pool.stats()}
+
+
+def create_pty_backend(preexec_fn: Optional[Callable[[], None]] = None) -> Optional[PtyBackend]:
+    if not (PTY_ENABLED and PTY_SUPPORTED):
+        return None
+    return PtyBackend(preexec_fn=preexec_fn)
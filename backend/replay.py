@@ -0,0 +1,47 @@
+import os
+from collections import deque
+from typing import Any, Deque, List, Tuple
+
+REPLAY_BUFFER_CHARS = int(os.getenv("REPLAY_BUFFER_CHARS", 256 * 1024))
+REPLAY_GRACE_SECONDS = float(os.getenv("REPLAY_GRACE_SECONDS", 30))
+
+# Frames sent to a client are numbered 1, 2, 3, ... Version 1 clients count
+# them; after a replay the server sends this OSC sequence with the current
+# number so the client can resynchronise its count, and terminals that do
+# not know it ignore it. Version 2 frames carry their number.
+SYNC_MARKER_PREFIX = "\x1b]777;seq="
+SYNC_MARKER_SUFFIX = "\x07"
+
+
+def sync_marker(seq: int) -> str:
+    return f"{SYNC_MARKER_PREFIX}{seq}{SYNC_MARKER_SUFFIX}"
+
+
+class ReplayBuffer:
+    """Ring buffer of the most recent frames sent to a session's client.
+
+    Frames are stored before encoding, with the size the caller gives them,
+    and at most ``max_chars`` worth are held. The newest frame is always
+    kept, however large.
+    """
+
+    def __init__(self, max_chars: int = REPLAY_BUFFER_CHARS):
+        self.max_chars = max_chars
+        self.last_seq = 0
+        self._frames: Deque[Tuple[int, Any, int]] = deque()
+        self._chars = 0
+
+    def append(self, frame: Any, size: int) -> int:
+        self.last_seq += 1
+        self._frames.append((self.last_seq, frame, size))
+        self._chars += size
+        while self._chars > self.max_chars and len(self._frames) > 1:
+            _, _, dropped = self._frames.popleft()
+            self._chars -= dropped
+        return self.last_seq
+
+    def since(self, seq: int) -> Tuple[List[Tuple[int, Any]], int]:
+        """(seq, frame) pairs after ``seq`` that are still held, and how many were lost."""
+        frames = [(frame_seq, frame) for frame_seq, frame, _ in self._frames if frame_seq > seq]
+        missed = max(0, self.last_seq - seq - len(frames))
+        return frames, missed
@@ -0,0 +1,187 @@
+import asyncio
+import hashlib
+import json
+import os
+import re
+import time
+from collections import OrderedDict
+from typing import Awaitable, Callable, Dict, List, Mapping, Optional, Tuple
+
+from limits import REASON_COMPLETED, REASON_ERROR
+
+# Opt-in: replaying a recorded run is only correct for deterministic programs
+RESULT_CACHE_ENABLED = os.getenv("RESULT_CACHE_ENABLED", "false").lower() in ("1", "true", "yes")
+RESULT_CACHE_BYTES = int(os.getenv("RESULT_CACHE_BYTES", 32 * 1024 * 1024))
+RESULT_CACHE_ENTRY_BYTES = int(os.getenv("RESULT_CACHE_ENTRY_BYTES", 256 * 1024))
+RESULT_CACHE_TTL = float(os.getenv("RESULT_CACHE_TTL", 600))
+# Gaps between recorded frames are scaled by this factor and capped on replay
+RESULT_CACHE_TIME_SCALE = float(os.getenv("RESULT_CACHE_TIME_SCALE", 0.1))
+RESULT_CACHE_MAX_GAP = float(os.getenv("RESULT_CACHE_MAX_GAP", 0.05))
+# Programs importing any of these are assumed to depend on more than their source
+RESULT_CACHE_SKIP_MODULES = [
+    name.strip() for name in os.getenv(
+        "RESULT_CACHE_SKIP_MODULES",
+        "random,secrets,uuid,time,datetime,os,socket,urllib,http,subprocess,threading,multiprocessing"
+    ).split(",") if name.strip()
+]
+
+CACHEABLE_REASONS = (REASON_COMPLETED, REASON_ERROR)
+
+Segments = List[Tuple[str, str]]
+
+
+def _import_pattern(modules: List[str]) -> Optional[re.Pattern]:
+    if not modules:
+        return None
+    names = "|".join(re.escape(name) for name in modules)
+    return re.compile(
+        rf"(^\s*(from|import)\s+({names})\b)|(^\s*import\s+.*,\s*({names})\b)|__import__|importlib",
+        re.MULTILINE
+    )
+
+
+class RunRecording:
+    """Output frames of one run with their offsets from the start of the run."""
+
+    def __init__(self, max_bytes: int = RESULT_CACHE_ENTRY_BYTES):
+        self.max_bytes = max_bytes
+        self.started_at = time.monotonic()
+        self.frames: List[Tuple[float, Segments]] = []
+        self.size = 0
+        self.overflowed = False
+
+    def add(self, segments: Segments):
+        if self.overflowed:
+            return
+        self.size += sum(len(text) for _, text in segments)
+        if self.size > self.max_bytes:
+            # Too large to be worth keeping; drop what was recorded so far
+            self.overflowed = True
+            self.frames = []
+            return
+        self.frames.append((time.monotonic() - self.started_at, segments))
+
+
+class _Entry:
+    def __init__(self, frames: List[Tuple[float, Segments]], stats: Dict, size: int):
+        self.frames = frames
+        self.stats = stats
+        self.size = size
+        self.stored_at = time.monotonic()
+
+
+class ResultCache:
+    """LRU cache of recorded runs, keyed by a hash of what determines their output.
+
+    Only runs that read no input and ended on their own (successfully or
+    with an exception) are stored. Entries expire after ``ttl`` seconds and
+    the least recently used ones are evicted beyond ``max_bytes``.
+    """
+
+    def __init__(
+        self,
+        enabled: bool = RESULT_CACHE_ENABLED,
+        max_bytes: int = RESULT_CACHE_BYTES,
+        ttl: float = RESULT_CACHE_TTL,
+        skip_modules: List[str] = RESULT_CACHE_SKIP_MODULES,
+    ):
+        self.enabled = enabled and max_bytes > 0
+        self.max_bytes = max_bytes
+        self.ttl = ttl
+        self._skip_pattern = _import_pattern(skip_modules)
+        self._entries: "OrderedDict[str, _Entry]" = OrderedDict()
+        self._size = 0
+        self.hits = 0
+        self.misses = 0
+        self.stores = 0
+        self.evictions = 0
+        self.bytes_saved = 0
+        self.cpu_seconds_saved = 0.0
+
+    def key(self, code: str, argv: List[str], interpreter: str, terminal: Optional[Tuple[int, int]] = None,
+            files: Optional[Mapping[str, str]] = None, entry: Optional[str] = None) -> Optional[str]:
+        """Cache key for a run, or None if the program should not be cached.
+
+        Project runs pass all project ``files`` and the ``entry`` file name,
+        with ``code`` being the entry's source.
+        """
+        if not self.enabled:
+            return None
+        sources = [code] + list((files or {}).values())
+        if self._skip_pattern and any(self._skip_pattern.search(source) for source in sources):
+            return None
+        project = sorted(files.items()) if files is not None else None
+        material = json.dumps([interpreter, code, argv, terminal, project, entry], ensure_ascii=False)
+        return hashlib.sha256(material.encode("utf-8")).hexdigest()
+
+    def get(self, key: Optional[str]) -> Optional[_Entry]:
+        if key is None:
+            return None
+        entry = self._entries.get(key)
+        if entry and self.ttl and time.monotonic() - entry.stored_at > self.ttl:
+            self._remove(key)
+            entry = None
+        if entry is None:
+            self.misses += 1
+            return None
+        self._entries.move_to_end(key)
+        self.hits += 1
+        self.bytes_saved += entry.stats.get("output_bytes") or 0
+        self.cpu_seconds_saved += entry.stats.get("cpu_seconds") or 0.0
+        return entry
+
+    def put(self, key: Optional[str], recording: RunRecording, stats: Dict, read_input: bool):
+        if key is None or read_input or recording.overflowed:
+            return
+        if stats.get("reason") not in CACHEABLE_REASONS:
+            return
+        size = recording.size + 256
+        if size > self.max_bytes:
+            return
+        if key in self._entries:
+            self._remove(key)
+        self._entries[key] = _Entry(recording.frames, dict(stats), size)
+        self._size += size
+        self.stores += 1
+        while self._size > self.max_bytes:
+            oldest = next(iter(self._entries))
+            self._remove(oldest)
+            self.evictions += 1
+
+    def _remove(self, key: str):
+        entry = self._entries.pop(key)
+        self._size -= entry.size
+
+    def stats(self) -> Dict:
+        lookups = self.hits + self.misses
+        return {
+            "enabled": self.enabled,
+            "entries": len(self._entries),
+            "bytes": self._size,
+            "max_bytes": self.max_bytes,
+            "ttl": self.ttl,
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_ratio": self.hits / lookups if lookups else 0.0,
+            "stores": self.stores,
+            "evictions": self.evictions,
+            "bytes_saved": self.bytes_saved,
+            "cpu_seconds_saved": self.cpu_seconds_saved,
+        }
+
+
+async def replay_recording(
+    entry: _Entry,
+    send: Callable[[Segments], Awaitable[None]],
+    time_scale: float = RESULT_CACHE_TIME_SCALE,
+    max_gap: float = RESULT_CACHE_MAX_GAP,
+):
+    # Keeps the shape of the original output, e.g. a progress bar still
+    # advances, without making the client wait as long as the real run did
+    previous = 0.0
+    for offset, segments in entry.frames:
+        gap = min((offset - previous) * time_scale, max_gap)
+        previous = offset
+        if gap > 0:
+            await asyncio.sleep(gap)
+        await send(segments)
@@ -0,0 +1,208 @@
+import asyncio
+import logging
+import os
+import time
+from collections import OrderedDict, deque
+from typing import Awaitable, Callable, Deque, Dict, List, Optional, Tuple
+
+from logging_setup import session_tag
+
+logger = logging.getLogger(__name__)
+
+# 0 derives the cap from the CPU count
+MAX_CONCURRENT_RUNS = int(os.getenv("MAX_CONCURRENT_RUNS", 0))
+RUNS_PER_CPU = int(os.getenv("RUNS_PER_CPU", 2))
+RUN_RATE_LIMIT = float(os.getenv("RUN_RATE_LIMIT", 30))  # runs per minute per connection
+RUN_RATE_BURST = int(os.getenv("RUN_RATE_BURST", 5))
+# Caps all connections from one address together, so rotating connection ids
+# gains little; high enough for a classroom sharing one NAT or proxy address
+RUN_ADDRESS_RATE_LIMIT = float(os.getenv("RUN_ADDRESS_RATE_LIMIT", 600))
+RUN_ADDRESS_RATE_BURST = int(os.getenv("RUN_ADDRESS_RATE_BURST", 100))
+
+Notify = Callable[[int], Awaitable[None]]
+
+
+def default_max_concurrent() -> int:
+    per_cpu = (os.cpu_count() or 1) * RUNS_PER_CPU
+    if MAX_CONCURRENT_RUNS > 0:
+        return min(MAX_CONCURRENT_RUNS, per_cpu)
+    return per_cpu
+
+
+class RateLimitExceeded(Exception):
+    def __init__(self, retry_after: float):
+        super().__init__(f"Rate limit exceeded, try again in {retry_after:.0f}s")
+        self.retry_after = retry_after
+
+
+class _Waiter:
+    def __init__(self, connection_id: str, notify: Optional[Notify]):
+        self.connection_id = connection_id
+        self.notify = notify
+        self.future = asyncio.get_running_loop().create_future()
+        self.enqueued_at = time.monotonic()
+        self.position = 0
+
+
+class ExecutionScheduler:
+    """Caps concurrent runs on this worker and queues the rest fairly.
+
+    Waiting runs are kept in one queue per connection and served round-robin,
+    so a single client pressing Run repeatedly cannot starve the others.
+    Each connection is also limited by a token bucket of ``rate`` runs per
+    minute with bursts of up to ``burst``, and each client address by a
+    much larger one of ``address_rate`` and ``address_burst``.
+    """
+
+    def __init__(
+        self,
+        max_concurrent: Optional[int] = None,
+        rate: float = RUN_RATE_LIMIT,
+        burst: int = RUN_RATE_BURST,
+        address_rate: float = RUN_ADDRESS_RATE_LIMIT,
+        address_burst: int = RUN_ADDRESS_RATE_BURST,
+    ):
+        self.max_concurrent = max_concurrent or default_max_concurrent()
+        self.rate = rate
+        self.burst = burst
+        self.address_rate = address_rate
+        self.address_burst = address_burst
+        self.running = 0
+        self._queues: "OrderedDict[str, Deque[_Waiter]]" = OrderedDict()
+        self._buckets: Dict[str, Tuple[float, float]] = {}
+        self._address_buckets: Dict[str, Tuple[float, float]] = {}
+        self.admitted = 0
+        self.rate_limited = 0
+        self._waits: Deque[float] = deque(maxlen=1000)
+        self._wait_total = 0.0
+        self._wait_max = 0.0
+
+    @property
+    def queued(self) -> int:
+        return sum(len(queue) for queue in self._queues.values())
+
+    def check_rate(self, connection_id: str, address: Optional[str] = None):
+        now = time.monotonic()
+        limits = [(self._buckets, connection_id, self.rate, self.burst)]
+        if address is not None:
+            limits.append((self._address_buckets, address, self.address_rate, self.address_burst))
+        # Take a token from every bucket or from none of them
+        taken = []
+        for buckets, key, rate, burst in limits:
+            if rate <= 0:
+                continue
+            tokens, last = buckets.get(key, (float(burst), now))
+            tokens = min(float(burst), tokens + (now - last) * rate / 60.0)
+            if tokens < 1.0:
+                self.rate_limited += 1
+                buckets[key] = (tokens, now)
+                raise RateLimitExceeded((1.0 - tokens) * 60.0 / rate)
+            taken.append((buckets, key, tokens))
+        for buckets, key, tokens in taken:
+            buckets[key] = (tokens - 1.0, now)
+        for buckets, _, rate, burst in limits:
+            if rate > 0 and len(buckets) > 10000:
+                self._prune_buckets(buckets, now, rate, burst)
+
+    @staticmethod
+    def _prune_buckets(buckets: Dict[str, Tuple[float, float]], now: float, rate: float, burst: int):
+        refill = 60.0 * burst / rate
+        for key, (_, last) in list(buckets.items()):
+            if now - last > refill:
+                del buckets[key]
+
+    async def acquire(self, connection_id: str, notify: Optional[Notify] = None):
+        if self.running < self.max_concurrent and not self._queues:
+            self.running += 1
+            self._record_wait(0.0)
+            return
+
+        waiter = _Waiter(connection_id, notify)
+        self._queues.setdefault(connection_id, deque()).append(waiter)
+        self._notify_positions()
+        try:
+            await waiter.future
+        except asyncio.CancelledError:
+            if waiter.future.done() and not waiter.future.cancelled():
+                # The slot was granted just as the run was abandoned
+                self.release()
+            else:
+                self._remove(waiter)
+                self._notify_positions()
+            raise
+        self._record_wait(time.monotonic() - waiter.enqueued_at)
+
+    def release(self):
+        self.running = max(0, self.running - 1)
+        self._dispatch()
+
+    def _dispatch(self):
+        granted = False
+        while self.running < self.max_concurrent and self._queues:
+            connection_id, queue = next(iter(self._queues.items()))
+            waiter = queue.popleft()
+            if queue:
+                self._queues.move_to_end(connection_id)
+            else:
+                del self._queues[connection_id]
+            if waiter.future.done():
+                continue
+            waiter.future.set_result(None)
+            self.running += 1
+            granted = True
+        if granted:
+            self._notify_positions()
+
+    def _remove(self, waiter: _Waiter):
+        queue = self._queues.get(waiter.connection_id)
+        if queue and waiter in queue:
+            queue.remove(waiter)
+            if not queue:
+                del self._queues[waiter.connection_id]
+
+    def _service_order(self) -> List[_Waiter]:
+        order = []
+        queues = [list(queue) for queue in self._queues.values()]
+        depth = max((len(queue) for queue in queues), default=0)
+        for index in range(depth):
+            order.extend(queue[index] for queue in queues if index < len(queue))
+        return order
+
+    def _notify_positions(self):
+        for position, waiter in enumerate(self._service_order(), start=1):
+            if waiter.position != position and waiter.notify:
+                waiter.position = position
+                asyncio.ensure_future(self._send_position(waiter, position))
+
+    @staticmethod
+    async def _send_position(waiter: _Waiter, position: int):
+        try:
+            await waiter.notify(position)
+        except Exception as e:
+            logger.debug(f"Could not send queue position to {session_tag(waiter.connection_id)}: {str(e)}")
+
+    def _record_wait(self, wait: float):
+        self.admitted += 1
+        self._waits.append(wait)
+        self._wait_total += wait
+        self._wait_max = max(self._wait_max, wait)
+
+    def stats(self) -> Dict[str, float]:
+        waits = sorted(self._waits)
+
+        def percentile(pct: float) -> float:
+            if not waits:
+                return 0.0
+            return waits[min(len(waits) - 1, int(pct / 100 * len(waits)))]
+
+        return {
+            "max_concurrent": self.max_concurrent,
+            "running": self.running,
+            "queued": self.queued,
+            "admitted": self.admitted,
+            "rate_limited": self.rate_limited,
+            "queue_wait_avg": self._wait_total / self.admitted if self.admitted else 0.0,
+            "queue_wait_p50": percentile(50),
+            "queue_wait_p95": percentile(95),
+            "queue_wait_max": self._wait_max,
+        }
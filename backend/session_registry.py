@@ -0,0 +1,159 @@
+import asyncio
+import logging
+import os
+import socket
+import uuid
+from typing import Awaitable, Callable, Dict, List, Optional
+
+from logging_setup import session_tag
+
+logger = logging.getLogger(__name__)
+
+# Empty keeps sessions in this process; a redis:// URL shares them across workers and nodes
+SESSION_REGISTRY_URL = os.getenv("SESSION_REGISTRY_URL", "")
+SESSION_TTL = int(os.getenv("SESSION_TTL", 15))
+SESSION_WATCH_INTERVAL = float(os.getenv("SESSION_WATCH_INTERVAL", 1.0))
+
+WORKER_ID = f"{socket.gethostname()}:{os.getpid()}"
+
+
+def new_owner_token() -> str:
+    # Identifies one connection on one worker; the worker part locates the session
+    return f"{WORKER_ID}:{uuid.uuid4().hex[:12]}"
+
+
+def owner_worker(token: Optional[str]) -> Optional[str]:
+    return token.rsplit(":", 1)[0] if token else None
+
+
+class SessionRegistry:
+    """Maps connection IDs to the connection that currently owns them.
+
+    A reconnect claims its connection ID unconditionally, so the newest
+    connection always wins. Each worker keeps its sessions' entries alive
+    and, through ``watch``, notices when one of them has been claimed
+    elsewhere so it can stop the process it is still running for it.
+    """
+
+    async def claim(self, connection_id: str, token: str) -> Optional[str]:
+        raise NotImplementedError
+
+    async def release(self, connection_id: str, token: str):
+        raise NotImplementedError
+
+    async def owners(self, connection_ids: List[str]) -> List[Optional[str]]:
+        raise NotImplementedError
+
+    async def refresh(self, sessions: Dict[str, str]):
+        # Called with the sessions this worker still owns, or whose entry is gone
+        pass
+
+    async def close(self):
+        pass
+
+    async def watch(
+        self,
+        local_sessions: Callable[[], Dict[str, str]],
+        on_lost: Callable[[str, str], Awaitable[None]],
+        interval: float = SESSION_WATCH_INTERVAL,
+    ):
+        while True:
+            await asyncio.sleep(interval)
+            try:
+                sessions = local_sessions()
+                if not sessions:
+                    continue
+                connection_ids = list(sessions)
+                owners = await self.owners(connection_ids)
+                still_ours = {}
+                for connection_id, owner in zip(connection_ids, owners):
+                    token = sessions[connection_id]
+                    if owner is not None and owner != token:
+                        logger.info(f"Session {session_tag(connection_id)} was taken over by {owner_worker(owner)}")
+                        await on_lost(connection_id, token)
+                    else:
+                        still_ours[connection_id] = token
+                await self.refresh(still_ours)
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                logger.error(f"Error watching session registry: {str(e)}")
+
+
+class InMemorySessionRegistry(SessionRegistry):
+    """Registry for a single worker process."""
+
+    def __init__(self):
+        self._owners: Dict[str, str] = {}
+
+    async def claim(self, connection_id: str, token: str) -> Optional[str]:
+        previous = self._owners.get(connection_id)
+        self._owners[connection_id] = token
+        return previous
+
+    async def release(self, connection_id: str, token: str):
+        if self._owners.get(connection_id) == token:
+            del self._owners[connection_id]
+
+    async def owners(self, connection_ids: List[str]) -> List[Optional[str]]:
+        return [self._owners.get(connection_id) for connection_id in connection_ids]
+
+
+class RedisSessionRegistry(SessionRegistry):
+    """Registry shared through Redis, or anything speaking its API such as fakeredis.
+
+    Entries expire after ``ttl`` seconds unless the owning worker refreshes
+    them, so sessions of a crashed worker disappear on their own.
+    """
+
+    def __init__(self, client, ttl: int = SESSION_TTL, prefix: str = "session:"):
+        self.client = client
+        self.ttl = ttl
+        self.prefix = prefix
+
+    @classmethod
+    def from_url(cls, url: str, **kwargs) -> "RedisSessionRegistry":
+        import redis.asyncio as redis
+        return cls(redis.from_url(url, decode_responses=True), **kwargs)
+
+    def _key(self, connection_id: str) -> str:
+        return f"{self.prefix}{connection_id}"
+
+    async def claim(self, connection_id: str, token: str) -> Optional[str]:
+        async with self.client.pipeline(transaction=True) as pipe:
+            pipe.getset(self._key(connection_id), token)
+            pipe.expire(self._key(connection_id), self.ttl)
+            previous, _ = await pipe.execute()
+        return previous
+
+    async def release(self, connection_id: str, token: str):
+        # Best effort: a claim landing between these calls is restored by its
+        # owner's next refresh
+        if await self.client.get(self._key(connection_id)) == token:
+            await self.client.delete(self._key(connection_id))
+
+    async def owners(self, connection_ids: List[str]) -> List[Optional[str]]:
+        return await self.client.mget([self._key(connection_id) for connection_id in connection_ids])
+
+    async def refresh(self, sessions: Dict[str, str]):
+        if not sessions:
+            return
+        async with self.client.pipeline(transaction=False) as pipe:
+            for connection_id, token in sessions.items():
+                # NX never overwrites a claim made since the owners were read
+                pipe.set(self._key(connection_id), token, ex=self.ttl, nx=True)
+            created = await pipe.execute()
+        async with self.client.pipeline(transaction=False) as pipe:
+            for (connection_id, _), was_created in zip(sessions.items(), created):
+                if not was_created:
+                    pipe.expire(self._key(connection_id), self.ttl)
+            await pipe.execute()
+
+    async def close(self):
+        await self.client.close()
+
+
+def create_session_registry(url: str = SESSION_REGISTRY_URL) -> SessionRegistry:
+    if url:
+        return RedisSessionRegistry.from_url(url)
+    return InMemorySessionRegistry()
@@ -0,0 +1,167 @@
+import gzip
+import hashlib
+import logging
+import mimetypes
+import os
+import re
+from typing import Dict, Mapping, Optional
+
+from starlette.responses import Response
+
+try:
+    import brotli
+except ImportError:
+    brotli = None
+
+logger = logging.getLogger(__name__)
+
+STATIC_COMPRESS_MIN_BYTES = int(os.getenv("STATIC_COMPRESS_MIN_BYTES", 1024))
+STATIC_BROTLI_QUALITY = int(os.getenv("STATIC_BROTLI_QUALITY", 11))
+STATIC_GZIP_LEVEL = int(os.getenv("STATIC_GZIP_LEVEL", 9))
+
+# Source maps are left out: only developer tools fetch them
+COMPRESSIBLE_EXTENSIONS = {".js", ".css", ".html", ".json", ".svg", ".txt", ".xml", ".ico"}
+# Build tools put a content hash in the name, e.g. main.b944ac86.js
+HASHED_NAME = re.compile(r"\.[0-9a-f]{8,}\.")
+IMMUTABLE_CACHE = "public, max-age=31536000, immutable"
+REVALIDATE_CACHE = "no-cache"
+
+INDEX_HEADERS = {
+    "Strict-Transport-Security": "max-age=31536000; includeSubDomains",
+    "X-Content-Type-Options": "nosniff",
+    "X-Frame-Options": "DENY",
+    "X-XSS-Protection": "1; mode=block",
+}
+
+
+def rewrite_index(content: str) -> str:
+    # Fix static file paths if needed
+    if "/static/" not in content:
+        content = content.replace('href="/', 'href="/static/')
+        content = content.replace('src="/', 'src="/static/')
+
+    # Fix WebSocket connection to use secure protocol
+    return content.replace("ws://", "wss://")
+
+
+def accepted_encodings(accept_encoding: str) -> Dict[str, float]:
+    encodings = {}
+    for part in accept_encoding.split(","):
+        name, _, params = part.strip().partition(";")
+        quality = 1.0
+        if params.strip().startswith("q="):
+            try:
+                quality = float(params.strip()[2:])
+            except ValueError:
+                quality = 0.0
+        if name:
+            encodings[name.strip().lower()] = quality
+    return encodings
+
+
+class Asset:
+    """One file held in memory with its precompressed variants."""
+
+    def __init__(self, body: bytes, media_type: str, cache_control: str, compress: bool):
+        self.media_type = media_type
+        self.cache_control = cache_control
+        self.etag = f'"{hashlib.sha1(body).hexdigest()[:20]}"'
+        self.variants: Dict[Optional[str], bytes] = {None: body}
+        if compress and len(body) >= STATIC_COMPRESS_MIN_BYTES:
+            # Only keep a variant when it is actually smaller
+            compressed = gzip.compress(body, STATIC_GZIP_LEVEL, mtime=0)
+            if len(compressed) < len(body):
+                self.variants["gzip"] = compressed
+            if brotli is not None:
+                compressed = brotli.compress(body, quality=STATIC_BROTLI_QUALITY)
+                if len(compressed) < len(body):
+                    self.variants["br"] = compressed
+
+    def choose(self, accept_encoding: str) -> Optional[str]:
+        if len(self.variants) == 1:
+            return None
+        accepted = accepted_encodings(accept_encoding)
+        for encoding in ("br", "gzip"):
+            if encoding in self.variants and accepted.get(encoding, 0.0) > 0:
+                return encoding
+        return None
+
+    def response(self, headers: Mapping[str, str], extra_headers: Optional[Dict[str, str]] = None) -> Response:
+        encoding = self.choose(headers.get("accept-encoding", ""))
+        etag = self.etag if encoding is None else f'{self.etag[:-1]}-{encoding}"'
+        response_headers = {
+            "ETag": etag,
+            "Cache-Control": self.cache_control,
+            "Vary": "Accept-Encoding",
+        }
+        if extra_headers:
+            response_headers.update(extra_headers)
+
+        if_none_match = headers.get("if-none-match")
+        if if_none_match and (if_none_match.strip() == "*" or etag in [tag.strip() for tag in if_none_match.split(",")]):
+            return Response(status_code=304, headers=response_headers)
+
+        if encoding:
+            response_headers["Content-Encoding"] = encoding
+        return Response(self.variants[encoding], media_type=self.media_type, headers=response_headers)
+
+
+class StaticAssets:
+    """Serves the frontend build from memory.
+
+    ``load`` reads every file once, rewrites index.html and precomputes gzip
+    and, when the brotli package is installed, brotli variants. Hashed build
+    files are sent as immutable; everything else is revalidated with its
+    ETag. Only files present when ``load`` ran are served, so requests for
+    anything else are answered without touching the disk.
+    """
+
+    def __init__(self, directory: str):
+        self.directory = os.path.realpath(directory)
+        self.index: Optional[Asset] = None
+        self._assets: Dict[str, Asset] = {}
+
+    def load(self):
+        if not os.path.isdir(self.directory):
+            return
+
+        index_path = os.path.join(self.directory, "index.html")
+        if os.path.exists(index_path):
+            with open(index_path, "r", encoding="utf-8") as f:
+                content = rewrite_index(f.read())
+            self.index = Asset(content.encode("utf-8"), "text/html", REVALIDATE_CACHE, compress=True)
+        else:
+            logger.error(f"index.html not found at: {index_path}")
+
+        original = saved = 0
+        for root, _, files in os.walk(self.directory):
+            for name in files:
+                relative = os.path.relpath(os.path.join(root, name), self.directory).replace(os.sep, "/")
+                asset = self._load_file(relative)
+                if asset:
+                    original += len(asset.variants[None])
+                    saved += len(asset.variants[None]) - min(len(body) for body in asset.variants.values())
+        logger.info(f"Loaded {len(self._assets)} static files ({original} bytes, up to {saved} saved by compression)")
+
+    def _load_file(self, relative: str) -> Optional[Asset]:
+        path = os.path.realpath(os.path.join(self.directory, relative))
+        if os.path.commonpath([path, self.directory]) != self.directory or not os.path.isfile(path):
+            return None
+        with open(path, "rb") as f:
+            body = f.read()
+        name = os.path.basename(path)
+        extension = os.path.splitext(name)[1].lower()
+        media_type = mimetypes.guess_type(name)[0] or "application/octet-stream"
+        cache_control = IMMUTABLE_CACHE if HASHED_NAME.search(name) else REVALIDATE_CACHE
+        asset = Asset(body, media_type, cache_control, extension in COMPRESSIBLE_EXTENSIONS)
+        self._assets[relative] = asset
+        return asset
+
+    def get(self, path: str) -> Optional[Asset]:
+        # The build's own static/ folder may or may not have been flattened
+        # into the served directory, so look in both places
+        for relative in (path, f"static/{path}"):
+            asset = self._assets.get(relative)
+            if asset:
+                return asset
+        return None
@@ -0,0 +1,104 @@
+import asyncio
+import codecs
+import errno
+import logging
+import os
+from typing import Awaitable, Callable, List, Optional, Tuple
+
+logger = logging.getLogger(__name__)
+
+# Read size for each pipe read and the bounds of a single outgoing frame
+OUTPUT_CHUNK_SIZE = int(os.getenv("OUTPUT_CHUNK_SIZE", 65536))
+OUTPUT_FRAME_BYTES = int(os.getenv("OUTPUT_FRAME_BYTES", 16384))
+OUTPUT_FRAME_DELAY = float(os.getenv("OUTPUT_FRAME_DELAY", 0.005))
+
+Segments = List[Tuple[str, str]]
+
+
+class OutputCoalescer:
+    """Batches stdout/stderr text into bounded frames.
+
+    Output is flushed once ``max_bytes`` are pending or ``max_delay`` seconds
+    after the first unsent chunk, whichever comes first. Adjacent chunks from
+    the same stream are merged so the order across streams is preserved.
+    """
+
+    def __init__(
+        self,
+        send: Callable[[Segments], Awaitable[None]],
+        max_bytes: int = OUTPUT_FRAME_BYTES,
+        max_delay: float = OUTPUT_FRAME_DELAY,
+    ):
+        self._send = send
+        self.max_bytes = max_bytes
+        self.max_delay = max_delay
+        self._segments: List[Tuple[str, List[str]]] = []
+        self._size = 0
+        self._lock = asyncio.Lock()
+        self._timer: Optional[asyncio.TimerHandle] = None
+        self._timer_task: Optional[asyncio.Task] = None
+
+    @property
+    def pending(self) -> int:
+        return self._size
+
+    async def feed(self, stream: str, text: str):
+        if not text:
+            return
+
+        if self._segments and self._segments[-1][0] == stream:
+            self._segments[-1][1].append(text)
+        else:
+            self._segments.append((stream, [text]))
+        self._size += len(text)
+
+        if self._size >= self.max_bytes:
+            await self.flush()
+        elif self._timer is None:
+            loop = asyncio.get_running_loop()
+            self._timer = loop.call_later(self.max_delay, self._on_timer)
+
+    def _on_timer(self):
+        self._timer = None
+        self._timer_task = asyncio.ensure_future(self.flush())
+
+    async def flush(self):
+        if self._timer:
+            self._timer.cancel()
+            self._timer = None
+
+        # Sends are serialized so frames leave in the order they were cut
+        async with self._lock:
+            if not self._segments:
+                return
+            segments = [(stream, "".join(parts)) for stream, parts in self._segments]
+            self._segments = []
+            self._size = 0
+            await self._send(segments)
+
+    async def close(self):
+        await self.flush()
+        if self._timer_task and not self._timer_task.done():
+            await self._timer_task
+
+
+async def pump_stream(
+    reader: asyncio.StreamReader,
+    stream: str,
+    coalescer: OutputCoalescer,
+    chunk_size: int = OUTPUT_CHUNK_SIZE,
+):
+    # Incremental decoding keeps multi-byte characters intact across reads
+    decoder = codecs.getincrementaldecoder("utf-8")(errors="replace")
+    while True:
+        try:
+            data = await reader.read(chunk_size)
+        except OSError as e:
+            # A pty master reports EIO once the child side is closed
+            if e.errno != errno.EIO:
+                raise
+            break
+        if not data:
+            break
+        await coalescer.feed(stream, decoder.decode(data))
+    await coalescer.feed(stream, decoder.decode(b"", final=True))
@@ -0,0 +1,64 @@
+import marshal
+
+from compile_cache import CompileCache, compile_source
+
+
+def test_valid_source_compiles_to_bytecode():
+    result = compile_source("print('hi')\n")
+    assert result.ok and result.warnings == ""
+    code = marshal.loads(result.bytecode)
+    assert code.co_filename == "<main.py>"
+
+
+def test_syntax_error_is_formatted_like_the_interpreter():
+    result = compile_source("x = (\n")
+    assert not result.ok and result.bytecode is None
+    assert result.diagnostic.startswith('  File "<main.py>", line 1')
+    assert "SyntaxError" in result.diagnostic
+
+
+def test_parser_exhaustion_is_a_diagnostic():
+    assert "MemoryError" in compile_source("-" * 100000 + "1").diagnostic
+    assert "RecursionError" in compile_source("1+" * 20000 + "1").diagnostic
+
+
+def test_compile_warnings_are_kept():
+    for _ in range(2):
+        result = compile_source("x = 1\nx is 1\n")
+        assert result.ok
+        assert '<main.py>:2: SyntaxWarning: "is" with a literal' in result.warnings
+
+
+def test_cache_hits_are_keyed_by_file_name_and_source():
+    cache = CompileCache(size=2)
+    first = cache.compile("a = 1\n")
+    assert cache.compile("a = 1\n") is first
+    other = cache.compile("a = 1\n", "pkg/run.py")
+    assert other is not first and marshal.loads(other.bytecode).co_filename == "pkg/run.py"
+    assert (cache.hits, cache.misses) == (1, 2)
+
+
+def test_cache_evicts_least_recently_used():
+    cache = CompileCache(size=2)
+    a = cache.compile("a = 1\n")
+    cache.compile("b = 1\n")
+    cache.compile("a = 1\n")
+    cache.compile("c = 1\n")
+    assert cache.compile("a = 1\n") is a
+    assert cache.stats()["entries"] == 2 and cache.misses == 3
+    cache.compile("b = 1\n")
+    assert cache.misses == 4
+
+
+def test_large_sources_are_left_to_the_worker():
+    cache = CompileCache(max_source_bytes=10)
+    result = cache.compile("print('a long line')\n")
+    assert result.ok and result.bytecode is None
+    assert cache.stats()["skipped"] == 1 and cache.stats()["entries"] == 0
+
+
+def test_syntax_errors_are_counted_on_every_lookup():
+    cache = CompileCache()
+    cache.compile("(")
+    cache.compile("(")
+    assert cache.syntax_errors == 2 and cache.hits == 1
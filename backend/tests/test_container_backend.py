@@ -0,0 +1,119 @@
+import asyncio
+import os
+import sys
+
+import pytest
+
+from benchmarks.fake_docker import pid_file
+from container_backend import ContainerBackend
+from limits import RunLimits
+from workspace import Workspace
+
+BACKEND_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+FAKE_DOCKER = f"{sys.executable} {os.path.join(BACKEND_DIR, 'benchmarks', 'fake_docker.py')}"
+
+pytestmark = pytest.mark.skipif(os.name != "posix", reason="the fake docker CLI execs in place, which needs POSIX")
+
+
+def backend(size=1):
+    limits = RunLimits(cpu_seconds=0, memory_mb=0, max_processes=0, max_open_files=0)
+    return ContainerBackend(limits, size=size, docker_cmd=FAKE_DOCKER)
+
+
+async def run(process):
+    stdout, stderr = await asyncio.gather(process.stdout.read(), process.stderr.read())
+    return await process.wait(), stdout.decode(), stderr.decode()
+
+
+def test_runs_a_program_in_a_pooled_container():
+    async def scenario():
+        containers = backend()
+        containers.start()
+        while containers.stats()["idle"] < 1:
+            await asyncio.sleep(0.02)
+        process = await containers.acquire("import sys\nprint('hello', sys.argv[1:])\n", ["a"])
+        assert await run(process) == (0, "hello ['a']\n", "")
+        await containers.release(process)
+        stats = containers.stats()
+        await containers.close()
+        return stats
+
+    stats = asyncio.run(scenario())
+    assert (stats["hits"], stats["misses"], stats["in_use"]) == (1, 0, 0)
+
+
+def test_kill_stops_the_container():
+    async def scenario():
+        containers = backend(size=0)
+        process = await containers.acquire("print('started', flush=True)\nwhile True:\n    pass\n", [])
+        assert await process.stdout.readline() == b"started\n"
+        process.kill()
+        # The exec client only exits once the program in the container is gone
+        returncode = await asyncio.wait_for(process.wait(), 10)
+        # Killed through docker kill, not by signalling the client
+        killed = not os.path.exists(pid_file(process.container_id))
+        await containers.release(process)
+        await containers.close()
+        return returncode, killed
+
+    returncode, killed = asyncio.run(scenario())
+    assert returncode != 0
+    assert killed
+
+
+def test_project_files_travel_with_the_job(tmp_path):
+    async def scenario():
+        workspace = Workspace(root=str(tmp_path), materialize=False)
+        workspace.apply({
+            "main.py": "from pkg import util\nprint(util.VALUE, open('data.txt').read())\n",
+            "pkg/__init__.py": "",
+            "pkg/util.py": "VALUE = 42\n",
+            "data.txt": "from a file",
+        })
+        code = workspace.select_entry("main.py")
+        containers = backend(size=0)
+        process = await containers.acquire(code, [], None, workspace)
+        result = await run(process)
+        await containers.release(process)
+        await containers.close()
+        return result
+
+    assert asyncio.run(scenario()) == (0, "42 from a file\n", "")
+    assert os.listdir(tmp_path) == []
+
+
+def test_cancelled_acquire_discards_its_container():
+    async def scenario():
+        containers = backend()
+        containers.start()
+        while containers.stats()["idle"] < 1:
+            await asyncio.sleep(0.02)
+        pooled = containers._idle[0].id
+
+        docker = containers._docker
+        commands = []
+        unpausing = asyncio.Event()
+
+        async def slow_unpause(*args):
+            commands.append(args)
+            if args[0] == "unpause" and not unpausing.is_set():
+                unpausing.set()
+                await asyncio.sleep(10)
+            return await docker(*args)
+
+        containers._docker = slow_unpause
+        run = asyncio.create_task(containers.acquire("print(1)", []))
+        await unpausing.wait()
+        run.cancel()
+        with pytest.raises(asyncio.CancelledError):
+            await run
+
+        # The pool refills and the taken container is removed
+        while containers.stats()["idle"] < 1 or ("rm", "-f", pooled) not in commands:
+            await asyncio.sleep(0.02)
+        stats = containers.stats()
+        await containers.close()
+        return stats
+
+    stats = asyncio.run(asyncio.wait_for(scenario(), 10))
+    assert (stats["idle"], stats["in_use"]) == (1, 0)
@@ -0,0 +1,30 @@
+import subprocess
+import sys
+
+import pytest
+
+from limits import RunLimits, resource
+
+pytestmark = pytest.mark.skipif(resource is None, reason="rlimits are POSIX only")
+
+
+def test_file_size_limit():
+    limits = RunLimits(cpu_seconds=0, memory_mb=0, max_processes=0, max_open_files=0, max_file_mb=1)
+    assert limits.rlimits() == {resource.RLIMIT_FSIZE: 1024 * 1024}
+
+
+def test_oversized_writes_fail_in_the_program(tmp_path):
+    limits = RunLimits(cpu_seconds=0, memory_mb=0, max_processes=0, max_open_files=0, max_file_mb=1)
+    code = (
+        "try:\n"
+        "    with open('big.bin', 'wb') as f:\n"
+        "        f.write(b'x' * 2 * 1024 * 1024)\n"
+        "except OSError as e:\n"
+        "    print('refused', e.errno)\n"
+    )
+    result = subprocess.run(
+        [sys.executable, "-c", code], cwd=tmp_path, capture_output=True, text=True,
+        preexec_fn=limits.preexec_fn(), timeout=30
+    )
+    assert result.stdout.startswith("refused")
+    assert (tmp_path / "big.bin").stat().st_size <= 1024 * 1024
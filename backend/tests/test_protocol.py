@@ -0,0 +1,117 @@
+import asyncio
+
+import pytest
+
+import main
+from protocol import (
+    PROTOCOL_V1, PROTOCOL_V2, STREAM_EXIT, STREAM_STDERR, STREAM_STDOUT, CreditWindow, ProtocolOptions,
+    decode_v2, encode_v2
+)
+
+
+class FakeWebSocket:
+    def __init__(self):
+        self.frames = []
+
+    async def send_bytes(self, data):
+        self.frames.append(data)
+
+    async def send_text(self, text):
+        self.frames.append(text)
+
+    async def close(self, code=1000):
+        pass
+
+
+@pytest.mark.parametrize("compression", [False, True])
+def test_v2_round_trip(compression):
+    segments = [
+        (STREAM_STDOUT, "hello\n" * 200),
+        (STREAM_STDERR, "ünïcode ✓\n"),
+        (STREAM_EXIT, {"reason": "completed", "exit_code": 0}),
+    ]
+    frame = encode_v2(42, segments, compression)
+    assert decode_v2(frame) == (42, segments)
+
+
+def test_v2_compresses_only_when_asked_and_worthwhile():
+    segments = [(STREAM_STDOUT, "a" * 4096)]
+    assert len(encode_v2(1, segments, True)) < len(encode_v2(1, segments, False))
+    small = [(STREAM_STDOUT, "a")]
+    assert encode_v2(1, small, True) == encode_v2(1, small, False)
+
+
+def test_negotiate_falls_back_to_v1():
+    assert ProtocolOptions.negotiate({}).version == PROTOCOL_V1
+    assert ProtocolOptions.negotiate({"protocol": "nope"}).version == PROTOCOL_V1
+    options = ProtocolOptions.negotiate({"protocol": "2", "compression": "deflate", "window": "0"})
+    assert (options.version, options.compression, options.window) == (PROTOCOL_V2, True, 1)
+
+
+def test_credit_window_waits_until_granted():
+    async def scenario():
+        window = CreditWindow(10)
+        await window.consume(15)
+        waiter = asyncio.ensure_future(window.consume(5))
+        await asyncio.sleep(0.01)
+        assert not waiter.done()
+        window.grant(10)
+        await asyncio.wait_for(waiter, 1)
+        assert window.credits == 0
+
+    asyncio.run(scenario())
+
+
+def test_suspended_credit_window_never_waits():
+    async def scenario():
+        window = CreditWindow(1)
+        await window.consume(5)
+        waiter = asyncio.ensure_future(window.consume(5))
+        await asyncio.sleep(0.01)
+        window.suspend()
+        await asyncio.wait_for(waiter, 1)
+        await asyncio.wait_for(window.consume(5), 1)
+        window.enforce()
+        assert window.credits < 0 and not window._available.is_set()
+
+    asyncio.run(scenario())
+
+
+def paused_manager(window: int):
+    manager = main.ProcessManager(FakeWebSocket(), "credit-test")
+    manager.set_protocol(ProtocolOptions(PROTOCOL_V2, window=window))
+    manager.requested_at = 0.0
+    return manager
+
+
+@pytest.mark.parametrize("version", [PROTOCOL_V1, PROTOCOL_V2])
+def test_resume_wakes_output_waiting_for_credit(version):
+    async def scenario():
+        manager = paused_manager(8)
+        await manager.send_output([(STREAM_STDOUT, "x" * 8)])
+        blocked = asyncio.ensure_future(manager.send_output([(STREAM_STDOUT, "y" * 8)]))
+        await asyncio.sleep(0.01)
+        assert not blocked.done()
+
+        websocket = FakeWebSocket()
+        await manager.resume(websocket, "owner", 0, ProtocolOptions(version, window=64))
+        if version == PROTOCOL_V2:
+            # Credit from the resumed client reaches the output that was waiting
+            manager.grant_credit(64)
+        await asyncio.wait_for(blocked, 1)
+        assert manager.output_sent == 16
+
+    asyncio.run(scenario())
+
+
+def test_output_stops_waiting_for_credit_once_the_program_ended():
+    async def scenario():
+        manager = paused_manager(4)
+        await manager.send_output([(STREAM_STDOUT, "x" * 4)])
+        blocked = asyncio.ensure_future(manager.send_output([(STREAM_STDOUT, "left in the pipe")]))
+        await asyncio.sleep(0.01)
+        assert not blocked.done()
+        manager.suspend_credit()
+        await asyncio.wait_for(blocked, 1)
+
+    asyncio.run(scenario())
@@ -0,0 +1,77 @@
+import asyncio
+import os
+
+import pytest
+
+import pty_backend
+from pty_backend import PtyBackend
+
+pytestmark = pytest.mark.skipif(not pty_backend.PTY_SUPPORTED, reason="needs POSIX pseudo-terminals")
+
+
+async def read_all(process):
+    output = b""
+    while True:
+        try:
+            chunk = await process.stdout.read(65536)
+        except OSError:
+            # The master reports EIO once the program exits
+            break
+        if not chunk:
+            break
+        output += chunk
+    await process.wait()
+    return output
+
+
+def open_fds():
+    return len(os.listdir("/proc/self/fd")) if os.path.isdir("/proc/self/fd") else 0
+
+
+def test_runs_come_from_the_pool_with_the_requested_window():
+    async def scenario():
+        terminals = PtyBackend(size=1)
+        terminals.start()
+        while terminals.pool.stats()["idle"] < 1:
+            await asyncio.sleep(0.02)
+        process = await terminals.acquire("import shutil\nprint(shutil.get_terminal_size())\n", [], cols=100, rows=30)
+        output = await read_all(process)
+        await terminals.release(process)
+        stats = terminals.stats()
+        await terminals.close()
+        return output, stats
+
+    output, stats = asyncio.run(scenario())
+    assert output == b"os.terminal_size(columns=100, lines=30)\r\n"
+    assert (stats["pool"]["hits"], stats["pool"]["misses"]) == (1, 0)
+
+
+def test_jobs_larger_than_the_pipe_buffer():
+    code = "x = 1\n" + "y = 'a'\n" * 40000 + "print('done', x)\n"
+
+    async def scenario():
+        terminals = PtyBackend(size=0)
+        process = await terminals.acquire(code, [])
+        output = await read_all(process)
+        await terminals.release(process)
+        await terminals.close()
+        return output
+
+    assert asyncio.run(scenario()) == b"done 1\r\n"
+
+
+def test_closing_releases_idle_terminals():
+    async def scenario():
+        before = open_fds()
+        terminals = PtyBackend(size=2)
+        terminals.start()
+        while terminals.pool.stats()["idle"] < 2:
+            await asyncio.sleep(0.02)
+        process = await terminals.acquire("print(1)", [])
+        await read_all(process)
+        await terminals.release(process)
+        await terminals.close()
+        return before, open_fds()
+
+    before, after = asyncio.run(scenario())
+    assert after <= before
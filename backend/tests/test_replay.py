@@ -0,0 +1,38 @@
+from replay import ReplayBuffer, sync_marker
+
+
+def test_frames_are_numbered_and_replayed_after_a_seq():
+    buffer = ReplayBuffer(max_chars=100)
+    assert [buffer.append(text, len(text)) for text in ("a", "b", "c")] == [1, 2, 3]
+    assert buffer.since(1) == ([(2, "b"), (3, "c")], 0)
+    assert buffer.since(3) == ([], 0)
+    assert buffer.since(0) == ([(1, "a"), (2, "b"), (3, "c")], 0)
+
+
+def test_old_frames_are_dropped_and_counted_as_missed():
+    buffer = ReplayBuffer(max_chars=10)
+    for text in ("aaaa", "bbbb", "cccc", "dddd"):
+        buffer.append(text, len(text))
+    # Only the newest frames that fit in max_chars are held
+    assert buffer.since(0) == ([(3, "cccc"), (4, "dddd")], 2)
+    assert buffer.since(2) == ([(3, "cccc"), (4, "dddd")], 0)
+
+
+def test_the_newest_frame_is_kept_however_large():
+    buffer = ReplayBuffer(max_chars=10)
+    buffer.append("small", 5)
+    buffer.append("x" * 50, 50)
+    assert buffer.since(0) == ([(2, "x" * 50)], 1)
+    buffer.append("next", 4)
+    assert buffer.since(1) == ([(3, "next")], 1)
+
+
+def test_client_ahead_of_the_buffer_gets_nothing():
+    # e.g. a client resuming against a session that was restarted
+    buffer = ReplayBuffer()
+    buffer.append("a", 1)
+    assert buffer.since(5) == ([], 0)
+
+
+def test_sync_marker():
+    assert sync_marker(42) == "\x1b]777;seq=42\x07"
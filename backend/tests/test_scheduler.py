@@ -0,0 +1,121 @@
+import asyncio
+
+import pytest
+
+import scheduler as scheduler_module
+from scheduler import ExecutionScheduler, RateLimitExceeded
+
+
+def test_rate_limit_allows_a_burst_then_refills(monkeypatch):
+    now = [100.0]
+    monkeypatch.setattr(scheduler_module.time, "monotonic", lambda: now[0])
+    scheduler = ExecutionScheduler(max_concurrent=1, rate=60, burst=2)
+
+    scheduler.check_rate("a")
+    scheduler.check_rate("a")
+    with pytest.raises(RateLimitExceeded) as exceeded:
+        scheduler.check_rate("a")
+    assert exceeded.value.retry_after == pytest.approx(1.0)
+    assert scheduler.rate_limited == 1
+
+    # Other connections have their own bucket
+    scheduler.check_rate("b")
+
+    now[0] += 1.0
+    scheduler.check_rate("a")
+
+
+def test_address_limit_covers_all_its_connections(monkeypatch):
+    now = [100.0]
+    monkeypatch.setattr(scheduler_module.time, "monotonic", lambda: now[0])
+    scheduler = ExecutionScheduler(max_concurrent=1, rate=60, burst=2, address_rate=60, address_burst=3)
+
+    for connection_id in ("a", "b", "c"):
+        scheduler.check_rate(connection_id, "10.0.0.1")
+    with pytest.raises(RateLimitExceeded):
+        scheduler.check_rate("d", "10.0.0.1")
+    scheduler.check_rate("e", "10.0.0.2")
+
+    # A refused run takes no token from the address
+    scheduler = ExecutionScheduler(max_concurrent=1, rate=60, burst=1, address_rate=60, address_burst=2)
+    scheduler.check_rate("a", "10.0.0.1")
+    with pytest.raises(RateLimitExceeded):
+        scheduler.check_rate("a", "10.0.0.1")
+    scheduler.check_rate("b", "10.0.0.1")
+
+
+def test_rate_limit_disabled():
+    scheduler = ExecutionScheduler(max_concurrent=1, rate=0, burst=1, address_rate=0)
+    for _ in range(10):
+        scheduler.check_rate("a", "10.0.0.1")
+
+
+def test_runs_beyond_the_cap_wait_for_a_release():
+    async def scenario():
+        scheduler = ExecutionScheduler(max_concurrent=1, rate=0)
+        await scheduler.acquire("a")
+        waiting = asyncio.create_task(scheduler.acquire("b"))
+        await asyncio.sleep(0)
+        assert not waiting.done()
+        assert scheduler.stats()["queued"] == 1
+
+        scheduler.release()
+        await waiting
+        stats = scheduler.stats()
+        assert (stats["running"], stats["queued"], stats["admitted"]) == (1, 0, 2)
+
+    asyncio.run(scenario())
+
+
+def test_clients_take_turns():
+    async def scenario():
+        scheduler = ExecutionScheduler(max_concurrent=1, rate=0)
+        await scheduler.acquire("busy")
+        admitted = []
+
+        async def run(client, name):
+            await scheduler.acquire(client)
+            admitted.append(name)
+
+        tasks = [asyncio.create_task(run("busy", f"busy-{i}")) for i in range(3)]
+        await asyncio.sleep(0)
+        tasks.append(asyncio.create_task(run("other", "other")))
+        await asyncio.sleep(0)
+
+        for _ in tasks:
+            scheduler.release()
+            await asyncio.sleep(0)
+        await asyncio.gather(*tasks)
+        assert admitted == ["busy-0", "other", "busy-1", "busy-2"]
+
+    asyncio.run(scenario())
+
+
+def test_queue_positions_and_cancellation():
+    async def scenario():
+        scheduler = ExecutionScheduler(max_concurrent=1, rate=0)
+        await scheduler.acquire("a")
+        positions = {}
+
+        def notify(name):
+            async def send(position):
+                positions[name] = position
+            return send
+
+        first = asyncio.create_task(scheduler.acquire("b", notify("b")))
+        await asyncio.sleep(0)
+        second = asyncio.create_task(scheduler.acquire("c", notify("c")))
+        await asyncio.sleep(0.01)
+        assert positions == {"b": 1, "c": 2}
+
+        first.cancel()
+        with pytest.raises(asyncio.CancelledError):
+            await first
+        await asyncio.sleep(0.01)
+        assert positions["c"] == 1
+
+        scheduler.release()
+        await second
+        assert scheduler.stats()["running"] == 1
+
+    asyncio.run(scenario())
@@ -0,0 +1,30 @@
+from static_assets import IMMUTABLE_CACHE, REVALIDATE_CACHE, StaticAssets
+
+
+def test_serves_files_loaded_at_startup(tmp_path):
+    (tmp_path / "index.html").write_text("<html></html>")
+    (tmp_path / "static" / "js").mkdir(parents=True)
+    (tmp_path / "static" / "js" / "main.b944ac86.js").write_text("console.log(1);" * 100)
+    (tmp_path / "logo.svg").write_text("<svg/>")
+    assets = StaticAssets(str(tmp_path))
+    assets.load()
+
+    script = assets.get("js/main.b944ac86.js")
+    assert script is assets.get("static/js/main.b944ac86.js")
+    assert script.cache_control == IMMUTABLE_CACHE
+    assert "gzip" in script.variants
+    assert assets.get("logo.svg").cache_control == REVALIDATE_CACHE
+    assert assets.index is not None
+
+
+def test_unknown_paths_never_reach_the_disk(tmp_path):
+    (tmp_path / "app.js").write_text("1")
+    (tmp_path.parent / "secret.txt").write_text("secret")
+    assets = StaticAssets(str(tmp_path))
+    assets.load()
+
+    (tmp_path / "late.js").write_text("2")
+    assert assets.get("late.js") is None
+    assert assets.get("../secret.txt") is None
+    assert assets.get("missing.js") is None
+    assert assets.get("app.js") is not None
@@ -0,0 +1,20 @@
+from logging_setup import session_tag
+from tracing import RunTracer
+
+
+def test_traces_do_not_contain_the_connection_id():
+    tracer = RunTracer(sample_rate=1.0, keep=2)
+    trace = tracer.start("secret-connection-id")
+    trace.mark("requested", code_bytes=10)
+    tracer.finish(trace)
+
+    record, = tracer.recent()
+    assert "secret-connection-id" not in repr(record)
+    assert record["session"] == session_tag("secret-connection-id")
+    assert [event["event"] for event in record["events"]] == ["requested"]
+
+
+def test_session_tags_depend_on_the_key():
+    assert session_tag("abc", b"one") == session_tag("abc", b"one")
+    assert session_tag("abc", b"one") != session_tag("abc", b"two")
+    assert session_tag("abc", b"one") != session_tag("abd", b"one")
@@ -0,0 +1,147 @@
+import os
+
+import pytest
+
+from workspace import Workspace, WorkspaceError, normalize_path
+
+
+@pytest.fixture
+def workspace(tmp_path):
+    workspace = Workspace(root=str(tmp_path), max_files=5, max_bytes=100)
+    yield workspace
+    workspace.remove()
+
+
+def read(workspace, path):
+    with open(os.path.join(workspace.path, *path.split("/")), encoding="utf-8") as f:
+        return f.read()
+
+
+def listing(workspace):
+    found = set()
+    for local_dir, _, file_names in os.walk(workspace.path):
+        for name in file_names:
+            found.add(os.path.relpath(os.path.join(local_dir, name), workspace.path).replace(os.sep, "/"))
+    return found
+
+
+@pytest.mark.parametrize("path, expected", [
+    ("main.py", "main.py"),
+    ("./pkg//mod.py", "pkg/mod.py"),
+    ("pkg/./data/", "pkg/data"),
+])
+def test_normalize_path(path, expected):
+    assert normalize_path(path) == expected
+
+
+@pytest.mark.parametrize("path", ["", "/etc/passwd", "../x.py", "a/../../x", "a\\b.py", "a\0b", ".", None, 3])
+def test_normalize_path_rejects(path):
+    with pytest.raises(WorkspaceError):
+        normalize_path(path)
+
+
+def test_full_apply_writes_files_and_drops_missing_ones(workspace):
+    assert workspace.apply({"main.py": "print(1)", "pkg/mod.py": "x = 1"}) == 13
+    assert listing(workspace) == {"main.py", "pkg/mod.py"}
+    first = workspace.version
+
+    # A full project replaces the previous one
+    assert workspace.apply({"main.py": "print(1)"}) == 0
+    assert listing(workspace) == {"main.py"}
+    assert not os.path.exists(os.path.join(workspace.path, "pkg"))
+    assert workspace.version != first
+
+
+def test_changes_apply_only_to_the_current_version(workspace):
+    workspace.apply({"main.py": "print(1)", "a.py": "a = 1"})
+    version = workspace.version
+    assert workspace.apply({"main.py": "print(2)"}, ["a.py"], base=version) == 8
+    assert dict(workspace.files()) == {"main.py": "print(2)"}
+    assert read(workspace, "main.py") == "print(2)"
+
+    # Changes against an older version are refused and leave the files alone
+    assert workspace.apply({"main.py": "print(3)"}, base=version) is None
+    assert read(workspace, "main.py") == "print(2)"
+
+
+@pytest.mark.parametrize("deleted", [None, "ab", [1], {"a.py": True}])
+def test_deleted_must_be_a_list_of_names(workspace, deleted):
+    workspace.apply({"a.py": "", "b.py": ""})
+    with pytest.raises(WorkspaceError):
+        workspace.apply({}, deleted, base=workspace.version)
+    assert set(workspace.files()) == {"a.py", "b.py"}
+
+
+@pytest.mark.parametrize("files", [
+    None,
+    ["main.py"],
+    {"main.py": b"print(1)"},
+    {f"m{i}.py": "" for i in range(6)},
+    {"main.py": "x" * 101},
+    {"pkg": "", "pkg/mod.py": ""},
+])
+def test_invalid_projects_are_rejected(workspace, files):
+    with pytest.raises(WorkspaceError):
+        workspace.apply(files)
+    assert listing(workspace) == set()
+
+
+def test_select_entry(workspace):
+    workspace.apply({"pkg/main.py": "print(1)"})
+    assert workspace.select_entry("./pkg/main.py") == "print(1)"
+    assert workspace.entry == "pkg/main.py"
+    with pytest.raises(WorkspaceError):
+        workspace.select_entry("other.py")
+
+
+def test_files_a_program_changed_are_restored(workspace):
+    workspace.apply({"main.py": "print(1)", "data.txt": "abc"})
+    with open(os.path.join(workspace.path, "data.txt"), "w") as f:
+        f.write("changed by the program")
+    os.unlink(os.path.join(workspace.path, "main.py"))
+
+    workspace.apply({}, base=workspace.version)
+    assert read(workspace, "data.txt") == "abc"
+    assert read(workspace, "main.py") == "print(1)"
+
+
+def test_clean_removes_what_a_program_left(workspace, tmp_path):
+    workspace.apply({"main.py": "print(1)", "pkg/mod.py": "x = 1"})
+    outside = tmp_path / "outside.txt"
+    outside.write_text("keep")
+    os.makedirs(os.path.join(workspace.path, "out", "deep"))
+    with open(os.path.join(workspace.path, "out", "deep", "result.txt"), "w") as f:
+        f.write("x" * 1000)
+    with open(os.path.join(workspace.path, "pkg", "cache.bin"), "w") as f:
+        f.write("x")
+    os.unlink(os.path.join(workspace.path, "pkg", "mod.py"))
+    os.symlink(str(outside), os.path.join(workspace.path, "pkg", "mod.py"))
+
+    assert workspace.clean() == 3
+    assert listing(workspace) == {"main.py"}
+
+    # Restoring the linked file writes into the workspace, not through the link
+    workspace.apply({}, base=workspace.version)
+    assert read(workspace, "pkg/mod.py") == "x = 1"
+    assert not os.path.islink(os.path.join(workspace.path, "pkg", "mod.py"))
+    assert outside.read_text() == "keep"
+
+
+def test_unmaterialized_workspace_writes_nothing(tmp_path):
+    workspace = Workspace(root=str(tmp_path), materialize=False)
+    assert workspace.apply({"main.py": "print(1)", "pkg/mod.py": "x = 1"}) == 0
+    assert workspace.path is None
+    assert workspace.clean() == 0
+    assert os.listdir(tmp_path) == []
+
+    workspace.materialize()
+    assert listing(workspace) == {"main.py", "pkg/mod.py"}
+    workspace.remove()
+    assert os.listdir(tmp_path) == []
+
+
+def test_pack(workspace):
+    workspace.apply({"b.py": "é", "a.py": "a = 1"})
+    names, data = workspace.pack()
+    assert names == [("a.py", 5), ("b.py", 2)]
+    assert data == "a = 1é".encode("utf-8")
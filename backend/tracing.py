@@ -0,0 +1,57 @@
+import json
+import logging
+import os
+import random
+import time
+from collections import deque
+from typing import Deque, Dict, List, Optional
+
+from logging_setup import session_tag
+
+logger = logging.getLogger(__name__)
+
+# Fraction of runs that record a trace; 0 disables tracing
+RUN_TRACE_SAMPLE_RATE = float(os.getenv("RUN_TRACE_SAMPLE_RATE", 0))
+RUN_TRACE_KEEP = int(os.getenv("RUN_TRACE_KEEP", 100))
+
+
+class RunTrace:
+    """Timestamps of the stages one run went through, relative to its start."""
+
+    def __init__(self, connection_id: str):
+        # Traces are readable by operators, who must not be able to resume the session
+        self.session = session_tag(connection_id)
+        self.started_at = time.time()
+        self._start = time.monotonic()
+        self.events: List[Dict] = []
+
+    def mark(self, name: str, **attributes):
+        event = {"event": name, "at": round(time.monotonic() - self._start, 6)}
+        event.update(attributes)
+        self.events.append(event)
+
+    def to_dict(self) -> Dict:
+        return {"session": self.session, "started_at": self.started_at, "events": self.events}
+
+
+class RunTracer:
+    """Samples runs for tracing and keeps the most recent finished traces."""
+
+    def __init__(self, sample_rate: float = RUN_TRACE_SAMPLE_RATE, keep: int = RUN_TRACE_KEEP):
+        self.sample_rate = sample_rate
+        self._finished: Deque[Dict] = deque(maxlen=keep)
+
+    def start(self, connection_id: str) -> Optional[RunTrace]:
+        if self.sample_rate <= 0 or random.random() >= self.sample_rate:
+            return None
+        return RunTrace(connection_id)
+
+    def finish(self, trace: Optional[RunTrace]):
+        if trace is None:
+            return
+        record = trace.to_dict()
+        self._finished.append(record)
+        logger.info(f"Run trace: {json.dumps(record)}")
+
+    def recent(self) -> List[Dict]:
+        return list(self._finished)
@@ -0,0 +1,282 @@
+import logging
+import os
+import posixpath
+import shutil
+import stat
+import tempfile
+import threading
+import uuid
+from types import MappingProxyType
+from typing import Dict, Iterable, List, Mapping, Optional, Tuple
+
+logger = logging.getLogger(__name__)
+
+
+# Docker gives containers a 64 MB /dev/shm, which every session's files
+# and whatever their programs write would have to share
+WORKSPACE_SHM_MIN_BYTES = 512 * 1024 * 1024
+
+
+def _default_root() -> str:
+    # /dev/shm is a tmpfs on Linux, so project files never reach the disk
+    if os.path.isdir("/dev/shm") and os.access("/dev/shm", os.W_OK):
+        info = os.statvfs("/dev/shm")
+        if info.f_blocks * info.f_frsize >= WORKSPACE_SHM_MIN_BYTES:
+            return "/dev/shm"
+    return tempfile.gettempdir()
+
+
+# Directory the per-session project workspaces are created in
+WORKSPACE_ROOT = os.getenv("WORKSPACE_ROOT") or _default_root()
+WORKSPACE_MAX_FILES = int(os.getenv("WORKSPACE_MAX_FILES", 200))
+# Each session's files take this much of WORKSPACE_ROOT at most, which is
+# memory on a tmpfs; files programs write there are capped by RUN_MAX_FILE_MB
+# each and only last until the run ends
+WORKSPACE_MAX_BYTES = int(os.getenv("WORKSPACE_MAX_BYTES", 4 * 1024 * 1024))
+
+# Version 1 clients learn the workspace version from this OSC sequence, which
+# terminals ignore; an empty version asks the client to send every file again
+WORKSPACE_MARKER_PREFIX = "\x1b]777;workspace="
+WORKSPACE_MARKER_SUFFIX = "\x07"
+
+
+def workspace_marker(version: str) -> str:
+    return f"{WORKSPACE_MARKER_PREFIX}{version}{WORKSPACE_MARKER_SUFFIX}"
+
+
+class WorkspaceError(Exception):
+    pass
+
+
+def normalize_path(path: str) -> str:
+    """Checks a project-relative path from the client and returns it normalised."""
+    if not isinstance(path, str) or not path or "\\" in path or "\0" in path:
+        raise WorkspaceError(f"Invalid file name: {path!r}")
+    parts = [part for part in path.split("/") if part not in ("", ".")]
+    if path.startswith("/") or not parts or ".." in parts:
+        raise WorkspaceError(f"Invalid file name: {path!r}")
+    return "/".join(parts)
+
+
+class Workspace:
+    """A session's project files, mirrored into a directory its runs start in.
+
+    The client sends the whole project once and afterwards only the files
+    that changed since a version the server acknowledged, so a run writes
+    just those files. Before each run, files a program changed or removed
+    are put back, since the client never learns about such edits, and
+    anything else it left is removed. With ``materialize`` off the files
+    are only kept in memory until ``materialize`` is called, for backends
+    that are sent them with each job.
+
+    Methods touching the directory block, so callers run them in a thread.
+    """
+
+    def __init__(self, root: str = WORKSPACE_ROOT, max_files: int = WORKSPACE_MAX_FILES,
+                 max_bytes: int = WORKSPACE_MAX_BYTES, materialize: bool = True):
+        self.root = root
+        self.path: Optional[str] = None
+        self.max_files = max_files
+        self.max_bytes = max_bytes
+        self.id = uuid.uuid4().hex[:12]
+        self.revision = 0
+        self.entry: Optional[str] = None
+        self._files: Dict[str, str] = {}
+        self._sizes: Dict[str, int] = {}
+        self._stats: Dict[str, Tuple[int, int]] = {}
+        # Cleaning after a run may overlap with the next update in another thread
+        self._lock = threading.RLock()
+        if materialize:
+            self.materialize()
+
+    @property
+    def version(self) -> str:
+        return f"{self.id}.{self.revision}"
+
+    @property
+    def size(self) -> int:
+        return sum(self._sizes.values())
+
+    def files(self) -> Mapping[str, str]:
+        return MappingProxyType(self._files)
+
+    def materialize(self):
+        """Gives the workspace a directory holding its files, if it has none yet."""
+        with self._lock:
+            if self.path:
+                return
+            self.path = tempfile.mkdtemp(prefix="project-", dir=self.root)
+            for path, content in self._files.items():
+                self._write_file(path, content)
+
+    def apply(self, files: Mapping[str, str], deleted: Iterable[str] = (), base: Optional[str] = None) -> Optional[int]:
+        """Updates the workspace and returns the number of bytes written.
+
+        Without ``base`` the files are the whole project. With it they are
+        the changes since that version; None is returned, and nothing
+        changed, when it is not the current one.
+        """
+        with self._lock:
+            return self._apply(files, deleted, base)
+
+    def _apply(self, files: Mapping[str, str], deleted: Iterable[str], base: Optional[str]) -> Optional[int]:
+        if base is not None and base != self.version:
+            return None
+        if not isinstance(files, Mapping) or not all(isinstance(content, str) for content in files.values()):
+            raise WorkspaceError("Project files must map names to text")
+        if not isinstance(deleted, (list, tuple)) or not all(isinstance(path, str) for path in deleted):
+            raise WorkspaceError("Deleted files must be a list of names")
+        updated = {normalize_path(path): content for path, content in files.items()}
+        removed = {normalize_path(path) for path in deleted} - set(updated)
+        if base is None:
+            removed = set(self._files) - set(updated)
+
+        sizes = {path: len(content.encode("utf-8", errors="surrogatepass")) for path, content in updated.items()}
+        remaining = set(self._files) - removed - set(updated)
+        if len(remaining) + len(updated) > self.max_files:
+            raise WorkspaceError(f"Projects are limited to {self.max_files} files")
+        if sum(self._sizes[path] for path in remaining) + sum(sizes.values()) > self.max_bytes:
+            raise WorkspaceError(f"Projects are limited to {self.max_bytes} bytes")
+        self._check_layout(remaining | set(updated))
+
+        # First, so no removal or write follows a link a program left behind
+        self._clean()
+        for path in removed:
+            self._remove_file(path)
+        written = 0
+        for path, content in updated.items():
+            if self.path and (self._files.get(path) != content or self._changed_on_disk(path)):
+                self._write_file(path, content)
+                written += sizes[path]
+            self._files[path] = content
+            self._sizes[path] = sizes[path]
+        for path in remaining:
+            if self.path and self._changed_on_disk(path):
+                self._write_file(path, self._files[path])
+                written += self._sizes[path]
+        self.revision += 1
+        return written
+
+    def clean(self) -> int:
+        """Removes what a program left in the workspace besides the project files.
+
+        Links are removed too, even where a project file or folder belongs,
+        so restoring a file never writes outside the workspace. Returns the
+        number of entries removed.
+        """
+        with self._lock:
+            return self._clean()
+
+    def _clean(self) -> int:
+        if not self.path:
+            return 0
+        folders = {posixpath.dirname(path) for path in self._files}
+        for folder in list(folders):
+            while folder:
+                folders.add(folder)
+                folder = posixpath.dirname(folder)
+        removed = 0
+        for local_dir, dir_names, file_names in os.walk(self.path):
+            relative = os.path.relpath(local_dir, self.path).replace(os.sep, "/")
+            prefix = "" if relative == "." else relative + "/"
+            for name in list(dir_names):
+                local_path = os.path.join(local_dir, name)
+                if prefix + name in folders and not os.path.islink(local_path):
+                    continue
+                dir_names.remove(name)
+                removed += 1
+                if os.path.islink(local_path):
+                    self._unlink(local_path)
+                else:
+                    shutil.rmtree(local_path, ignore_errors=True)
+            for name in file_names:
+                local_path = os.path.join(local_dir, name)
+                if prefix + name not in self._files or os.path.islink(local_path):
+                    self._unlink(local_path)
+                    removed += 1
+        return removed
+
+    def select_entry(self, entry: str) -> str:
+        """Makes ``entry`` the file runs start from and returns its source."""
+        entry = normalize_path(entry)
+        if entry not in self._files:
+            raise WorkspaceError(f"Entry point {entry} is not a project file")
+        self.entry = entry
+        return self._files[entry]
+
+    def pack(self) -> Tuple[List[Tuple[str, int]], bytes]:
+        """The files as ``(name, size)`` pairs and their concatenated contents."""
+        names = sorted(self._files)
+        contents = [self._files[name].encode("utf-8", errors="surrogatepass") for name in names]
+        return [(name, len(data)) for name, data in zip(names, contents)], b"".join(contents)
+
+    def remove(self):
+        with self._lock:
+            if self.path:
+                shutil.rmtree(self.path, ignore_errors=True)
+            self._files.clear()
+            self._sizes.clear()
+            self._stats.clear()
+
+    def _check_layout(self, paths: Iterable[str]):
+        # A name cannot be both a file and a folder
+        paths = set(paths)
+        for path in paths:
+            parent = posixpath.dirname(path)
+            while parent:
+                if parent in paths:
+                    raise WorkspaceError(f"{parent} is both a file and a folder")
+                parent = posixpath.dirname(parent)
+
+    def _local_path(self, path: str) -> str:
+        return os.path.join(self.path, *path.split("/"))
+
+    def _changed_on_disk(self, path: str) -> bool:
+        try:
+            info = os.lstat(self._local_path(path))
+        except OSError:
+            return True
+        return not stat.S_ISREG(info.st_mode) or self._stats.get(path) != (info.st_size, info.st_mtime_ns)
+
+    @staticmethod
+    def _unlink(local_path: str):
+        try:
+            os.unlink(local_path)
+        except OSError:
+            pass
+
+    def _write_file(self, path: str, content: str):
+        local_path = self._local_path(path)
+        try:
+            if os.path.islink(local_path):
+                os.unlink(local_path)
+            elif os.path.isdir(local_path):
+                # A program made a folder where a project file belongs
+                shutil.rmtree(local_path)
+            os.makedirs(os.path.dirname(local_path), exist_ok=True)
+            with open(local_path, "w", encoding="utf-8", errors="surrogatepass", newline="") as f:
+                f.write(content)
+            info = os.stat(local_path)
+        except OSError as e:
+            raise WorkspaceError(f"Could not write {path}: {e.strerror}")
+        self._stats[path] = (info.st_size, info.st_mtime_ns)
+
+    def _remove_file(self, path: str):
+        self._files.pop(path, None)
+        self._sizes.pop(path, None)
+        self._stats.pop(path, None)
+        if not self.path:
+            return
+        local_path = self._local_path(path)
+        try:
+            os.unlink(local_path)
+        except OSError:
+            pass
+        # Drop folders the removal left empty
+        parent = os.path.dirname(local_path)
+        while parent != self.path:
+            try:
+                os.rmdir(parent)
+            except OSError:
+                break
+            parent = os.path.dirname(parent)
@@ -388,6 +388,12 @@ function App() {
   const resizeObserverRef = useRef(null);
   const inputBufferRef = useRef('');
   const isProgramRunning = useRef(false);
+  // Output frames received so far, used to resume the session after a reconnect
+  const lastSeqRef = useRef(0);
+  const resumeRef = useRef(false);
+  // Project files the server acknowledged, so later runs only send changes
+  const syncedProjectRef = useRef(null);
+  const pendingProjectRef = useRef(null);
   const editorContainerRef = useRef(null);
   const fitAddonRef = useRef(null);
   const [fileTree, setFileTree] = useState([
@@ -776,6 +782,49 @@ function App() {
     }
   };
 
+  const collectProject = () => {
+    const files = {};
+    const addFiles = (items, prefix) => {
+      for (const item of items) {
+        const path = prefix ? `${prefix}/${item.name}` : item.name;
+        if (item.type === 'folder') {
+          addFiles(item.children || [], path);
+        } else {
+          // The open file may have unsaved edits
+          files[path] = currentFile && item.id === currentFile.id ? code : (item.content || '');
+        }
+      }
+    };
+    // Paths are relative to the Project folder
+    addFiles(fileTree[0].children || [], '');
+    // Run the open file, or main.py when none is open
+    const entryPath = currentFile && getItemPath(currentFile.id);
+    const entry = entryPath ? entryPath.slice(1).join('/') : 'main.py';
+    return { files, entry };
+  };
+
+  const projectMessage = (project) => {
+    const message = {
+      type: "project",
+      entry: project.entry,
+      files: project.files,
+      args: commandLineArgs,
+      pty: true
+    };
+    const synced = syncedProjectRef.current;
+    if (synced) {
+      message.base = synced.version;
+      message.files = {};
+      for (const [path, content] of Object.entries(project.files)) {
+        if (synced.files[path] !== content) {
+          message.files[path] = content;
+        }
+      }
+      message.deleted = Object.keys(synced.files).filter(path => !(path in project.files));
+    }
+    return message;
+  };
+
   const handleRun = async () => {
     if (!wsRef.current || wsRef.current.readyState !== WebSocket.OPEN) {
       setError("Not connected to server");
@@ -796,13 +845,9 @@ function App() {
         terminalInstanceRef.current.write('\r\n');
       }
 
-      const message = {
-        type: "execute",
-        code: code,
-        args: commandLineArgs
-      };
-      
-      wsRef.current.send(JSON.stringify(message));
+      const project = collectProject();
+      pendingProjectRef.current = project;
+      wsRef.current.send(JSON.stringify(projectMessage(project)));
     } catch (err) {
       setError(`Error running code: ${err.message}`);
       setProgramState('error');
@@ -889,6 +934,7 @@ function App() {
 
       // Add terminal input handler
       terminal.onData(handleTerminalInput);
+      terminal.onResize(({ cols, rows }) => sendTerminalSize(cols, rows));
 
       let reconnectAttempts = 0;
       const maxReconnectAttempts = 5;
@@ -917,10 +963,13 @@ function App() {
         }
 
         try {
-          wsRef.current = new WebSocket(`${getWebSocketUrl()}?connectionId=${connectionId}`);
+          const resumeParam = resumeRef.current ? `&lastSeq=${lastSeqRef.current}` : '';
+          wsRef.current = new WebSocket(`${getWebSocketUrl()}?connectionId=${connectionId}${resumeParam}`);
           
           wsRef.current.onopen = () => {
             console.log('Connected to server');
+            resumeRef.current = true;
+            sendTerminalSize(terminal.cols, terminal.rows);
             isProgramRunning.current = false;
           inputBufferRef.current = '';
             reconnectAttempts = 0; // Reset reconnect attempts on successful connection
@@ -929,6 +978,28 @@ function App() {
     wsRef.current.onmessage = (event) => {
       try {
         const data = event.data;
+
+              // The server resynchronises the frame count after replaying missed output
+              const syncMatch = /^\x1b\]777;seq=(\d+)\x07$/.exec(data);
+              if (syncMatch) {
+                lastSeqRef.current = parseInt(syncMatch[1], 10);
+                return;
+              }
+              // The server acknowledges project files, or asks for all of them again
+              const workspaceMatch = /^\x1b\]777;workspace=([^\x07]*)\x07$/.exec(data);
+              if (workspaceMatch) {
+                const project = pendingProjectRef.current;
+                if (workspaceMatch[1]) {
+                  syncedProjectRef.current = project && { version: workspaceMatch[1], files: project.files };
+                } else {
+                  syncedProjectRef.current = null;
+                  if (project) {
+                    wsRef.current.send(JSON.stringify(projectMessage(project)));
+                  }
+                }
+                return;
+              }
+              lastSeqRef.current += 1;
               
               if (!terminalInstanceRef.current) {
                 console.error('Terminal instance not found');
@@ -1131,6 +1202,12 @@ function App() {
     ));
   };
 
+  const sendTerminalSize = (cols, rows) => {
+    if (wsRef.current && wsRef.current.readyState === WebSocket.OPEN) {
+      wsRef.current.send(JSON.stringify({ type: "resize", cols, rows }));
+    }
+  };
+
   const handleTerminalInput = (data) => {
     if (wsRef.current && wsRef.current.readyState === WebSocket.OPEN) {
       const message = {